@@ -0,0 +1,29 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # the partial indexes are built concurrently to avoid locking the live tables
+    atomic = False
+
+    dependencies = [
+        ('appointments', '0021_alter_appointmentsurveyresponse_survey_response'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='availabilitytimeslot',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['therapist', 'start_at'], name='timeslot_therapist_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['patient', 'start_at'], name='appt_patient_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='appointment',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['timeslot'], name='appt_timeslot_live_idx'),
+        ),
+    ]
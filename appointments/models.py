@@ -2,6 +2,7 @@ from django.db import models
 from pydantic import validator
 from appointments.constants.enums import APPOINTMENT_STATUS_CHOICES, CANCELLED_APPOINTMENT_STATUSES, REFERRAL_STATUS_CHOICES, THERAPIST_ASSIGNMENT_STATUS_CHOICES
 from django.core.validators import MinValueValidator, MaxValueValidator
+from core.db.indexes import live_index
 from core.models import Therapist, TimeStampedModel
 from surveys.enums import CANCELLED
 from surveys.models import TherapistSurvey, TherapistSurveyResponse
@@ -32,6 +33,11 @@ class AvailabilityTimeSlot(TimeStampedModel):
 
     def __str__(self):
         return f'Availability timeslot {self.pk} for therapist {self.therapist.id}'
+
+    class Meta:
+        indexes = [
+            live_index(['therapist', 'start_at'], name='timeslot_therapist_live_idx'),
+        ]
     
 
 
@@ -47,6 +53,8 @@ class Appointment(TimeStampedModel):
     start_at = models.DateTimeField(null= True, blank=True)
     end_at = models.DateTimeField(null= True, blank=True)
 
+    SOFT_DELETE_CASCADE = ('survey_response', 'therapist_assignments')
+
     def save(self, *args, **kwargs) -> None:
 
         if self.status in CANCELLED_APPOINTMENT_STATUSES and hasattr(self, 'survey_response'):
@@ -56,6 +64,12 @@ class Appointment(TimeStampedModel):
                 self.survey_response.save()
 
         return super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            live_index(['patient', 'start_at'], name='appt_patient_live_idx'),
+            live_index(['timeslot'], name='appt_timeslot_live_idx'),
+        ]
     
 class AppointmentSurveyResponse(TimeStampedModel):
     """
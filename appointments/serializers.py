@@ -5,6 +5,7 @@ from appointments.constants.enums import ACCEPTED, CONFIRMED, INACTIVE, PENDING,
 from appointments.models import Appointment, AppointmentSurveyResponse, PatientReferralRequest
 from authentication.models import User
 from authentication.serializers import UserReadSerializer
+from authentication.services.principal import PrincipalService
 from core.http import ValidationError
 from core.serializers import HttpErrorSerializer, HttpSuccessResponseSerializer
 from rest_framework import serializers
@@ -877,10 +878,11 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
 			raise ValidationError( _('APPOINTMENT TIME MUST BE WITHIN THE AVAILABILITY TIMESLOT'))
 		
 		# 2. validate that the owner of the timeslot is the user himself if the request was made by a therapist
-		if hasattr(self.context['request'].user, 'therapist_profile') and timeslot.therapist != self.context['request'].user.therapist_profile:
+		principal = PrincipalService.for_request(self.context['request'])
+		if principal.is_therapist and timeslot.therapist_id != principal.therapist_id:
 			raise ValidationError( _('YOU CANNOT USE ANOTHER THERAPIST\'S TIMESLOT'))
 		
-		if hasattr(self.context['request'].user, 'patient_profile') and self.context['request'].user != attrs['patient']:
+		if principal.is_patient and self.context['request'].user != attrs['patient']:
 			raise ValidationError( _('YOU CANNOT CREATE AN APPOINTMENT FOR ANOTHER PATIENT'))
 
 		# 3. validate that the appointment does not conflict with other confirmed appointments if the therapist is the one creating the appointment
@@ -906,11 +908,12 @@ class AppointmentCreateSerializer(serializers.ModelSerializer):
 	def create(self, validated_data):
 
 		# NOTE: not ideal in case of more roles, polymporhism is a better long-term solution
-		if hasattr(self.context['request'].user, 'therapist_profile') :
+		principal = PrincipalService.for_request(self.context['request'])
+		if principal.is_therapist:
 			validated_data['status'] = PENDING_PATIENT
 		 	## forcing therapist to only create appointments for himself
 
-		elif hasattr(self.context['request'].user, 'patient_profile') :
+		elif principal.is_patient:
 			validated_data['status'] = PENDING_THERAPIST
 			validated_data['patient'] = self.context['request'].user ## forcing patient to only create appointments for himself    
 			
@@ -6,6 +6,7 @@ from appointments.constants.enums import ACTIVE, CANCELLED_BY_PATIENT, CANCELLED
 from appointments.models import Appointment, AppointmentSurveyResponse, AvailabilityTimeSlotGroup, PatientReferralRequest, TherapistAssignment
 from dateutil import rrule
 from core.mock import PatientMock, TherapistMock
+from core.utils.query_stats import assert_query_budget
 from core.utils.testing import auth_request
 from surveys.models import TherapistSurveyResponse
 from .mock import AppointmentMocker, AvailabilityTimeslotMocker, ReferralMocker
@@ -1700,4 +1701,33 @@ class TestAvailabilityTimeslot(TestCase):
 		response = self.destroy(request, pk=timeslot.id)
 
 		self.assertEqual(response.status_code, 403)
-	
\ No newline at end of file
+	
+
+@tag('query-budgets-appointments')
+class AppointmentsQueryBudgetTests(TestCase):
+
+	@tag('query-budget-timeslots')
+	def test_timeslots_list_budget(self):
+
+		therapist = TherapistMock.mock_instances(n=1)[0]
+		AppointmentMocker.mock_instances(n=10, fixed_therapist=therapist)
+		request = auth_request(APIRequestFactory().get, 'timeslots/', user=therapist.user)
+
+		with assert_query_budget(self, 'AvailabilityTimeslotViewset.list'):
+			response = AvailabilityTimeslotViewset.as_view({'get': 'list'})(request)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.data['results']), 10)
+
+	@tag('query-budget-referrals')
+	def test_referrals_list_budget(self):
+
+		therapist = TherapistMock.mock_instances(n=1)[0]
+		ReferralMocker.mock_referral_requests(AppointmentMocker.mock_instances(n=10, fixed_therapist=therapist))
+		request = auth_request(APIRequestFactory().get, 'referrals/', user=therapist.user)
+
+		with assert_query_budget(self, 'ReferralViewset.list'):
+			response = ReferralViewset.as_view({'get': 'list'})(request)
+
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(len(response.data['results']), 10)
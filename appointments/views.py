@@ -13,13 +13,15 @@ from core.enums import QuerysetBranching, UserRole
 from core.http import Response, ValidationError
 from core.mixins import QuerysetMapperMixin, SerializerMapperMixin
 from authentication.permissions import IsPatient, IsTherapist
+from authentication.services.principal import PrincipalService
 from core.types import DatetimeInterval, WeeklyTimeSchedule
 from core.utils.time import TimeUtil
+from core.db.counting import ESTIMATED_COUNT
 from core.viewssets import AugmentedViewSet
 import rest_framework.status as status
 from drf_yasg.utils import swagger_auto_schema
 from core.querysets import  OwnedQS, PatientOwnedQS, QSWrapper, TherapistOwnedQS
-from core.renderer import FormattedJSONRenderrer
+from core.renderer import FastJSONRenderer, FormattedJSONRenderrer
 from core.serializers import HttpCounterSerializer, HttpErrorResponseSerializer, HttpSuccessResponseSerializer
 from rest_framework.response import Response
 from django.utils.translation import gettext as _
@@ -32,6 +34,7 @@ from drf_yasg import openapi
 class AppointmentsViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin, CreateModelMixin, UpdateModelMixin):
     """View for appointments functionality"""
 
+    count_strategy = ESTIMATED_COUNT
 
     ordering_fields = ['start_at', 'created_at']
     ordering = ['start_at']
@@ -200,11 +203,12 @@ class AppointmentsViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin,
             Confirm a pending appointment
         """
         instance: Appointment = self.get_object()
+        principal = PrincipalService.for_request(request)
 
-        if hasattr(request.user, 'therapist_profile') and instance.status != PENDING_THERAPIST:
+        if principal.is_therapist and instance.status != PENDING_THERAPIST:
             raise ValidationError(_('a patient confirm an appointment that is not pending therapist confirmation'))
 
-        if hasattr(request.user, 'patient_profile') and instance.status != PENDING_PATIENT:
+        if principal.is_patient and instance.status != PENDING_PATIENT:
             raise ValidationError(_('a therapist confirm an appointment that is not pending patient confirmation'))
 
         instance.status = CONFIRMED
@@ -219,9 +223,10 @@ class AppointmentsViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin,
         """
 
         instance: Appointment = self.get_object()
-        if hasattr(request.user, 'therapist_profile'):
+        principal = PrincipalService.for_request(request)
+        if principal.is_therapist:
             instance.status = CANCELLED_BY_THERAPIST
-        elif hasattr(request.user, 'patient_profile'):
+        elif principal.is_patient:
             instance.status = CANCELLED_BY_PATIENT
         else:
             raise ValidationError(_('Only patients and therapists can cancel appointments'))
@@ -253,6 +258,8 @@ class AppointmentsViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin,
 class AvailabilityTimeslotViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin, CreateModelMixin, UpdateModelMixin, DestroyModelMixin):
     """View for availability timeslot functionality"""
 
+    renderer_classes = [FastJSONRenderer]
+    count_strategy = ESTIMATED_COUNT
     ordering_fields = ['start_at']
     ordering = ['start_at']
     filterset_fields = {
@@ -285,7 +292,7 @@ class AvailabilityTimeslotViewset(AugmentedViewSet, ListModelMixin, RetrieveMode
     }
 
     queryset_by_action = {
-        'list': AvailabilityTimeSlot.objects.filter(active=True).select_related('therapist__user'),
+        'list': AvailabilityTimeSlot.objects.filter(active=True).select_related('therapist__user', 'entry_survey__created_by__user').prefetch_related('linked_appointments'),
         'retrieve': AvailabilityTimeSlot.objects.filter(active=True).prefetch_related('therapist__user', 'linked_appointments__patient__user'),
         'update': QSWrapper(AvailabilityTimeSlot.objects.filter(active=True))
                     .branch({
@@ -449,7 +456,7 @@ class ReferralViewset(ActionBasedPermMixin, SerializerMapperMixin, QuerysetMappe
     }
 
     queryset_by_action = {
-        'list': QSWrapper(PatientReferralRequest.objects.all().select_related('responding_therapist__user'))
+        'list': QSWrapper(PatientReferralRequest.objects.all().select_related('responding_therapist__user', 'referrer', 'referee', 'appointment'))
                     .branch({
                         UserRole.PATIENT.value: OwnedQS(ownership_fields= [REFERRER_FIELD])
                         },
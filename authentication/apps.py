@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self) -> None:
+        # registering the cache invalidation signal handlers
+        import authentication.signals
+        from django.db.models.signals import pre_migrate
+        from core.db.search import create_trigram_extension
+        pre_migrate.connect(create_trigram_extension, sender=self)
@@ -4,8 +4,13 @@
 
 from django.contrib.auth.backends import BaseBackend
 from django.contrib.auth import get_user_model
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
 
-from authentication.services.hash import hash_string
+from authentication.services.hash import PasswordHashService, hash_string
+from authentication.services.principal import REQUEST_PRINCIPAL_ATTR, ROLE_CLAIMS_KEY, PrincipalService
 
 
 class EmailAuthBackend(BaseBackend):
@@ -18,14 +23,12 @@ class EmailAuthBackend(BaseBackend):
         """
         
         ## blocking anyone from using a bot account to login
-        user = get_user_model().objects.filter(email=username.lower(), is_bot=False)
+        user = get_user_model().objects.filter(email=username.lower(), is_bot=False).first()
         
-        if not user:
+        if user is None:
             return None
         
-        user = user.first()
-        
-        if user.check_password(password):
+        if PasswordHashService.check(user, password):
             return user
         
         return None
@@ -35,4 +38,65 @@ class EmailAuthBackend(BaseBackend):
         Get the user through his ID
         """
         user = get_user_model().objects.get(id=user_id)
-        return user
\ No newline at end of file
+        return user
+
+
+class ClaimsUser(SimpleLazyObject):
+    """
+    User authenticated through the role claims of his token, exposing his id
+    without any query and loading the user row only when another attribute is accessed
+    """
+
+    def __init__(self, user_id):
+        self.__dict__['_user_id'] = user_id
+        super().__init__(lambda: get_user_model()._default_manager.get(pk=user_id))
+
+    @property
+    def pk(self):
+        return self._user_id
+
+    @property
+    def id(self):
+        return self._user_id
+
+    @property
+    def is_authenticated(self):
+        return True
+
+    @property
+    def is_anonymous(self):
+        return False
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication building the request principal from the role claims of the access token,
+    and falling back to the DB user lookup only when the claims are missing or stale
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if user_id is None:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        principal = PrincipalService.from_claims(user_id, validated_token.get(ROLE_CLAIMS_KEY))
+        if principal is not None:
+            user = ClaimsUser(user_id)
+        else:
+            # the user (and whether he is still active) is checked against the DB
+            user = self.get_user(validated_token)
+            principal = PrincipalService.get(user.pk)
+
+        # memoized on the wrapped request, so it is shared with every principal lookup of the request
+        setattr(request._request, REQUEST_PRINCIPAL_ATTR, principal)
+
+        return user, validated_token
@@ -2,10 +2,71 @@
 File to store all DTO types for auth app
 """
 
+from typing import FrozenSet, Optional
 from pydantic import BaseModel, Field
+from core.enums import PATIENT_PROFILE_FIELD, THERAPIST_PROFILE_FIELD
 
 
 class TokenPayload(BaseModel):
     """response format for JWT format"""
     refresh: str = Field(min_length=1)
-    access: str = Field(min_length=1)
\ No newline at end of file
+    access: str = Field(min_length=1)
+
+class Principal(BaseModel):
+    """
+        lightweight identity of the authenticated caller holding his groups and
+        role profile ids, used to authorize requests without hitting profile tables
+    """
+    user_id: Optional[int] = None
+    groups: FrozenSet[str] = frozenset()
+    therapist_id: Optional[int] = None
+    patient_id: Optional[int] = None
+
+    @property
+    def is_therapist(self) -> bool:
+        return self.therapist_id is not None
+
+    @property
+    def is_patient(self) -> bool:
+        return self.patient_id is not None
+
+    def get_profile_id(self, profile_field: str) -> Optional[int]:
+        """
+            get the id of the role profile linked to the user through the passed user model relation name
+
+            @param profile_field: the user model relation name of the role profile (e.g. patient_profile)
+        """
+
+        if profile_field == PATIENT_PROFILE_FIELD:
+            return self.patient_id
+        elif profile_field == THERAPIST_PROFILE_FIELD:
+            return self.therapist_id
+
+        raise ValueError(f'Unknown role profile field: {profile_field}')
+
+
+class PermissionSet(BaseModel):
+    """
+        compact snapshot of all the permissions granted to a user either directly or through his groups
+        (formatted as '{app_label}.{codename}')
+    """
+    user_id: Optional[int] = None
+    is_active: bool = False
+    is_superuser: bool = False
+    permissions: FrozenSet[str] = frozenset()
+
+    def has_perm(self, perm: str, ignore_super: bool = False) -> bool:
+        """
+            mirror of the Django ModelBackend permission check over the cached snapshot
+
+            @param perm: the full permission name in the format '{app_label}.{codename}'
+            @param ignore_super: whether superusers should be checked against their explicit permissions only
+        """
+
+        if not self.is_active:
+            return False
+
+        if self.is_superuser and not ignore_super:
+            return True
+
+        return perm in self.permissions
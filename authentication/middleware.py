@@ -1,27 +1,6 @@
-
-from channels.db import database_sync_to_async
-from django.contrib.auth.models import AnonymousUser
-from django.contrib.auth import get_user_model
 from channels.middleware import BaseMiddleware
-from rest_framework_simplejwt.tokens import UntypedToken
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
-from django.db import close_old_connections
-import jwt
-from channels.auth import AuthMiddlewareStack
-from jusoor_backend.settings import env, SIMPLE_JWT
-from authentication.constants.placeholders import SIMPLE_JWT_SIGNING_KEY
-import re
-
-@database_sync_to_async
-def get_user(validated_token: str):
-
-    try:
-        user = get_user_model().objects.get(id=validated_token['user_id'])
-        
-        return user
-    except get_user_model().DoesNotExist:
-        
-        return AnonymousUser()
+from channels.security.websocket import WebsocketDenier
+from authentication.services.socket_auth import SocketAuthService
 
 
 class JWTAuthMiddleware(BaseMiddleware):
@@ -31,29 +10,19 @@ class JWTAuthMiddleware(BaseMiddleware):
     def __init__(self, app):
         # storing the ASGI app instance inside the class object
         self.app = app
-    
+
     async def __call__(self, scope, receive, send):
-        # closing all old database connections to prevent using time out connections
-        close_old_connections()
-    
-
-        # get token form the WebSocket security protocol header
-        
-        token = re.split(r'\s*,\s*', (dict(scope['headers'])[b'sec-websocket-protocol']).decode('utf-8'))[1]
-        
-        dict(scope['headers']).pop(b'sec-websocket-protocol')
-        try:
-            UntypedToken(token)
-        except (InvalidToken, TokenError) as e:
-            
-            return None
-        else:
-
-            decoded_data = jwt.decode(token, env(SIMPLE_JWT_SIGNING_KEY), algorithms = [SIMPLE_JWT['ALGORITHM']]  )
-            scope['user'] = await get_user(validated_token=decoded_data)
-        return await self.app(scope, receive, send)
+
+        # the token is decoded once, and its user is shared with the other handshakes of the same token
+        user = await SocketAuthService.authenticate(scope['headers'])
+
+        # denying the handshakes without a valid access token
+        if user is None:
+            return await WebsocketDenier()(scope, receive, send)
+
+        return await self.app({**scope, 'user': user}, receive, send)
 
 
 def JWTAuthMiddlewareStack(inner):
     """ Wrapper for websocket url routing"""
-    return JWTAuthMiddleware(AuthMiddlewareStack(inner))
\ No newline at end of file
+    return JWTAuthMiddleware(inner)
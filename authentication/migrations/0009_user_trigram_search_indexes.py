@@ -0,0 +1,30 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:00
+
+import core.db.search
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    # the indexes are built concurrently to avoid locking the users table
+    atomic = False
+
+    dependencies = [
+        ('authentication', '0008_user_last_activity'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        *[
+            AddIndexConcurrently(
+                model_name='user',
+                index=django.contrib.postgres.indexes.GinIndex(
+                    django.contrib.postgres.indexes.OpClass(core.db.search.NormalizedText(field), name='gin_trgm_ops'),
+                    name=f'user_{field}_trgm_idx',
+                ),
+            )
+            for field in ['username', 'email', 'first_name', 'last_name']
+        ],
+    ]
@@ -6,7 +6,9 @@ from enum import unique
 from typing import Any
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
 
+from core.db.search import USER_SEARCH_FIELDS, NormalizedText
 from core.models import TimeStampedModel
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.validators import UnicodeUsernameValidator
@@ -39,6 +41,12 @@ class User(AbstractUser, TimeStampedModel):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    class Meta(AbstractUser.Meta):
+        # trigram indexes of the normalized columns searched by the user directory (see core.db.search)
+        indexes = [
+            GinIndex(OpClass(NormalizedText(field), name='gin_trgm_ops'), name=f'user_{field}_trgm_idx')
+            for field in USER_SEARCH_FIELDS
+        ]
 
     def __str__(self) -> str:
         return f'USERNAME: {self.username}, EMAIL: {self.email}'
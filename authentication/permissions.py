@@ -5,7 +5,7 @@
 
 
 from authentication.utils import HasLambdaPerm
-from core.models import StudentPatient, Therapist
+from authentication.services.principal import PrincipalService
 from rest_framework.permissions import IsAuthenticated
 
 
@@ -15,7 +15,7 @@ def IsTherapist():
     """
 
     def validate_role(request, view):
-        return IsAuthenticated().has_permission(request=request, view=view) and Therapist.objects.filter(user=request.user).exists()
+        return IsAuthenticated().has_permission(request=request, view=view) and PrincipalService.for_request(request).is_therapist
 
     return HasLambdaPerm(validate_role)
 
@@ -25,6 +25,6 @@ def IsPatient():
     """
 
     def validate_role(request, view):
-        return IsAuthenticated().has_permission(request=request, view=view) and  StudentPatient.objects.filter(user=request.user).exists()
+        return IsAuthenticated().has_permission(request=request, view=view) and  PrincipalService.for_request(request).is_patient
 
-    return HasLambdaPerm(validate_role)
\ No newline at end of file
+    return HasLambdaPerm(validate_role)
@@ -0,0 +1,121 @@
+"""
+File used to define the buffered tracking of the user activity, recording the "seen" events
+of the requests in the cache and flushing them periodically to the last_activity column
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+from typing import Dict, List, Optional
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+
+# cache key of the last bucket of seen events written to the DB
+FLUSHED_BUCKET_KEY = 'activity:flushed'
+# number of buckets read by a single get_many call while flushing
+FLUSH_BATCH_SIZE = 1000
+
+
+class ActivityService:
+    """
+        Service used to buffer the last activity of the users, so that the request path never writes
+        to the DB. The seen events are appended to time buckets of ACTIVITY_FLUSH_INTERVAL seconds,
+        and every user is recorded at most once per ACTIVITY_RESOLUTION seconds
+    """
+
+    @staticmethod
+    def _cache():
+        return caches[settings.FAST_CACHE_ALIAS]
+
+    @staticmethod
+    def _bucket(timestamp: float) -> int:
+        return int(timestamp // settings.ACTIVITY_FLUSH_INTERVAL)
+
+    @staticmethod
+    def _bucket_timeout() -> int:
+        return settings.ACTIVITY_FLUSH_INTERVAL * settings.ACTIVITY_BUCKET_RETENTION
+
+    @staticmethod
+    def record(user_id: int, timestamp: Optional[float] = None):
+        """
+            record that a user was seen, using cache operations only
+
+            @param user_id: the id of the seen user
+            @param timestamp: the UNIX time the user was seen at (defaults to now)
+        """
+
+        cache = ActivityService._cache()
+        timestamp = timestamp or time.time()
+
+        # the user was already recorded within the current resolution window
+        if not cache.add(f'activity:seen:{user_id}', 1, timeout=settings.ACTIVITY_RESOLUTION):
+            return
+
+        bucket = ActivityService._bucket(timestamp)
+        counter_key = f'activity:{bucket}:n'
+
+        cache.add(counter_key, 0, timeout=ActivityService._bucket_timeout())
+        slot = cache.incr(counter_key)
+        cache.set(f'activity:{bucket}:{slot}', (user_id, timestamp), timeout=ActivityService._bucket_timeout())
+
+    @staticmethod
+    def _read_bucket(bucket: int, seen: Dict[int, float]):
+        """merge the seen events of a bucket into the latest seen timestamp per user"""
+
+        cache = ActivityService._cache()
+        total = cache.get(f'activity:{bucket}:n') or 0
+
+        for start in range(1, total + 1, FLUSH_BATCH_SIZE):
+            keys = [f'activity:{bucket}:{slot}' for slot in range(start, min(start + FLUSH_BATCH_SIZE, total + 1))]
+            for user_id, timestamp in cache.get_many(keys).values():
+                seen[user_id] = max(timestamp, seen.get(user_id, timestamp))
+
+    @staticmethod
+    def flush(include_current: bool = False) -> int:
+        """
+            write the buffered seen events to the last_activity column of the users, using one bulk update
+
+            @param include_current: whether to also flush the still open bucket (e.g. before counting the active users),
+            whose events are written again once the bucket is closed
+            @return: the number of updated users
+        """
+
+        cache = ActivityService._cache()
+        current = ActivityService._bucket(time.time())
+
+        # the buckets older than the retention window have already expired from the cache
+        oldest = current - settings.ACTIVITY_BUCKET_RETENTION
+        flushed = cache.get(FLUSHED_BUCKET_KEY)
+        first = max(flushed + 1, oldest) if flushed is not None else oldest
+        last = current if include_current else current - 1
+
+        seen: Dict[int, float] = {}
+        for bucket in range(first, last + 1):
+            ActivityService._read_bucket(bucket, seen)
+
+        updated = ActivityService.write(seen)
+
+        if last >= first and not include_current:
+            cache.set(FLUSHED_BUCKET_KEY, last, timeout=None)
+
+        return updated
+
+    @staticmethod
+    def write(seen: Dict[int, float]) -> int:
+        """
+            write the latest seen timestamps of the users, never moving back a more recent last_activity
+
+            @param seen: the UNIX time each user was last seen at, keyed by the user id
+        """
+
+        if not seen:
+            return 0
+
+        User = get_user_model()
+        users: List = []
+        for user_id, timestamp in seen.items():
+            seen_at = Value(datetime.fromtimestamp(timestamp, tz=dt_timezone.utc))
+            users.append(User(pk=user_id, last_activity=Greatest(Coalesce(F('last_activity'), seen_at), seen_at)))
+
+        return User.objects.bulk_update(users, ['last_activity'], batch_size=FLUSH_BATCH_SIZE)
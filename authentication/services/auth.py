@@ -1,4 +1,5 @@
 
+from typing import Union
 from django.contrib.auth import get_user_model
 from django.db.models import Q
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -7,7 +8,8 @@ from core.models import StudentPatient
 from ..constants.types import TokenPayload
 from ..constants.placeholders import DUPLICATE_CREDENTIALS
 from authentication.services.encryption import AES256EncryptionService as AES
-from rest_framework_simplejwt.tokens import UntypedToken
+from authentication.services.blacklist import FilteredRefreshToken
+from authentication.services.principal import ROLE_CLAIMS_KEY, PrincipalService
 from django.db import transaction
 
 User = get_user_model()
@@ -25,24 +27,28 @@ class AuthService:
         return user
 
     def generate_tokens(user) -> TokenPayload:
-        """Generate a new refresh and access token for the given user"""
+        """Generate a new refresh and access token for the given user, embedding his role claims"""
         refresh_token = RefreshToken.for_user(user)
+        # copied to the access token, so requests can be authorized without loading the user
+        refresh_token[ROLE_CLAIMS_KEY] = PrincipalService.to_claims(PrincipalService.get(user.pk))
         
         return TokenPayload(
             refresh=str(refresh_token),
             access=str(refresh_token.access_token)
         )
 
-    def logout(refresh_token: str):
-        """logout a user by blacklisting the given user refresh token"""
-        refresh_token = RefreshToken(refresh_token)
+    def logout(refresh_token: Union[str, FilteredRefreshToken]):
+        """logout a user by blacklisting the given user refresh token (raw, or already validated)"""
+        if isinstance(refresh_token, str):
+            refresh_token = FilteredRefreshToken(refresh_token)
         refresh_token.blacklist()
 
-    def validate_refresh_token(refresh_token: str):
+    def validate_refresh_token(refresh_token: str) -> FilteredRefreshToken:
         """
-            Validate a refresh token by checking current outstanding tokens and blacklisted tokens
+            Validate a refresh token by checking its signature, expiry and type, and the blacklisted tokens
+            (through the in-memory blacklist filter, hitting the DB only for the possibly blacklisted tokens)
         """
-        return UntypedToken(refresh_token)
+        return FilteredRefreshToken(refresh_token)
         
 
         
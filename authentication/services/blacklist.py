@@ -0,0 +1,184 @@
+"""
+File used to define the refresh token blacklist, pre-checked against an in-memory bloom filter
+of the blacklisted token ids so that most lookups never reach the blacklist tables
+"""
+import threading
+import time
+import uuid
+from typing import Optional
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from core.utils.bloom import BloomFilter
+
+# cache key changed whenever a token is blacklisted, making the processes load the new blacklisted tokens
+BLACKLIST_VERSION_KEY = 'token_blacklist:version'
+# cache key changed whenever the blacklist is pruned, making the processes rebuild their filter
+BLACKLIST_EPOCH_KEY = 'token_blacklist:epoch'
+
+
+class TokenBlacklistService:
+    """
+        Service used to check whether refresh tokens are blacklisted. Every process keeps a bloom filter
+        of the blacklisted token ids, synchronized incrementally (by blacklisted row id, reloading the
+        last TOKEN_BLACKLIST_SYNC_OVERLAP rows) whenever the shared blacklist version changes, and at least every TOKEN_BLACKLIST_SYNC_INTERVAL seconds.
+        A token absent from the filter is not blacklisted, while a token present in it is confirmed
+        with an exact lookup, since bloom filters have false positives but no false negatives
+    """
+
+    _filter: Optional[BloomFilter] = None
+    # the shared (epoch, version) the filter was last synchronized with
+    _state: Optional[tuple] = None
+    # highest id of the blacklisted rows inserted into the filter
+    _last_id: int = 0
+    _synced_at: float = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _cache():
+        return caches[settings.FAST_CACHE_ALIAS]
+
+    @staticmethod
+    def _shared_state() -> tuple:
+        """read the shared epoch and version of the blacklist, initializing the evicted keys"""
+
+        cache = TokenBlacklistService._cache()
+        state = cache.get_many([BLACKLIST_EPOCH_KEY, BLACKLIST_VERSION_KEY])
+
+        if len(state) < 2:
+            for key in (BLACKLIST_EPOCH_KEY, BLACKLIST_VERSION_KEY):
+                cache.add(key, uuid.uuid4().hex, timeout=None)
+            state = cache.get_many([BLACKLIST_EPOCH_KEY, BLACKLIST_VERSION_KEY])
+
+        return state.get(BLACKLIST_EPOCH_KEY), state.get(BLACKLIST_VERSION_KEY)
+
+    @staticmethod
+    def sync(force: bool = False) -> BloomFilter:
+        """
+            bring the bloom filter of the process up to date with the blacklist table
+
+            @param force: whether to load the new blacklisted tokens even if the shared version did not change
+            @return: the synchronized filter
+        """
+
+        service = TokenBlacklistService
+        state = service._shared_state()
+
+        fresh = time.monotonic() - service._synced_at < settings.TOKEN_BLACKLIST_SYNC_INTERVAL
+        if service._filter is not None and state == service._state and fresh and not force:
+            return service._filter
+
+        with service._lock:
+            # the blacklist was pruned, so the filter is rebuilt without the deleted tokens
+            if service._filter is None or service._state is None or state[0] != service._state[0]:
+                service._filter = BloomFilter(settings.TOKEN_BLACKLIST_FILTER_CAPACITY, settings.TOKEN_BLACKLIST_FILTER_ERROR_RATE)
+                service._last_id = 0
+
+            # the concurrent blacklisting transactions commit out of id order, so the last rows are reloaded
+            # in case a lower id was committed after the higher ones (adding a token twice is harmless)
+            last_id = max(0, service._last_id - settings.TOKEN_BLACKLIST_SYNC_OVERLAP)
+            rows = BlacklistedToken.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'token__jti')
+            for pk, jti in rows.iterator(chunk_size=5000):
+                service._filter.add(jti)
+                service._last_id = max(service._last_id, pk)
+
+            # the state is read before the rows, so the rows committed meanwhile are loaded by the next sync
+            service._state = state
+            service._synced_at = time.monotonic()
+
+        return service._filter
+
+    @staticmethod
+    def is_blacklisted(jti: str) -> bool:
+        """
+            check whether a refresh token is blacklisted, querying the DB only for the ids found in the filter
+        """
+
+        if jti not in TokenBlacklistService.sync():
+            return False
+
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    @staticmethod
+    def blacklist(token: RefreshToken) -> BlacklistedToken:
+        """
+            blacklist a refresh token, registering it as an outstanding token first if it was not
+
+            @param token: the verified refresh token
+        """
+
+        outstanding, _ = OutstandingToken.objects.get_or_create(
+            jti=token[api_settings.JTI_CLAIM],
+            defaults={
+                'user_id': token.payload.get(api_settings.USER_ID_CLAIM),
+                'created_at': token.current_time,
+                'token': str(token),
+                'expires_at': datetime_from_epoch(token['exp']),
+            }
+        )
+        blacklisted, created = BlacklistedToken.objects.get_or_create(token=outstanding)
+
+        if created and TokenBlacklistService._filter is not None:
+            TokenBlacklistService._filter.add(outstanding.jti)
+
+        return blacklisted
+
+    @staticmethod
+    def bump_version():
+        """notify all the processes that tokens were blacklisted, once the blacklisting transaction is committed"""
+        transaction.on_commit(
+            lambda: TokenBlacklistService._cache().set(BLACKLIST_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        )
+
+    @staticmethod
+    def prune(batch_size: Optional[int] = None) -> int:
+        """
+            delete the expired outstanding tokens (and their blacklist entries) in batches,
+            keeping every delete statement short
+
+            @param batch_size: the number of outstanding tokens deleted by every statement
+            @return: the number of deleted outstanding tokens
+        """
+
+        batch_size = batch_size or settings.TOKEN_BLACKLIST_PRUNE_BATCH_SIZE
+        expired = OutstandingToken.objects.filter(expires_at__lte=timezone.now())
+        deleted = 0
+
+        while True:
+            ids = list(expired.order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+
+            # the blacklist entries of the batch are removed by the same cascading delete
+            deleted += OutstandingToken.objects.filter(pk__in=ids).delete()[1].get(OutstandingToken._meta.label, 0)
+
+        if deleted:
+            TokenBlacklistService._cache().set(BLACKLIST_EPOCH_KEY, uuid.uuid4().hex, timeout=None)
+
+        return deleted
+
+    @staticmethod
+    def clear():
+        """drop the filter of the process, rebuilt by the next check"""
+        with TokenBlacklistService._lock:
+            TokenBlacklistService._filter = None
+            TokenBlacklistService._state = None
+            TokenBlacklistService._last_id = 0
+
+
+class FilteredRefreshToken(RefreshToken):
+    """refresh token whose blacklist is checked and written through the blacklist service"""
+
+    def check_blacklist(self) -> None:
+        if TokenBlacklistService.is_blacklisted(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_('Token is blacklisted'))
+
+    def blacklist(self) -> BlacklistedToken:
+        return TokenBlacklistService.blacklist(self)
@@ -4,10 +4,15 @@ File used to define the encryption services
 from abc import ABC, abstractmethod
 
 import hashlib
+from functools import lru_cache
+from typing import List, Sequence
 from Crypto import Random
 from Crypto.Cipher import AES
 from base64 import b64encode, b64decode
-from jusoor_backend.settings import env
+from django.conf import settings
+
+# number of ciphertexts decrypted together by a single block cipher call
+DECRYPTION_BATCH_SIZE = 4096
 
 
 class EncryptionService(ABC):
@@ -51,7 +56,7 @@ class AES256EncryptionService(EncryptionService):
     def __init__(self, key: str = None) -> None:
 
         if key is None:
-            key = env('ENCRYPTION_KEY')
+            key = settings.ENCRYPTION_KEY
         
         self.block_size = AES.block_size
         # getting a 256-bit digest from the given key
@@ -80,6 +85,33 @@ class AES256EncryptionService(EncryptionService):
         plaintext = cipher.decrypt(ciphertext[self.block_size:]).decode('utf-8')
         return self._unpad(plain_text=plaintext)
 
+    def decrypt_many(self, ciphertexts: Sequence[str]) -> List[str]:
+        """
+        Decrypt a batch of ciphertexts with the already derived key, running the block cipher once per batch:
+        the CBC decryption of every block is its ECB decryption XORed with the previous ciphertext block,
+        which is the initialization vector for the first block of every ciphertext
+        """
+        plaintexts: List[str] = []
+
+        for start in range(0, len(ciphertexts), DECRYPTION_BATCH_SIZE):
+            chunks = [b64decode(ciphertext) for ciphertext in ciphertexts[start:start + DECRYPTION_BATCH_SIZE]]
+            if any(len(chunk) < 2 * self.block_size or len(chunk) % self.block_size for chunk in chunks):
+                raise ValueError('Invalid ciphertext length')
+
+            buffer = b''.join(chunks)
+            decrypted = AES.new(self.key, AES.MODE_ECB).decrypt(buffer)
+            previous = bytes(self.block_size) + buffer[:-self.block_size]
+            plain = (int.from_bytes(decrypted, 'big') ^ int.from_bytes(previous, 'big')).to_bytes(len(buffer), 'big')
+
+            offset = 0
+            for chunk in chunks:
+                # skipping the initialization vector, and removing the padding bytes
+                data = plain[offset + self.block_size:offset + len(chunk)]
+                plaintexts.append(data[:-data[-1]].decode('utf-8'))
+                offset += len(chunk)
+
+        return plaintexts
+
     def _pad(self, plain_text: str) -> str:
         """padding the plaintext to be a multiple of block_size"""
         number_of_bytes_to_pad = self.block_size - len(plain_text) % self.block_size
@@ -98,5 +130,7 @@ class AES256EncryptionService(EncryptionService):
         return plain_text[: -ord(last_character)]
 
 
-
-
+@lru_cache(maxsize=None)
+def get_encryption_service(key: str = None) -> AES256EncryptionService:
+    """get the encryption service of a key (the configured ENCRYPTION_KEY by default), deriving every key only once"""
+    return AES256EncryptionService(key)
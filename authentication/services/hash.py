@@ -1,5 +1,54 @@
 import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
 
 def hash_string(string: str) -> str:
     """Hash the given string using the SHA256 algorithm"""
-    return hashlib.sha256(string.encode()).hexdigest()
\ No newline at end of file
+    return hashlib.sha256(string.encode()).hexdigest()
+
+
+class PasswordHashService:
+    """
+        Service used to run the password hashing work (PBKDF2) in a bounded thread pool, so that
+        login storms cannot hold more CPU-bound hashes at once than the pool size, while the other
+        requests keep being served by their own threads
+
+        NOTE: the pool threads never touch the DB, only the hashing itself is submitted to them
+    """
+
+    _pool: Optional[ThreadPoolExecutor] = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get_pool() -> ThreadPoolExecutor:
+
+        if PasswordHashService._pool is None:
+            with PasswordHashService._lock:
+                if PasswordHashService._pool is None:
+                    PasswordHashService._pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix='password-hash')
+
+        return PasswordHashService._pool
+
+    @staticmethod
+    def make(password: str) -> str:
+        """hash a raw password with the preferred hasher"""
+        return PasswordHashService.get_pool().submit(make_password, password).result()
+
+    @staticmethod
+    def check(user, password: str) -> bool:
+        """
+            check a raw password against the password of a user, upgrading the stored hash
+            when it was produced by an outdated hasher (or iteration count)
+        """
+
+        outdated = []
+        valid = PasswordHashService.get_pool().submit(check_password, password, user.password, outdated.append).result()
+
+        if valid and outdated:
+            user.password = PasswordHashService.make(password)
+            user.save(update_fields=['password'])
+
+        return valid
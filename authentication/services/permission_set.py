@@ -0,0 +1,115 @@
+"""
+File used to define the versioned cache of user permission sets
+used by permission classes and permission-based queryset filters
+"""
+import uuid
+from typing import Iterable
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import caches
+from django.db.models import Q
+from authentication.constants.types import PermissionSet
+
+# cache key of the global version bumped whenever group permissions change, which discards
+# the permission sets of all users at once without scanning the group members
+PERMISSION_SET_VERSION_KEY = 'permission_set:version'
+# attribute name used to memoize the permission set on the request object
+REQUEST_PERMISSION_SET_ATTR = '_cached_permission_set'
+
+
+class PermissionSetService:
+    """
+        Service used to load the permission set of a user with a single query, and cache it
+        until his groups, his direct permissions, or the permissions of any group change
+    """
+
+    @staticmethod
+    def _cache():
+        return caches[settings.FAST_CACHE_ALIAS]
+
+    @staticmethod
+    def get_version() -> str:
+        """get the global version of the cached permission sets, replaced by a never used value once evicted"""
+
+        cache = PermissionSetService._cache()
+        version = cache.get(PERMISSION_SET_VERSION_KEY)
+
+        if version is None:
+            cache.add(PERMISSION_SET_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(PERMISSION_SET_VERSION_KEY)
+
+        return version
+
+    @staticmethod
+    def bump_version():
+        """discard the cached permission sets of all users"""
+        PermissionSetService._cache().set(PERMISSION_SET_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+    @staticmethod
+    def cache_key(user_id: int, version: str) -> str:
+        return f'permission_set:v{version}:{user_id}'
+
+    @staticmethod
+    def load(user_id: int) -> PermissionSet:
+        """
+            load the permission set of a user directly from the DB, using one query for the
+            user flags and one query for both his direct and group permissions
+        """
+
+        user_flags = get_user_model().objects.filter(pk=user_id).values('is_active', 'is_superuser').first()
+
+        if user_flags is None:
+            return PermissionSet(user_id=user_id)
+
+        permissions = Permission.objects.filter(Q(user__pk=user_id) | Q(group__user__pk=user_id))\
+            .values_list('content_type__app_label', 'codename').distinct()
+
+        return PermissionSet(
+            user_id=user_id,
+            permissions=frozenset(f'{app_label}.{codename}' for app_label, codename in permissions),
+            **user_flags
+        )
+
+    @staticmethod
+    def get(user_id: int) -> PermissionSet:
+        """
+            get the permission set of a user from the cache, or rebuild it on a cache miss
+        """
+
+        cache = PermissionSetService._cache()
+        key = PermissionSetService.cache_key(user_id, PermissionSetService.get_version())
+
+        cached = cache.get(key)
+        if cached is not None:
+            return PermissionSet(**cached)
+
+        permission_set = PermissionSetService.load(user_id)
+        cache.set(key, permission_set.model_dump())
+
+        return permission_set
+
+    @staticmethod
+    def invalidate(user_ids: Iterable[int]):
+        """drop the cached permission sets of the given users"""
+        version = PermissionSetService.get_version()
+        keys = [PermissionSetService.cache_key(user_id, version) for user_id in user_ids if user_id is not None]
+
+        if keys:
+            PermissionSetService._cache().delete_many(keys)
+
+    @staticmethod
+    def for_request(request) -> PermissionSet:
+        """
+            get the permission set of the authenticated caller of the request, resolved once
+            and memoized on the request object
+        """
+
+        permission_set = getattr(request, REQUEST_PERMISSION_SET_ATTR, None)
+
+        if permission_set is None:
+            user = request.user
+            permission_set = PermissionSetService.get(user.pk) if user.is_authenticated else PermissionSet()
+            setattr(request, REQUEST_PERMISSION_SET_ATTR, permission_set)
+
+        return permission_set
@@ -0,0 +1,163 @@
+"""
+File used to define the resolution of the authenticated caller identity (principal)
+shared by permission classes, queryset filters and views
+"""
+import uuid
+from typing import Dict, Iterable, Optional
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from authentication.constants.types import Principal
+
+# bumping the version discards all principals cached with an outdated schema
+PRINCIPAL_CACHE_VERSION = 1
+# attribute name used to memoize the principal on the request object
+REQUEST_PRINCIPAL_ATTR = '_cached_principal'
+# name of the access token claim holding the principal of the user
+ROLE_CLAIMS_KEY = 'roles'
+# bumping the version makes the role claims of all the issued tokens stale
+ROLE_CLAIMS_VERSION = 1
+
+
+class PrincipalService:
+    """
+        Service used to load the principal of a user with a single query, cache it across
+        requests, and memoize it on the request object
+    """
+
+    @staticmethod
+    def _cache():
+        return caches[settings.FAST_CACHE_ALIAS]
+
+    @staticmethod
+    def cache_key(user_id: int) -> str:
+        return f'principal:v{PRINCIPAL_CACHE_VERSION}:{user_id}'
+
+    @staticmethod
+    def load(user_id: int) -> Principal:
+        """
+            load the principal of a user directly from the DB using a single query
+            that joins the user groups and role profiles
+
+            @param user_id: the id of the user
+        """
+
+        rows = get_user_model().objects.filter(pk=user_id).values_list(
+            'therapist_profile__id', 'therapist_profile__deleted_at',
+            'patient_profile__id', 'patient_profile__deleted_at',
+            'groups__name'
+        )
+
+        principal = Principal(user_id=user_id)
+        groups = set()
+        for therapist_id, therapist_deleted_at, patient_id, patient_deleted_at, group_name in rows:
+            # soft deleted profiles do not grant their roles
+            if therapist_deleted_at is None:
+                principal.therapist_id = therapist_id
+            if patient_deleted_at is None:
+                principal.patient_id = patient_id
+            if group_name is not None:
+                groups.add(group_name)
+
+        principal.groups = frozenset(groups)
+        return principal
+
+    @staticmethod
+    def get(user_id: int) -> Principal:
+        """
+            get the principal of a user from the cross-request cache, or load it from the DB on a cache miss
+        """
+
+        cache = PrincipalService._cache()
+        key = PrincipalService.cache_key(user_id)
+
+        cached = cache.get(key)
+        if cached is not None:
+            return Principal(**cached)
+
+        principal = PrincipalService.load(user_id)
+        cache.set(key, principal.model_dump())
+
+        return principal
+
+    @staticmethod
+    def invalidate(user_ids: Iterable[int]):
+        """
+            drop the cached principals of the given users after a change in their groups or profiles,
+            which also makes the role claims of their issued tokens stale
+        """
+        user_ids = [user_id for user_id in user_ids if user_id is not None]
+        keys = [PrincipalService.cache_key(user_id) for user_id in user_ids] + [PrincipalService.claims_version_key(user_id) for user_id in user_ids]
+
+        if keys:
+            PrincipalService._cache().delete_many(keys)
+
+    @staticmethod
+    def claims_version_key(user_id: int) -> str:
+        return f'principal:claims:{user_id}'
+
+    @staticmethod
+    def get_claims_version(user_id: int) -> str:
+        """
+            get the version of the role claims issued to a user, which is replaced
+            by a never used value once the cached version is invalidated
+        """
+
+        cache = PrincipalService._cache()
+        key = PrincipalService.claims_version_key(user_id)
+        version = cache.get(key)
+
+        if version is None:
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            version = cache.get(key)
+
+        return version
+
+    @staticmethod
+    def to_claims(principal: Principal) -> Dict:
+        """format the principal of a user as the versioned role claims embedded in his tokens"""
+
+        return {
+            'v': ROLE_CLAIMS_VERSION,
+            'rv': PrincipalService.get_claims_version(principal.user_id),
+            'g': sorted(principal.groups),
+            'tid': principal.therapist_id,
+            'pid': principal.patient_id,
+        }
+
+    @staticmethod
+    def from_claims(user_id: int, claims: Optional[Dict]) -> Optional[Principal]:
+        """
+            build the principal of a user from the role claims of his token, without any DB query
+
+            @return: the principal, or None if the claims are missing or stale
+        """
+
+        if not isinstance(claims, dict) or claims.get('v') != ROLE_CLAIMS_VERSION:
+            return None
+
+        # an invalidated (or evicted) version never matches the version of the issued claims,
+        # while claims without a version would match an evicted one
+        version = claims.get('rv')
+        if version is None or version != PrincipalService._cache().get(PrincipalService.claims_version_key(user_id)):
+            return None
+
+        return Principal(user_id=user_id, groups=frozenset(claims.get('g', ())), therapist_id=claims.get('tid'), patient_id=claims.get('pid'))
+
+    @staticmethod
+    def for_request(request) -> Principal:
+        """
+            get the principal of the authenticated caller of the request, resolved
+            once and memoized on the request object for all the following call sites
+
+            @param request: the HTTP request object holding the authenticated user
+        """
+
+        principal = getattr(request, REQUEST_PRINCIPAL_ATTR, None)
+
+        if principal is None:
+            user = request.user
+            principal = PrincipalService.get(user.pk) if user.is_authenticated else Principal()
+            setattr(request, REQUEST_PRINCIPAL_ATTR, principal)
+
+        return principal
@@ -0,0 +1,148 @@
+"""
+File used to define the JWT authentication of WebSocket handshakes, decoding every token
+once and sharing the loaded users across the handshakes of the same token
+"""
+import asyncio
+import copy
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+# header carrying the access token, as the second protocol offered by the client (e.g. "Authorization, <token>")
+SUBPROTOCOL_HEADER = b'sec-websocket-protocol'
+
+
+class SocketAuthService:
+    """
+        Service used to authenticate WebSocket handshakes with a single token decode, and a
+        process-local cache of the users keyed by user id and token jti
+
+        NOTE: the user cache is kept in process memory since the handshakes of an ASGI process
+        run on a single event loop, so cache hits never leave the loop for a worker thread.
+        Every connection gets its own copy of the cached user, which it may then modify freely
+    """
+
+    # (user id, jti) -> (monotonic expiry, user), ordered from the least to the most recently used
+    _users: 'OrderedDict[Tuple, Tuple[float, object]]' = OrderedDict()
+    # user loads in progress, shared by the concurrent handshakes of the same token
+    _pending: Dict[Tuple, asyncio.Future] = {}
+
+    @staticmethod
+    def parse_token(headers: Iterable[Tuple[bytes, bytes]]) -> Optional[str]:
+        """
+            extract the access token from the subprotocols of the handshake, without building a dict of all the headers
+
+            @param headers: the raw (lowercased name, value) header pairs of the ASGI scope
+        """
+
+        for name, value in headers:
+            if name == SUBPROTOCOL_HEADER:
+                protocols = value.split(b',')
+                token = protocols[1].strip() if len(protocols) > 1 else b''
+                return token.decode('latin-1') or None
+
+        return None
+
+    @staticmethod
+    def decode(token: str) -> Optional[Dict]:
+        """
+            verify the signature, expiry and type of an access token with a single decode
+
+            @return: the token claims, or None if the token is invalid
+        """
+
+        try:
+            return AccessToken(token).payload
+        except TokenError:
+            return None
+
+    @staticmethod
+    def load_user(user_id):
+        """load the active user of the given id, or an anonymous user if there is none"""
+        return get_user_model().objects.filter(pk=user_id, is_active=True).first() or AnonymousUser()
+
+    @staticmethod
+    def _store(key: Tuple, user, claims: Dict):
+
+        users = SocketAuthService._users
+        # cached users never outlive the token they were loaded for
+        ttl = min(settings.WS_AUTH_USER_CACHE_TIMEOUT, claims.get('exp', 0) - time.time())
+        if ttl <= 0:
+            return
+
+        users[key] = (time.monotonic() + ttl, user)
+        users.move_to_end(key)
+        while len(users) > settings.WS_AUTH_USER_CACHE_SIZE:
+            users.popitem(last=False)
+
+    @staticmethod
+    async def aget_user(claims: Dict):
+        """
+            get a copy of the user of the token claims from the process cache, or load it from the DB on a cache miss
+
+            @param claims: the claims of a decoded access token
+        """
+
+        return copy.copy(await SocketAuthService._aget_cached_user(claims))
+
+    @staticmethod
+    async def _aget_cached_user(claims: Dict):
+        """get the user of the token claims shared by all the connections of the process"""
+
+        key = (claims.get(api_settings.USER_ID_CLAIM), claims.get(api_settings.JTI_CLAIM))
+        users = SocketAuthService._users
+
+        cached = users.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                users.move_to_end(key)
+                return cached[1]
+            del users[key]
+
+        pending = SocketAuthService._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        SocketAuthService._pending[key] = future
+        try:
+            user = await database_sync_to_async(SocketAuthService.load_user)(key[0])
+            SocketAuthService._store(key, user, claims)
+            future.set_result(user)
+        except Exception as e:
+            future.set_exception(e)
+            # marking the exception as retrieved, since no concurrent handshake may be waiting for it
+            future.exception()
+            raise
+        finally:
+            del SocketAuthService._pending[key]
+
+        return user
+
+    @staticmethod
+    async def authenticate(headers: Iterable[Tuple[bytes, bytes]]):
+        """
+            authenticate a WebSocket handshake from its headers
+
+            @return: the authenticated user, or None if no valid access token was offered
+        """
+
+        token = SocketAuthService.parse_token(headers)
+        claims = SocketAuthService.decode(token) if token else None
+        if claims is None:
+            return None
+
+        user = await SocketAuthService.aget_user(claims)
+        return user if user.is_authenticated else None
+
+    @staticmethod
+    def clear():
+        """drop all the cached users of the process"""
+        SocketAuthService._users.clear()
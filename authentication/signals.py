@@ -0,0 +1,113 @@
+"""
+    signal handlers used to invalidate cached authorization data
+    whenever the user groups, permissions, or role profiles change
+"""
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from authentication.models import User
+from authentication.services.blacklist import TokenBlacklistService
+from authentication.services.permission_set import PermissionSetService
+from authentication.services.principal import PrincipalService
+from core.db.cascade import cascade_pre_delete
+from core.models import PATIENT_GROUP_CACHE_KEY, StudentPatient, Therapist
+
+
+def invalidate_users(user_ids):
+    """invalidate all the cached authorization data of the given users"""
+    user_ids = list(user_ids)
+    PrincipalService.invalidate(user_ids)
+    PermissionSetService.invalidate(user_ids)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_membership(sender, instance, action, reverse, pk_set, **kwargs):
+    """invalidate the cached data of users whose groups or direct permissions were changed"""
+
+    # the instance is the group/permission when the membership is changed through the reverse relation (e.g. group.user_set)
+    if reverse:
+        if action in ('post_add', 'post_remove'):
+            invalidate_users(pk_set)
+        elif action == 'pre_clear':
+            invalidate_users(instance.user_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_users([instance.pk])
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, action, **kwargs):
+    """discard all cached permission sets after changing the permissions of any group"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        PermissionSetService.bump_version()
+
+
+@receiver(post_delete, sender=Permission)
+def invalidate_deleted_permission(sender, instance, **kwargs):
+    PermissionSetService.bump_version()
+
+
+@receiver(post_save, sender=Group)
+def invalidate_renamed_group_members(sender, instance, **kwargs):
+    """invalidate the principals of all group members after renaming a group"""
+    PrincipalService.invalidate(instance.user_set.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Group)
+def invalidate_deleted_group_members(sender, instance, **kwargs):
+    """invalidate the principals and permission sets of all group members before deleting a group"""
+    invalidate_users(instance.user_set.values_list('pk', flat=True))
+    caches[settings.FAST_CACHE_ALIAS].delete(PATIENT_GROUP_CACHE_KEY)
+
+
+@receiver(post_save, sender=Therapist)
+@receiver(post_delete, sender=Therapist)
+@receiver(post_save, sender=StudentPatient)
+@receiver(post_delete, sender=StudentPatient)
+def invalidate_role_profile(sender, instance, **kwargs):
+    """invalidate the principal of a user whose role profile was created, updated, or deleted"""
+    PrincipalService.invalidate([instance.user_id])
+
+
+# user fields updated on every login or visit, which never affect the user permissions
+ACTIVITY_TRACKING_FIELDS = frozenset(['last_login', 'last_activity'])
+
+@receiver(post_save, sender=User)
+def invalidate_saved_user(sender, instance, created, update_fields=None, **kwargs):
+    """
+        invalidate any stale principal cached under the id of a newly created user (DB ids may be reused),
+        and the permission set and token role claims of a user whose active/superuser flags may have changed
+    """
+    if created or update_fields is None or not set(update_fields) <= ACTIVITY_TRACKING_FIELDS:
+        invalidate_users([instance.pk])
+
+
+@receiver(post_delete, sender=User)
+def invalidate_deleted_user(sender, instance, **kwargs):
+    invalidate_users([instance.pk])
+
+
+@receiver(cascade_pre_delete, sender=User)
+def invalidate_cascade_deleted_users(sender, queryset, **kwargs):
+    """invalidate the users soft or hard deleted in bulk (e.g. through a queryset or a cascade), once the deletion is committed"""
+    user_ids = list(queryset.values_list('pk', flat=True))
+    transaction.on_commit(lambda: invalidate_users(user_ids), using=queryset.db)
+
+
+@receiver(cascade_pre_delete, sender=Therapist)
+@receiver(cascade_pre_delete, sender=StudentPatient)
+def invalidate_cascade_deleted_profiles(sender, queryset, **kwargs):
+    """invalidate the principals of the users whose role profiles are soft or hard deleted in bulk, once the deletion is committed"""
+    user_ids = list(queryset.values_list('user_id', flat=True))
+    transaction.on_commit(lambda: PrincipalService.invalidate(user_ids), using=queryset.db)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def notify_blacklisted_token(sender, instance, created, **kwargs):
+    """make all the processes load the new blacklisted token into their blacklist filter"""
+    if created:
+        TokenBlacklistService.bump_version()
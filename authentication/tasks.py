@@ -0,0 +1,21 @@
+from celery import shared_task
+from authentication.services.activity import ActivityService
+from authentication.services.blacklist import TokenBlacklistService
+
+
+@shared_task
+def flush_user_activity():
+    """
+    This function will be called periodically by celery beat to write the buffered last activity of the users
+    """
+
+    return ActivityService.flush()
+
+
+@shared_task
+def prune_token_blacklist():
+    """
+    This function will be called periodically by celery beat to delete the expired outstanding and blacklisted refresh tokens
+    """
+
+    return TokenBlacklistService.prune()
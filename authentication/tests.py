@@ -1,3 +1,386 @@
-from django.test import TestCase
+from datetime import timedelta
+from types import SimpleNamespace
+from asgiref.sync import async_to_sync
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from django.conf import settings
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.test import TestCase, tag
+from django.utils import timezone
+from authentication.backends import ClaimsJWTAuthentication, ClaimsUser, EmailAuthBackend
+from authentication.models import User
+from authentication.permissions import IsPatient, IsTherapist
+from authentication.services.activity import ActivityService
+from authentication.services.auth import AuthService
+from authentication.services.blacklist import TokenBlacklistService
+from authentication.services.permission_set import PermissionSetService
+from authentication.services.principal import PrincipalService
+from authentication.services.socket_auth import SocketAuthService
+from authentication.utils import ActionBasedPermission
+from core.enums import UserRole
+from core.models import StudentPatient
+from core.mock import PatientMock, TherapistMock, UserMock
+from core.utils.testing import CachedStateTestCase, CachedStateTransactionTestCase
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
 # Create your tests here.
+
+class PrincipalServiceTestCase(TestCase):
+
+    @tag('principal-load-single-query')
+    def test_load_single_query(self):
+
+        patient = PatientMock.mock_instances(n=1)[0]
+
+        with self.assertNumQueries(1):
+            principal = PrincipalService.load(patient.user.pk)
+
+        self.assertTrue(principal.is_patient)
+        self.assertFalse(principal.is_therapist)
+        self.assertEqual(principal.patient_id, patient.pk)
+        self.assertEqual(principal.groups, frozenset([UserRole.PATIENT.value]))
+
+    @tag('principal-cached-across-requests')
+    def test_cached_across_requests(self):
+
+        therapist = TherapistMock.mock_instances(n=1)[0]
+        PrincipalService.get(therapist.user.pk)
+
+        with self.assertNumQueries(0):
+            principal = PrincipalService.for_request(SimpleNamespace(user=therapist.user))
+
+        self.assertEqual(principal.therapist_id, therapist.pk)
+
+    @tag('principal-invalidated-on-group-change')
+    def test_invalidated_on_group_change(self):
+
+        user = UserMock.mock_instances(n=1)[0]
+        self.assertFalse(PrincipalService.get(user.pk).groups)
+
+        group, _ = Group.objects.get_or_create(name=UserRole.THERAPIST.value)
+        user.groups.add(group)
+        self.assertEqual(PrincipalService.get(user.pk).groups, frozenset([UserRole.THERAPIST.value]))
+
+        group.user_set.remove(user)
+        self.assertFalse(PrincipalService.get(user.pk).groups)
+
+    @tag('principal-invalidated-on-profile-delete')
+    def test_invalidated_on_profile_delete(self):
+
+        patient = PatientMock.mock_instances(n=1)[0]
+        self.assertTrue(PrincipalService.get(patient.user.pk).is_patient)
+
+        patient.delete()
+        self.assertFalse(PrincipalService.get(patient.user.pk).is_patient)
+
+    @tag('principal-invalidated-on-bulk-soft-delete')
+    def test_invalidated_on_bulk_soft_delete(self):
+
+        patient = PatientMock.mock_instances(n=1)[0]
+        self.assertTrue(PrincipalService.get(patient.user.pk).is_patient)
+
+        # soft deleted through a queryset, whose UPDATE sends no post_delete signal
+        with self.captureOnCommitCallbacks(execute=True):
+            StudentPatient.objects.filter(pk=patient.pk).delete()
+        self.assertFalse(PrincipalService.get(patient.user.pk).is_patient)
+
+    @tag('principal-anonymous')
+    def test_anonymous_request(self):
+
+        request = SimpleNamespace(user=SimpleNamespace(pk=None, is_authenticated=False))
+
+        with self.assertNumQueries(0):
+            principal = PrincipalService.for_request(request)
+
+        self.assertFalse(principal.is_patient or principal.is_therapist)
+
+
+class ActionBasedPermissionTestCase(TestCase):
+
+    @tag('action-permission-instances')
+    def test_instances_kept_on_definitions(self):
+
+        composed = IsTherapist() | IsPatient()
+        instance = ActionBasedPermission._get_perm_instance(composed)
+        self.assertIs(ActionBasedPermission._get_perm_instance(composed), instance)
+
+        # a subclass does not reuse the instance stored on its parent class
+        therapist = IsTherapist()
+
+        class ChildPermission(therapist):
+            pass
+
+        self.assertIsInstance(ActionBasedPermission._get_perm_instance(therapist), therapist)
+        self.assertIsInstance(ActionBasedPermission._get_perm_instance(ChildPermission), ChildPermission)
+
+
+class PermissionSetServiceTestCase(TestCase):
+
+    def setUp(self):
+        self.user = UserMock.mock_instances(n=1)[0]
+        self.permission = Permission.objects.get(codename='view_user')
+        self.perm_name = f'{self.permission.content_type.app_label}.{self.permission.codename}'
+
+    @tag('permission-set-cached-across-requests')
+    def test_cached_across_requests(self):
+
+        PermissionSetService.get(self.user.pk)
+
+        with self.assertNumQueries(0):
+            permission_set = PermissionSetService.for_request(SimpleNamespace(user=self.user))
+
+        self.assertFalse(permission_set.has_perm(self.perm_name))
+
+    @tag('permission-set-invalidated-on-user-permission-change')
+    def test_invalidated_on_user_permission_change(self):
+
+        self.assertFalse(PermissionSetService.get(self.user.pk).has_perm(self.perm_name))
+
+        self.user.user_permissions.add(self.permission)
+        self.assertTrue(PermissionSetService.get(self.user.pk).has_perm(self.perm_name))
+
+        self.user.user_permissions.remove(self.permission)
+        self.assertFalse(PermissionSetService.get(self.user.pk).has_perm(self.perm_name))
+
+    @tag('permission-set-invalidated-on-group-permission-change')
+    def test_invalidated_on_group_permission_change(self):
+
+        group, _ = Group.objects.get_or_create(name=UserRole.THERAPIST.value)
+        self.user.groups.add(group)
+        self.assertFalse(PermissionSetService.get(self.user.pk).has_perm(self.perm_name))
+
+        group.permissions.add(self.permission)
+        self.assertTrue(PermissionSetService.get(self.user.pk).has_perm(self.perm_name))
+
+    @tag('permission-set-superuser')
+    def test_superuser_bypass(self):
+
+        self.user.is_superuser = True
+        self.user.save()
+
+        permission_set = PermissionSetService.get(self.user.pk)
+        self.assertTrue(permission_set.has_perm(self.perm_name))
+        self.assertFalse(permission_set.has_perm(self.perm_name, ignore_super=True))
+
+
+class SocketAuthServiceTestCase(CachedStateTransactionTestCase):
+    """
+        the users are loaded from the threads of database_sync_to_async, which close their connections,
+        so the tests commit their data instead of running in a transaction
+    """
+
+    reset_state = (SocketAuthService.clear,)
+
+    def setUp(self):
+        super().setUp()
+        self.user = UserMock.mock_instances(n=1)[0]
+        self.token = str(AccessToken.for_user(self.user))
+
+    @tag('socket-auth-parse-subprotocol')
+    def test_parse_subprotocol_token(self):
+
+        headers = [(b'host', b'localhost'), (b'sec-websocket-protocol', f'Authorization, {self.token}'.encode())]
+
+        self.assertEqual(SocketAuthService.parse_token(headers), self.token)
+        self.assertIsNone(SocketAuthService.parse_token([(b'sec-websocket-protocol', b'Authorization')]))
+        self.assertIsNone(SocketAuthService.parse_token([(b'host', b'localhost')]))
+
+    @tag('socket-auth-access-tokens-only')
+    def test_only_access_tokens_decoded(self):
+
+        self.assertEqual(SocketAuthService.decode(self.token)['user_id'], self.user.pk)
+        self.assertIsNone(SocketAuthService.decode(str(RefreshToken.for_user(self.user))))
+        self.assertIsNone(SocketAuthService.decode('not-a-token'))
+
+    @tag('socket-auth-cached-user')
+    def test_cached_user_reused_by_same_token(self):
+
+        claims = SocketAuthService.decode(self.token)
+        SocketAuthService._store((claims['user_id'], claims['jti']), self.user, claims)
+
+        with self.assertNumQueries(0):
+            user = async_to_sync(SocketAuthService.aget_user)(claims)
+            other = async_to_sync(SocketAuthService.aget_user)(claims)
+
+        self.assertEqual(user.pk, self.user.pk)
+
+        # every connection gets its own copy of the cached user
+        user.first_name = 'modified by a connection'
+        self.assertIsNot(other, user)
+        self.assertNotEqual(other.first_name, user.first_name)
+
+
+class ClaimsJWTAuthenticationTestCase(TestCase):
+
+    def _authenticate(self, access_token: str):
+        request = Request(APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {access_token}'))
+        user, _ = ClaimsJWTAuthentication().authenticate(request)
+
+        return user, PrincipalService.for_request(request)
+
+    @tag('claims-auth-no-queries')
+    def test_authenticated_from_claims_without_queries(self):
+
+        therapist = TherapistMock.mock_instances(n=1)[0]
+        tokens = AuthService.generate_tokens(therapist.user)
+
+        with self.assertNumQueries(0):
+            user, principal = self._authenticate(tokens.access)
+            self.assertTrue(user.is_authenticated)
+            self.assertEqual(user.pk, therapist.user.pk)
+
+        self.assertIsInstance(user, ClaimsUser)
+        self.assertEqual(principal.therapist_id, therapist.pk)
+        self.assertFalse(principal.is_patient)
+
+    @tag('claims-auth-stale-fallback')
+    def test_stale_claims_fall_back_to_db(self):
+
+        patient = PatientMock.mock_instances(n=1)[0]
+        tokens = AuthService.generate_tokens(patient.user)
+
+        # joining the therapist group makes the issued role claims stale
+        group, _ = Group.objects.get_or_create(name=UserRole.THERAPIST.value)
+        patient.user.groups.add(group)
+
+        user, principal = self._authenticate(tokens.access)
+
+        self.assertNotIsInstance(user, ClaimsUser)
+        self.assertIn(UserRole.THERAPIST.value, principal.groups)
+
+    @tag('claims-auth-missing-version')
+    def test_claims_without_version_rejected(self):
+
+        patient = PatientMock.mock_instances(n=1)[0]
+        claims = PrincipalService.to_claims(PrincipalService.get(patient.user_id))
+        del claims['rv']
+
+        # the missing version must not match the evicted version of the user
+        caches[settings.FAST_CACHE_ALIAS].delete(PrincipalService.claims_version_key(patient.user_id))
+        self.assertIsNone(PrincipalService.from_claims(patient.user_id, claims))
+
+
+class ActivityServiceTestCase(CachedStateTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.users = UserMock.mock_instances(n=3)
+
+    @tag('activity-record-no-queries')
+    def test_record_without_queries(self):
+
+        with self.assertNumQueries(0):
+            for user in self.users:
+                ActivityService.record(user.pk)
+                ActivityService.record(user.pk)
+
+        self.assertTrue(all(user.last_activity is None for user in User.objects.filter(pk__in=[user.pk for user in self.users])))
+
+    @tag('activity-flush-bulk-update')
+    def test_flush_single_bulk_update(self):
+
+        for user in self.users[:2]:
+            ActivityService.record(user.pk)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(ActivityService.flush(include_current=True), 2)
+
+        seen = User.objects.filter(last_activity__isnull=False).values_list('pk', flat=True)
+        self.assertEqual(set(seen), {user.pk for user in self.users[:2]})
+
+
+class LoginSignupTestCase(CachedStateTestCase):
+
+    @tag('login-single-query')
+    def test_login_single_lookup_query(self):
+
+        _, user = StudentPatient.create('patient', 'patient@jusoor.test', 'secret-password')
+
+        with self.assertNumQueries(1):
+            self.assertEqual(EmailAuthBackend().authenticate(None, username='patient@jusoor.test', password='secret-password'), user)
+        with self.assertNumQueries(1):
+            self.assertIsNone(EmailAuthBackend().authenticate(None, username='patient@jusoor.test', password='wrong-password'))
+
+    @tag('signup-cached-patient-group')
+    def test_signup_cached_patient_group(self):
+
+        StudentPatient.create('first', 'first@jusoor.test', 'secret-password')
+
+        with self.assertNumQueries(0):
+            group_id = StudentPatient.get_group_id()
+
+        _, user = StudentPatient.create('second', 'second@jusoor.test', 'secret-password')
+        self.assertEqual(list(user.groups.values_list('pk', flat=True)), [group_id])
+        self.assertTrue(user.check_password('secret-password'))
+
+
+class TokenBlacklistTestCase(CachedStateTestCase):
+
+    reset_state = (TokenBlacklistService.clear,)
+
+    def setUp(self):
+        super().setUp()
+        self.user = UserMock.mock_instances(n=1)[0]
+
+    @tag('blacklist-filter-no-queries')
+    def test_valid_token_checked_without_queries(self):
+
+        revoked = RefreshToken.for_user(self.user)
+        AuthService.logout(str(revoked))
+        token = str(RefreshToken.for_user(self.user))
+        TokenBlacklistService.sync(force=True)
+
+        with self.assertNumQueries(0):
+            AuthService.validate_refresh_token(token)
+
+    @tag('blacklist-filter-rejects-blacklisted')
+    def test_blacklisted_token_rejected(self):
+
+        token = str(RefreshToken.for_user(self.user))
+        AuthService.logout(token)
+
+        with self.assertRaises(TokenError):
+            AuthService.validate_refresh_token(token)
+
+        # a process that did not blacklist the token loads it from the DB
+        TokenBlacklistService.clear()
+        with self.assertRaises(TokenError):
+            AuthService.validate_refresh_token(token)
+
+    @tag('blacklist-filter-out-of-order-commit')
+    def test_out_of_order_commit_loaded(self):
+
+        now = timezone.now()
+        early, late = [
+            OutstandingToken.objects.create(user=self.user, jti=f'token-{i}', token='', created_at=now, expires_at=now + timedelta(days=1))
+            for i in range(2)
+        ]
+        # the id of the early blacklisting is allocated first, but its transaction commits last
+        early_id = BlacklistedToken.objects.create(token=early).pk
+        BlacklistedToken.objects.filter(pk=early_id).delete()
+        BlacklistedToken.objects.create(token=late)
+        self.assertNotIn(early.jti, TokenBlacklistService.sync(force=True))
+
+        BlacklistedToken.objects.create(pk=early_id, token=early)
+        blacklist_filter = TokenBlacklistService.sync(force=True)
+        self.assertIn(early.jti, blacklist_filter)
+        self.assertIn(late.jti, blacklist_filter)
+
+    @tag('blacklist-prune-expired')
+    def test_prune_expired_tokens(self):
+
+        now = timezone.now()
+        expired = [
+            OutstandingToken.objects.create(user=self.user, jti=f'expired-{i}', token='', created_at=now - timedelta(days=31), expires_at=now - timedelta(days=1))
+            for i in range(3)
+        ]
+        BlacklistedToken.objects.create(token=expired[0])
+        live = OutstandingToken.objects.create(user=self.user, jti='live', token='', created_at=now, expires_at=now + timedelta(days=1))
+        BlacklistedToken.objects.create(token=live)
+
+        self.assertEqual(TokenBlacklistService.prune(batch_size=2), 3)
+        self.assertEqual(list(OutstandingToken.objects.values_list('jti', flat=True)), ['live'])
+        self.assertEqual(list(BlacklistedToken.objects.values_list('token__jti', flat=True)), ['live'])
@@ -4,6 +4,7 @@ all definitions of authnetication-based utilies
 from django.db import models
 from typing import Optional, Callable
 from rest_framework.permissions import BasePermission
+from authentication.services.permission_set import PermissionSetService
 
 
 
@@ -15,6 +16,22 @@ class ActionBasedPermission(BasePermission):
     given the action_permissions mapping defined in the viewset
     """
 
+    # permission classes are stateless, so each one is instantiated once and reused across requests.
+    # NOTE: the instance is stored on the permission definition itself, since composed permissions
+    # (e.g. IsTherapist() | IsPatient()) are not guaranteed to be hashable, and it is read from the own
+    # attributes of the definition so that a permission class never reuses the instance of its parent class
+    PERM_INSTANCE_ATTR = '_action_perm_instance'
+
+    @classmethod
+    def _get_perm_instance(cls, perm) -> BasePermission:
+        instance = vars(perm).get(cls.PERM_INSTANCE_ATTR)
+
+        if instance is None:
+            instance = perm()
+            setattr(perm, cls.PERM_INSTANCE_ATTR, instance)
+
+        return instance
+
     def has_permission(self, request, view):
         action_perms = getattr(view, "action_permissions", {})
         action = view.action
@@ -24,7 +41,7 @@ class ActionBasedPermission(BasePermission):
         else:
             return False
 
-        perm_list = [perm() for perm in class_list]
+        perm_list = [self._get_perm_instance(perm) for perm in class_list]
 
         # debugging note: python maps are are generators that get *consumed*
         # so avoid printing it while debugging
@@ -84,14 +101,8 @@ def HasPerm(action_name, model: Optional[models.Model] = None, ignore_super=Fals
             if user.is_anonymous:
                 return False
 
-            if ignore_super:
-                model_name = used_model.__name__.lower()
-                perm = "{}_{}".format(action_name, model_name)
-                res = user.has_perm_ignore_super(perm)
-            else:
-                res = user.has_perm(full_name)
-
-            return res
+            # checking against the cached permission set instead of walking the group and permission tables
+            return PermissionSetService.for_request(request).has_perm(full_name, ignore_super=ignore_super)
 
     return Result
 
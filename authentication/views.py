@@ -12,7 +12,8 @@ from .serializers import HttpLoginErrorSerializer, HttpSignupErrorSerializer, Ht
 from .services.auth import AuthService, User
 from .constants.placeholders import INVALID_CREDENTIALS, LOGGED_IN, SIGNED_OUT, SIGNED_UP, TOKEN_INVALID, TOKEN_REFRESHED
 from core.placeholders import ERROR, SUCCESS, CREATED
-from django.contrib.auth import authenticate, login
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import update_last_login
 from core.serializers import HttpErrorResponseSerializer, HttpSuccessResponseSerializer
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.mixins import UpdateModelMixin
@@ -60,7 +61,7 @@ class AuthViewset(ActionBasedPermMixin, SerializerMapperMixin, GenericViewSet):
             return Response(
                 status=status.HTTP_401_UNAUTHORIZED, message= INVALID_CREDENTIALS, data=None,
                 )
-        login(request, user, 'authentication.backends.EmailAuthBackend') ## used to track login timestamp in DB
+        update_last_login(None, user) ## used to track login timestamp in DB (without creating a session)
         # 3. generate the JWT token
         tokens = AuthService.generate_tokens(user)
 
@@ -82,7 +83,7 @@ class AuthViewset(ActionBasedPermMixin, SerializerMapperMixin, GenericViewSet):
         user = AuthService.patient_signup(email=data['email'], password=data['password'], username=data['username'])
         # TODO: send a verification email to the user before activating his account
         # 3. generate the JWT token
-        login(request, user, 'authentication.backends.EmailAuthBackend') ## used to track login timestamp in DB
+        update_last_login(None, user) ## used to track login timestamp in DB (without creating a session)
         # 3. generate the JWT token
         tokens = AuthService.generate_tokens(user)
 
@@ -129,10 +130,10 @@ class TokenViewset(ActionBasedPermMixin, SerializerMapperMixin, GenericViewSet):
         
         # create a new pair of tokens after validating token
         try:
-            AuthService.validate_refresh_token(data['refresh_token'])
+            refresh_token = AuthService.validate_refresh_token(data['refresh_token'])
             tokens = AuthService.generate_tokens(user=request.user)
-            # blacklist old token
-            AuthService.logout(data['refresh_token'])
+            # blacklist old token (already decoded and checked)
+            AuthService.logout(refresh_token)
         except (InvalidToken, TokenError) as e:
             raise ValidationError(TOKEN_INVALID)
 
@@ -1,3 +1,14 @@
 from django.contrib import admin
+from chat.guardrails import GuardrailService
+from .models import GuardrailRule
 
 # Register your models here.
+@admin.register(GuardrailRule)
+class GuardrailRuleAdmin(admin.ModelAdmin):
+    list_display = ('pattern', 'description', 'is_active', 'last_updated_at')
+    list_filter = ('is_active',)
+
+    def delete_queryset(self, request, queryset):
+        # the bulk deletion of the "delete selected" action sends no signal, unlike the deletion of a single rule
+        super().delete_queryset(request, queryset)
+        GuardrailService.bump_version()
@@ -1,16 +1,28 @@
-import re
 from django.db import transaction
 from abc import ABC, abstractmethod
 from pyexpat import model
-from typing import List
+import hashlib
+import asyncio
+import json
+import threading
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from django.conf import settings
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_community.vectorstores.pgvector import PGVector
+from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, HumanMessage
 from authentication.models import User
-from chat.enums import BLACKLIST_INPUTS
+from chat.guardrails import GuardrailService
+from chat.fakes import FakeStreamingChatModel
 from chat.mock import ChatBotMocker, ChatMessageMocker
 from chat.models import ChatMessage
+from chat.pipeline import run_stage
+from chat.retrieval import ReferenceCache
+from chat.types import ChatAnswer, StageTimings
 from core.mock import PatientMock
 from jusoor_backend.settings import env
 from langchain.prompts import SystemMessagePromptTemplate, ChatPromptTemplate, HumanMessagePromptTemplate, AIMessagePromptTemplate
@@ -21,6 +33,53 @@ from django.db.models import Q
 
 # set_llm_cache(SQLiteCache(database_path="langchain.db"))
 
+def vector_store_connection_string() -> str:
+    """connection string of the PostgreSQL database holding the reference embeddings"""
+    return PGVector.connection_string_from_db_params(
+        host= env('DB_HOST'),
+        port= env('DB_PORT'),
+        database= env('DB_NAME'),
+        user= env('DB_USER'),
+        password= env('DB_PASS'),
+        driver='psycopg2'
+    )
+
+
+def build_vector_store(collection_name: str, embeddings: Embeddings) -> PGVector:
+    """build a new PGVector store (with its own connection pool) over a collection of reference embeddings"""
+    return PGVector(
+        connection_string= vector_store_connection_string(),
+        collection_name= collection_name,
+        embedding_function= embeddings
+    )
+
+
+_vector_stores: Dict[str, PGVector] = {}
+_vector_stores_lock = threading.Lock()
+
+def get_vector_store(collection_name: Optional[str] = None) -> PGVector:
+    """
+        get the vector store of a collection shared by the whole process, so that all the agents
+        reuse one OpenAI embeddings client and one DB connection pool
+
+        @param collection_name: the embeddings collection (EMBEDDING_COLLECTION_NAME by default)
+    """
+
+    collection_name = collection_name or env('EMBEDDING_COLLECTION_NAME')
+    store = _vector_stores.get(collection_name)
+    if store is not None:
+        return store
+
+    with _vector_stores_lock:
+        if collection_name not in _vector_stores:
+            _vector_stores[collection_name] = build_vector_store(collection_name, OpenAIEmbeddings(openai_api_key=env('OPENAI_KEY')))
+        return _vector_stores[collection_name]
+
+
+BLACKLISTED_INPUT_ANSWER = "XX I am sorry. I am mental health AI and I am not allowed to perform that action. If you need mental health assitance, I am always here"
+DUMMY_ANSWER = "I am a dummy agent. I am not configured to answer questions yet."
+
+
 class AIAgent(ABC):
     """
         Abstract class ised to define the interface of the chat AI agent.
@@ -59,6 +118,17 @@ class AIAgent(ABC):
         """generate a chatbot answer for a given user message and retrieved conversation context"""
         pass
 
+    async def aanswer(self, user: User, message: str) -> ChatAnswer:
+        """generate a chatbot answer along with the timings of its stages (the whole answer as a single stage by default)"""
+        timings = StageTimings()
+        content = await run_stage('answer', database_sync_to_async(self.answer)(user, message), timings)
+        return ChatAnswer(content=content, timings=timings)
+
+    async def astream(self, user: User, message: str, timings: Optional[StageTimings] = None) -> AsyncIterator[str]:
+        """stream the tokens of the chatbot answer as they are generated (the whole answer at once by default)"""
+        timings = StageTimings() if timings is None else timings
+        yield await run_stage('answer', database_sync_to_async(self.answer)(user, message), timings)
+
 
 
 
@@ -76,6 +146,7 @@ class ChatGPTAgent(AIAgent):
         temperature: float = 0.9,
         top_p: float = 0.7,
         max_response_tokens: int = 200,
+        vector_store: Optional[PGVector] = None,
      *args, 
      **kwargs):
         
@@ -83,29 +154,20 @@ class ChatGPTAgent(AIAgent):
         # TODO: remove hard dependency on env key
         self.max_tokens = max_response_tokens
         self.chat_model = chat_model(model_name= model_name, openai_api_key=env('OPENAI_KEY'))
-        self.embeddings = embeddings(openai_api_key=env('OPENAI_KEY'))
         self.history_len = history_len
         self.temperature = float(temperature)
         self.top_p = float(top_p)
         self.prompt = prompt
 
-        # 2. configure the PostgreSQL vector store
-        
-        CONNECTION_STRING = PGVector.connection_string_from_db_params(
-            host= env('DB_HOST'),
-            port= env('DB_PORT'),
-            database= env('DB_NAME'),
-            user= env('DB_USER'),
-            password= env('DB_PASS'),
-            driver='psycopg2'
-
-        )
-        self.vector_store = PGVector(
-            connection_string= CONNECTION_STRING,
-            collection_name= collection_name,
-            embedding_function= self.embeddings
-        )
+        # 2. configure the PostgreSQL vector store (shared by the process when using the default embeddings)
+        if vector_store is None:
+            if embeddings is OpenAIEmbeddings:
+                vector_store = get_vector_store(collection_name)
+            else:
+                vector_store = build_vector_store(collection_name, embeddings(openai_api_key=env('OPENAI_KEY')))
 
+        self.vector_store = vector_store
+        self.embeddings = vector_store.embeddings
         self.retriever = self.vector_store.as_retriever()
 
     def _retrieve_history(self, user: User) -> List[HumanMessagePromptTemplate | AIMessagePromptTemplate]:
@@ -118,14 +180,14 @@ class ChatGPTAgent(AIAgent):
         # inject messages into prompt
         messages = []
         for message in history:
-            if message.sender.id == user.pk:
+            if message.sender_id == user.pk:
                 messages.append(HumanMessagePromptTemplate.from_template(message.content))
             else:
                 messages.append(AIMessagePromptTemplate.from_template(message.content))
 
         return messages
 
-    def _construct_prompt(self, user: User):
+    def _construct_prompt(self, user: User, history_messages: Optional[List[HumanMessagePromptTemplate | AIMessagePromptTemplate]] = None):
         
         # 1. TODO: retrieve the user message history using his id
 
@@ -142,7 +204,8 @@ class ChatGPTAgent(AIAgent):
         system_prompt = SystemMessagePromptTemplate.from_template(
             full_prompt)
         
-        history_messages = self._retrieve_history(user)
+        if history_messages is None:
+            history_messages = self._retrieve_history(user)
 
         incoming_message = HumanMessagePromptTemplate.from_template('{user_input}')
         return ChatPromptTemplate.from_messages(
@@ -154,7 +217,7 @@ class ChatGPTAgent(AIAgent):
         )
     
     def get_relevant_docs(self, message: str):
-        return self.vector_store.similarity_search(message, k=1)
+        return ReferenceCache.search(self.vector_store, message, k=1)
 
     def _construct_few_shots_reference(self, message: str):
         """
@@ -162,7 +225,10 @@ class ChatGPTAgent(AIAgent):
         """
 
         # TODO: needs further understandin
-        reference_documents = self.vector_store.similarity_search(message, k=1)
+        return self._format_few_shots_reference(self.get_relevant_docs(message))
+
+    def _format_few_shots_reference(self, reference_documents: List[Document]):
+        """format the retrieved reference conversations as the few shot prompt of the AI model"""
 
         formatted_docs = [
             """<patient>
@@ -185,10 +251,14 @@ class ChatGPTAgent(AIAgent):
                     </list>
                 """.format(messages="\n".join(formatted_docs))
 
-    def answer(self, user: User, message: str):
-        """generate a chatbot answer for a given user message and retrieved conversation context"""
-        if any([re.compile(pattern, re.IGNORECASE).match(message) for pattern in BLACKLIST_INPUTS]):
-            return "XX I am sorry. I am mental health AI and I am not allowed to perform that action. If you need mental health assitance, I am always here"
+    def _prepare_messages(self, user: User, message: str) -> Optional[List[BaseMessage]]:
+        """
+            build the prompt messages of a user message (history, references and the message itself)
+
+            @return: the prompt messages, or None if the message is blacklisted
+        """
+        if GuardrailService.is_blocked(message):
+            return None
         # 1. get history and reference prompting
         chat_template = self._construct_prompt(user=user)
         # TODO: use a filter to restrict lookup to only chat metadata tags
@@ -196,17 +266,94 @@ class ChatGPTAgent(AIAgent):
         reference_message = self._construct_few_shots_reference(message)
         
 
-        messages = chat_template.format_messages(
+        return chat_template.format_messages(
             user_input=message,
             reference_message= reference_message
         )
 
+    async def _aretrieve_references(self, message: str, timings: StageTimings) -> List[Document]:
+        """embed the user message, then search its reference conversations in the vector store (both skipped on cache hits)"""
+
+        collection = self.vector_store.collection_name
+        documents = ReferenceCache.lookup(collection, 1, message)
+        if documents is not None:
+            return documents
+
+        with timings.measure('embedding'):
+            embedding = await self.embeddings.aembed_query(message)
+
+        documents = ReferenceCache.lookup_similar(collection, 1, message, embedding)
+        if documents is not None:
+            return documents
+
+        # the vector store has its own connection pool, so the search does not wait for the thread of the Django connection
+        with timings.measure('vector_search'):
+            documents = await sync_to_async(self.vector_store.similarity_search_by_vector, thread_sensitive=False)(embedding, k=1)
+
+        ReferenceCache.store(collection, 1, message, embedding, documents)
+        return documents
+
+    async def aprepare(self, user: User, message: str, timings: StageTimings) -> Optional[List[BaseMessage]]:
+        """
+            build the prompt messages of a user message, loading the history and retrieving the references concurrently.
+            A stage exceeding its timeout is abandoned, and the prompt is built without its history or references
+
+            @param timings: the timings recording the duration of every stage
+            @return: the prompt messages, or None if the message is blacklisted
+        """
+
+        with timings.measure('guardrail'):
+            if await GuardrailService.ais_blocked(message):
+                return None
+
+        history_messages, reference_documents = await asyncio.gather(
+            run_stage('history', database_sync_to_async(self._retrieve_history)(user), timings, settings.CHAT_HISTORY_STAGE_TIMEOUT, fallback=[]),
+            run_stage('retrieval', self._aretrieve_references(message, timings), timings, settings.CHAT_RETRIEVAL_STAGE_TIMEOUT, fallback=[]),
+        )
+
+        return self._construct_prompt(user, history_messages).format_messages(
+            user_input=message,
+            reference_message=self._format_few_shots_reference(reference_documents)
+        )
+
+    def answer(self, user: User, message: str):
+        """generate a chatbot answer for a given user message and retrieved conversation context"""
+        messages = self._prepare_messages(user, message)
+        if messages is None:
+            return BLACKLISTED_INPUT_ANSWER
+
         return self.chat_model.invoke(messages, temperature= self.temperature, top_p= self.top_p).content
 
+    async def aanswer(self, user: User, message: str) -> ChatAnswer:
+        """generate a chatbot answer, running the retrieval stages of the prompt concurrently"""
+        timings = StageTimings()
+        messages = await self.aprepare(user, message, timings)
+        if messages is None:
+            return ChatAnswer(content=BLACKLISTED_INPUT_ANSWER, timings=timings)
+
+        with timings.measure('llm'):
+            reply = await self.chat_model.ainvoke(messages, temperature= self.temperature, top_p= self.top_p)
+
+        return ChatAnswer(content=reply.content, timings=timings)
+
+    async def astream(self, user: User, message: str, timings: Optional[StageTimings] = None) -> AsyncIterator[str]:
+        """stream the tokens of the chatbot answer, running the retrieval stages of the prompt concurrently"""
+        timings = StageTimings() if timings is None else timings
+        messages = await self.aprepare(user, message, timings)
+        if messages is None:
+            yield BLACKLISTED_INPUT_ANSWER
+            return
+
+        with timings.measure('llm'):
+            async for chunk in self.chat_model.astream(messages, temperature= self.temperature, top_p= self.top_p):
+                if chunk.content:
+                    yield chunk.content
+
 class DummyAIAgent(AIAgent):
-    """dummy AI agent used for testing purposes"""
-    def __init__(self, chat_model: BaseChatModel = ChatOpenAI, embeddings: Embeddings = OpenAIEmbeddings, history_len: int = 8, collection_name: str = env('EMBEDDING_COLLECTION_NAME'), *args, **kwargs):
+    """dummy AI agent used for testing purposes, answering through an offline streaming chat model"""
+    def __init__(self, chat_model: BaseChatModel = ChatOpenAI, embeddings: Embeddings = OpenAIEmbeddings, history_len: int = 8, collection_name: str = env('EMBEDDING_COLLECTION_NAME'), streaming_model: Optional[BaseChatModel] = None, *args, **kwargs):
         super().__init__(chat_model, embeddings, history_len, collection_name, *args, **kwargs)
+        self.streaming_model = streaming_model or FakeStreamingChatModel(response=DUMMY_ANSWER)
 
     def _retrieve_history(self, user: User):
         return []
@@ -215,5 +362,79 @@ class DummyAIAgent(AIAgent):
         return ""
 
     def answer(self, user: User, message: str):
-        return "I am a dummy agent. I am not configured to answer questions yet."
-    
\ No newline at end of file
+        return self.streaming_model.invoke([HumanMessage(content=message)]).content
+
+    async def aanswer(self, user: User, message: str) -> ChatAnswer:
+        timings = StageTimings()
+        with timings.measure('llm'):
+            reply = await self.streaming_model.ainvoke([HumanMessage(content=message)])
+        return ChatAnswer(content=reply.content, timings=timings)
+
+    async def astream(self, user: User, message: str, timings: Optional[StageTimings] = None) -> AsyncIterator[str]:
+        timings = StageTimings() if timings is None else timings
+        with timings.measure('llm'):
+            async for chunk in self.streaming_model.astream([HumanMessage(content=message)]):
+                yield chunk.content
+
+
+def get_agent_class() -> Callable[..., AIAgent]:
+    """the agent answering the chat messages (the offline dummy agent within the test context)"""
+    return ChatGPTAgent if env('CONTEXT') != 'test' else DummyAIAgent
+    
+
+class AgentRegistry:
+    """
+        Process-wide pool of the chat agents, reusing the agent of a chatbot (and its API clients) across
+        messages. The agents are keyed by the chatbot id and a hash of its configuration, so an updated
+        chatbot gets a new agent even in the processes that did not receive its post_save signal
+
+        NOTE: the agents only hold configuration and thread-safe API clients, so the same agent
+        serves the concurrent messages of all the threads of the process
+    """
+
+    # (bot id, config hash, agent class) -> agent
+    _agents: Dict[Tuple, AIAgent] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def config_hash(config: Dict) -> str:
+        return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+    @staticmethod
+    def get(bot, agent_cls: Callable[..., AIAgent]) -> AIAgent:
+        """
+            get the agent of a chatbot, building it on the first message of the chatbot configuration
+
+            @param bot: the ChatBot instance
+            @param agent_cls: the agent class (or factory) called with the chatbot configuration
+        """
+
+        config = bot.get_config()
+        key = (bot.pk, AgentRegistry.config_hash(config), agent_cls)
+
+        agent = AgentRegistry._agents.get(key)
+        if agent is not None:
+            return agent
+
+        with AgentRegistry._lock:
+            agent = AgentRegistry._agents.get(key)
+            if agent is None:
+                agent = agent_cls(**config)
+                # dropping the agents of the previous configurations of the chatbot
+                for stale in [other for other in AgentRegistry._agents if other[0] == bot.pk and other[2] == agent_cls]:
+                    del AgentRegistry._agents[stale]
+                AgentRegistry._agents[key] = agent
+
+        return agent
+
+    @staticmethod
+    def invalidate(bot_id: int):
+        """drop all the agents of a chatbot"""
+        with AgentRegistry._lock:
+            for key in [key for key in AgentRegistry._agents if key[0] == bot_id]:
+                del AgentRegistry._agents[key]
+
+    @staticmethod
+    def clear():
+        with AgentRegistry._lock:
+            AgentRegistry._agents.clear()
@@ -150,5 +150,14 @@ class ReviewChatRoomFeedbackSerializer(serializers.Serializer):
         validated_data['feedback'].save()
 
         return response
-    
 
+
+class ReferenceCacheStatsSerializer(serializers.Serializer):
+    """
+        Serializer used to read the hit rate of the reference conversations cache of a process
+    """
+    exact_hits = serializers.IntegerField()
+    near_hits = serializers.IntegerField()
+    misses = serializers.IntegerField()
+    size = serializers.IntegerField()
+    hit_rate = serializers.FloatField()
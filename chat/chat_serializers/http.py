@@ -1,4 +1,4 @@
-from chat.chat_serializers.base import ChatBotFullReadSerializer, ChatBotReadSerializer, ChatBotWriteSerializer, ChatMessageReadSerializer,  ChatRoomReportReadSerializer, ChatRoomReportResponseReadSerializer, ReviewChatRoomFeedbackSerializer
+from chat.chat_serializers.base import ChatBotFullReadSerializer, ChatBotReadSerializer, ChatBotWriteSerializer, ChatMessageReadSerializer,  ChatRoomReportReadSerializer, ChatRoomReportResponseReadSerializer, ReferenceCacheStatsSerializer, ReviewChatRoomFeedbackSerializer
 from core.serializers import HttpErrorResponseSerializer, HttpErrorSerializer, HttpSuccessResponseSerializer, HttpPaginatedSerializer
 from rest_framework import serializers
 
@@ -101,3 +101,8 @@ class ChatBotWriteSerializerSuccessSerializer(HttpSuccessResponseSerializer):
 
 class ChatBotWriteSerializerErrorSerializer(HttpErrorSerializer):
     data = ChatBotWriteSerializer()
+
+# ------------ reference cache stats
+
+class HttpReferenceCacheStatsResponseSerializer(HttpSuccessResponseSerializer):
+    data = ReferenceCacheStatsSerializer()
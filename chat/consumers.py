@@ -0,0 +1,42 @@
+"""
+File used to define the WebSocket consumer of the chat, streaming the replies of the chatbot token by token
+"""
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from authentication.services.principal import PrincipalService
+from chat.chat_serializers.base import ChatMessageCreateSerializer
+from chat.streaming import ChatTurnService
+from chat.types import ChatWebSocketEvent, ChatWebSocketResponse
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+    """
+        Consumer used by the patients to chat with the chatbot: every received {"content": ...} message
+        is answered by a chat.message_start event, chat.message_content events carrying the generated
+        tokens, and a chat.message_end event carrying the stored reply
+    """
+
+    async def connect(self):
+        user = self.scope.get('user')
+
+        if user is None or not user.is_authenticated:
+            return await self.close()
+
+        principal = await database_sync_to_async(PrincipalService.get)(user.pk)
+        if not principal.is_patient:
+            return await self.close()
+
+        # the token is offered as the second subprotocol, so the first one is echoed back to the client
+        subprotocols = self.scope.get('subprotocols') or []
+        await self.accept(subprotocol=subprotocols[0] if subprotocols else None)
+
+    async def receive_json(self, content, **kwargs):
+        serializer = ChatMessageCreateSerializer(data=content if isinstance(content, dict) else {})
+
+        if not serializer.is_valid():
+            error = ChatWebSocketResponse(event=ChatWebSocketEvent.ERROR, data=str(serializer.errors))
+            return await self.send_json(error.model_dump(mode='json'))
+
+        # the turns of a socket are answered one at a time, in the order of their messages
+        async for event in ChatTurnService.astream(self.scope['user'], serializer.validated_data['content']):
+            await self.send_json(event.model_dump(mode='json'))
@@ -0,0 +1,114 @@
+"""
+    offline stand-ins of the LLM clients, used by the tests and benchmarks of the chat agents
+"""
+import asyncio
+import hashlib
+import math
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """
+        chat model streaming a fixed response word by word, waiting first_token_delay seconds before
+        its first token and token_delay seconds between the next ones (like a remote LLM would)
+    """
+
+    response: str = 'I am a dummy agent. I am not configured to answer questions yet.'
+    first_token_delay: float = 0.0
+    token_delay: float = 0.0
+    # accepted for compatibility with the ChatOpenAI constructor arguments
+    model_name: Optional[str] = None
+    openai_api_key: Optional[str] = None
+
+    @property
+    def _llm_type(self) -> str:
+        return 'fake-streaming-chat-model'
+
+    def _tokens(self) -> List[str]:
+        return re.findall(r'\s*\S+', self.response)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.first_token_delay + self.token_delay * max(0, len(self._tokens()) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.first_token_delay + self.token_delay * max(0, len(self._tokens()) - 1))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.response))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._tokens()):
+            time.sleep(self.token_delay if i else self.first_token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager: Any = None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        for i, token in enumerate(self._tokens()):
+            await asyncio.sleep(self.token_delay if i else self.first_token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+class FakeDelayedEmbeddings(Embeddings):
+    """
+        embeddings model answering after a fixed delay (like the embeddings API would), embedding every text
+        as the normalized hashed counts of its character trigrams so that near-duplicate texts get similar vectors
+    """
+
+    def __init__(self, delay: float = 0.0, size: int = 256):
+        self.delay = delay
+        self.size = size
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        padded = f'  {text.lower()} '
+        for i in range(len(padded) - 2):
+            digest = hashlib.blake2b(padded[i:i + 3].encode('utf-8'), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.size
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.delay)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.delay)
+        return self._embed(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.delay)
+        return self._embed(text)
+
+
+class FakeVectorStore:
+    """
+        vector store searching a fixed list of reference conversations after a fixed delay (like a pgvector scan would)
+    """
+
+    def __init__(self, embeddings: Embeddings, documents: List[Document], delay: float = 0.0, collection_name: str = 'fake-references'):
+        self.embeddings = embeddings
+        self.documents = documents
+        self.delay = delay
+        self.collection_name = collection_name
+        self.searches = 0
+        self._vectors = embeddings.embed_documents([document.page_content for document in documents])
+
+    def as_retriever(self):
+        return None
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4) -> List[Document]:
+        time.sleep(self.delay)
+        self.searches += 1
+        scores = [sum(x * y for x, y in zip(embedding, vector)) for vector in self._vectors]
+        ranked = sorted(range(len(self.documents)), key=lambda i: scores[i], reverse=True)
+        return [self.documents[i] for i in ranked[:k]]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k)
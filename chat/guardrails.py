@@ -0,0 +1,242 @@
+"""
+File used to define the input guardrails of the chatbot, matching the normalized patient messages against
+the blacklisted patterns compiled once per rule set
+"""
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+import uuid
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError: # python < 3.11
+    import sre_constants, sre_parse
+from typing import Dict, Iterable, List, Optional, Set
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from chat.enums import BLACKLIST_INPUTS
+from chat.models import GuardrailRule
+from core.db.search import ARABIC_BASE_LETTERS, ARABIC_IGNORED, ARABIC_VARIANTS, normalize_search_text
+
+logger = logging.getLogger(__name__)
+
+# cache key changed whenever the guardrail rules are updated, making the processes recompile their matcher
+GUARDRAIL_VERSION_KEY = 'chat:guardrails:version'
+
+_ARABIC_TABLE = str.maketrans(ARABIC_VARIANTS, ARABIC_BASE_LETTERS, ARABIC_IGNORED)
+
+
+def normalize_guardrail_text(text: str) -> str:
+    """
+        fold the case, accents, compatibility forms (e.g. full width letters), arabic diacritics,
+        tatweel and arabic letter variants of a message before matching it
+    """
+
+    if not text.isascii():
+        text = ''.join(char for char in unicodedata.normalize('NFKD', text) if not unicodedata.combining(char))
+
+    return normalize_search_text(text)
+
+
+def normalize_guardrail_pattern(pattern: str) -> str:
+    """fold the arabic letters of a pattern like the matched messages (its case is kept, since it may hold escapes like \\S)"""
+    return ''.join(char for char in unicodedata.normalize('NFKD', pattern) if not unicodedata.combining(char)).translate(_ARABIC_TABLE)
+
+
+def _required_literals(parsed) -> Optional[Set[str]]:
+    """
+        find literals of a parsed pattern one of which occurs in every text it matches, choosing
+        the most selective ones (the longest shortest literal)
+
+        @return: the lowercased literals, or None if the pattern requires no literal
+    """
+
+    best: Optional[Set[str]] = None
+    run: List[str] = []
+
+    def consider(literals: Optional[Set[str]]):
+        nonlocal best
+        if literals and (best is None or min(map(len, literals)) > min(map(len, best))):
+            best = literals
+
+    def flush():
+        if run:
+            consider({''.join(run).lower()})
+            run.clear()
+
+    for op, av in parsed:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+
+        flush()
+        if op is sre_constants.SUBPATTERN:
+            consider(_required_literals(av[-1]))
+        elif op is sre_constants.BRANCH:
+            # any branch may match, so one of the literals of every branch is required
+            alternatives = [_required_literals(branch) for branch in av[1]]
+            if all(alternatives):
+                consider(set().union(*alternatives))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            consider(_required_literals(av[2]))
+
+    flush()
+    return best
+
+
+class GuardrailMatcher:
+    """
+        guardrail rule set compiled once: every pattern is compiled (case insensitively, matched from the start of the
+        normalized text), and indexed by the literals it requires, so that a text is only matched against the
+        patterns whose literals it contains (and the patterns requiring none), stopping at the first matching one
+
+        NOTE: the patterns are not joined into one alternation, since the re module tries its branches one by
+        one at every position and has no multi-pattern automaton, which made a 1k pattern alternation slower
+        than matching the patterns in turn
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        """
+            @param patterns: the regular expressions of the rules, in their priority order (the invalid ones are skipped with a warning)
+        """
+
+        self.patterns: List[re.Pattern] = []
+        # required literal -> indexes of the patterns requiring it
+        self._keywords: Dict[str, List[int]] = {}
+        # indexes of the patterns requiring no literal, matched against every text
+        self._unfiltered: List[int] = []
+
+        for pattern in dict.fromkeys(patterns):
+            normalized = normalize_guardrail_pattern(pattern)
+            try:
+                compiled = re.compile(normalized, re.IGNORECASE)
+                literals = _required_literals(sre_parse.parse(normalized, re.IGNORECASE))
+            except re.error as error:
+                logger.warning('skipping the invalid guardrail pattern %r: %s', pattern, error)
+                continue
+
+            index = len(self.patterns)
+            self.patterns.append(compiled)
+            if literals is None:
+                self._unfiltered.append(index)
+            else:
+                for literal in literals:
+                    self._keywords.setdefault(literal, []).append(index)
+
+    def match(self, text: str) -> Optional[re.Pattern]:
+        """
+            @param text: the normalized text
+            @return: the first pattern matching the text, or None
+        """
+
+        candidates = set(self._unfiltered)
+        for literal, indexes in self._keywords.items():
+            if literal in text:
+                candidates.update(indexes)
+
+        for index in sorted(candidates):
+            if self.patterns[index].match(text):
+                return self.patterns[index]
+
+        return None
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+
+class GuardrailService:
+    """
+        Service used to block the abusive patient messages before they reach the chatbot. Every process keeps
+        the BLACKLIST_INPUTS and the active GuardrailRule patterns compiled into a single matcher, and
+        recompiles it when the shared guardrail version changed (checked at most every GUARDRAIL_SYNC_INTERVAL
+        seconds), so that the rules edited in the DB apply without restarting the processes
+
+        NOTE: the rules updated in bulk (without signals) apply once GuardrailService.bump_version() is called
+    """
+
+    _matcher: Optional[GuardrailMatcher] = None
+    _version: Optional[str] = None
+    _checked_at: float = 0.0
+    _loaded: bool = False
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _cache():
+        return caches[settings.FAST_CACHE_ALIAS]
+
+    @staticmethod
+    def _shared_version() -> str:
+        cache = GuardrailService._cache()
+        version = cache.get(GUARDRAIL_VERSION_KEY)
+        if version is None:
+            cache.add(GUARDRAIL_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(GUARDRAIL_VERSION_KEY)
+        return version
+
+    @staticmethod
+    def load_patterns() -> List[str]:
+        """the built-in patterns followed by the active rules of the DB"""
+        return [*BLACKLIST_INPUTS, *GuardrailRule.objects.filter(is_active=True).order_by('pk').values_list('pattern', flat=True)]
+
+    @staticmethod
+    def _is_fresh() -> bool:
+        return GuardrailService._loaded and time.monotonic() - GuardrailService._checked_at < settings.GUARDRAIL_SYNC_INTERVAL
+
+    @staticmethod
+    def matcher() -> GuardrailMatcher:
+        """get the compiled matcher of the process, recompiling it if the rules changed since it was compiled"""
+
+        service = GuardrailService
+        if service._is_fresh():
+            return service._matcher
+
+        version = service._shared_version()
+        with service._lock:
+            if not service._loaded or version != service._version:
+                service._matcher = GuardrailMatcher(service.load_patterns())
+                service._version = version
+                service._loaded = True
+            service._checked_at = time.monotonic()
+
+        return service._matcher
+
+    @staticmethod
+    def is_blocked(message: str) -> bool:
+        """check whether a patient message matches any of the guardrail patterns"""
+
+        return GuardrailService._match(GuardrailService.matcher(), message)
+
+    @staticmethod
+    async def ais_blocked(message: str) -> bool:
+        """async counterpart of is_blocked, only leaving the event loop when the matcher must be reloaded"""
+
+        if not GuardrailService._is_fresh():
+            await database_sync_to_async(GuardrailService.matcher)()
+
+        return GuardrailService._match(GuardrailService._matcher, message)
+
+    @staticmethod
+    def _match(matcher: Optional[GuardrailMatcher], message: str) -> bool:
+        return matcher is not None and matcher.match(normalize_guardrail_text(message)) is not None
+
+    @staticmethod
+    def clear():
+        """drop the matcher of the process, recompiled by the next check"""
+        with GuardrailService._lock:
+            GuardrailService._matcher = GuardrailService._version = None
+            GuardrailService._loaded = False
+
+    @staticmethod
+    def bump_version():
+        """make all the processes recompile their matcher once the rule changes are committed"""
+
+        def bump():
+            GuardrailService._cache().set(GUARDRAIL_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            # the process applying the change does not wait for its next check
+            GuardrailService._checked_at = -math.inf
+
+        transaction.on_commit(bump)
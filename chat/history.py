@@ -0,0 +1,184 @@
+"""
+File used to define the rolling chat history window of the users, read from two descending
+index scans and kept in the cache by appending every new message to it
+"""
+import time
+import uuid
+from typing import Dict, Iterable, List
+from django.conf import settings
+from django.core.cache import caches
+from authentication.models import User
+from chat.models import ChatMessage
+
+# seconds after which the lock of a window is released if its writer crashed
+APPEND_LOCK_TIMEOUT = 5
+
+
+class ChatHistoryService:
+    """
+        Service used to fetch the last messages sent or received by a user in a constant time.
+        The last CHAT_HISTORY_WINDOW_SIZE messages of every user are cached, appended on the
+        creation of every message, and loaded with two LIMIT queries served by the
+        (sender, created_at) and (receiver, created_at) indexes on a cache miss
+
+        NOTE: the messages soft deleted in bulk (without signals) may remain in the cached
+        windows until they expire after CHAT_HISTORY_CACHE_TIMEOUT seconds. The windows of the
+        chatbot users are dropped on every message rather than appended, since they take part in
+        every conversation (so every turn would contend for their lock), while the agents only
+        read the windows of the patients
+    """
+
+    @staticmethod
+    def _cache():
+        return caches[settings.FAST_CACHE_ALIAS]
+
+    @staticmethod
+    def cache_key(user_id: int) -> str:
+        return f'chat:history:{user_id}'
+
+    @staticmethod
+    def _serialize(message: ChatMessage) -> Dict:
+        return {
+            'id': message.pk,
+            'sender_id': message.sender_id,
+            'receiver_id': message.receiver_id,
+            'content': message.content,
+            'created_at': message.created_at,
+        }
+
+    @staticmethod
+    def load(user_id: int, history_len: int) -> List[ChatMessage]:
+        """
+            load the last messages of a user from the DB, using one descending index scan per direction
+
+            @return: the messages in chronological order
+        """
+
+        columns = ('id', 'sender_id', 'receiver_id', 'content', 'created_at')
+        sent = ChatMessage.objects.filter(sender_id=user_id).order_by('-created_at').only(*columns)[:history_len]
+        received = ChatMessage.objects.filter(receiver_id=user_id).order_by('-created_at').only(*columns)[:history_len]
+
+        # the messages a user sends to himself are returned by both scans
+        messages = {message.pk: message for message in [*sent, *received]}
+        return sorted(messages.values(), key=lambda message: (message.created_at, message.pk))[-history_len:]
+
+    @staticmethod
+    def get(user_id: int, history_len: int = 8) -> List[ChatMessage]:
+        """
+            get the last messages sent or received by a user
+
+            @param user_id: the id of the user
+            @param history_len: the number of returned messages
+            @return: the messages in chronological order
+        """
+
+        if history_len <= 0:
+            return []
+
+        window_size = settings.CHAT_HISTORY_WINDOW_SIZE
+        if history_len > window_size:
+            return ChatHistoryService.load(user_id, history_len)
+
+        cache = ChatHistoryService._cache()
+        window = cache.get(ChatHistoryService.cache_key(user_id))
+
+        if window is None:
+            window = ChatHistoryService._fill(user_id)
+
+        return [ChatMessage(**row) for row in window[-history_len:]]
+
+    @staticmethod
+    def generation_key(user_id: int) -> str:
+        return f'chat:history:{user_id}:generation'
+
+    @staticmethod
+    def _fill(user_id: int) -> List[Dict]:
+        """
+            load the window of a user and cache it, holding its lock so that no message is appended in between.
+            A window whose generation changed during the load (a message that could not be appended, or an
+            invalidation) is dropped again, since it may miss that change
+        """
+
+        cache = ChatHistoryService._cache()
+        key = ChatHistoryService.cache_key(user_id)
+        generation_key = ChatHistoryService.generation_key(user_id)
+        locked = ChatHistoryService._lock(f'{key}:lock', attempts=1)
+
+        try:
+            generation = cache.get(generation_key)
+            window = [ChatHistoryService._serialize(message) for message in ChatHistoryService.load(user_id, settings.CHAT_HISTORY_WINDOW_SIZE)]
+            # the window is only cached under its lock, and returned uncached otherwise
+            if locked:
+                cache.set(key, window, timeout=settings.CHAT_HISTORY_CACHE_TIMEOUT)
+                # checked after the write: a change racing the check deletes the window itself once it is written
+                if cache.get(generation_key) != generation:
+                    cache.delete(key)
+        finally:
+            if locked:
+                cache.delete(f'{key}:lock')
+
+        return window
+
+    @staticmethod
+    def _lock(key: str, attempts: int = 50) -> bool:
+        cache = ChatHistoryService._cache()
+        for _ in range(attempts):
+            if cache.add(key, 1, timeout=APPEND_LOCK_TIMEOUT):
+                return True
+            time.sleep(0.001)
+        return False
+
+    @staticmethod
+    def append(message: ChatMessage):
+        """
+            append a committed message to the cached windows of its sender and receiver (the missing windows are loaded on their next read),
+            dropping the windows of the chatbots instead
+        """
+
+        cache = ChatHistoryService._cache()
+        row = ChatHistoryService._serialize(message)
+        users = dict(User._base_manager.filter(pk__in={message.sender_id, message.receiver_id}).values_list('pk', 'is_bot'))
+
+        bot_ids = [user_id for user_id, is_bot in users.items() if is_bot]
+        if bot_ids:
+            ChatHistoryService.invalidate(bot_ids)
+
+        for user_id in (user_id for user_id, is_bot in users.items() if not is_bot):
+            key = ChatHistoryService.cache_key(user_id)
+            lock = f'{key}:lock'
+
+            # the appends to the same window are serialized, and a window still locked after the retries
+            # (e.g. by a crashed writer, or a slow load) is dropped rather than risking a lost message
+            if not ChatHistoryService._lock(lock):
+                ChatHistoryService.invalidate([user_id])
+                continue
+
+            try:
+                window = cache.get(key)
+                if window is None:
+                    # a load that started before the message was committed (e.g. after its lock expired) must not be cached
+                    ChatHistoryService._bump_generations([user_id])
+                # the window may have been loaded after the message was committed
+                elif all(item['id'] != row['id'] for item in window):
+                    window = sorted([*window, row], key=lambda item: (item['created_at'], item['id']))[-settings.CHAT_HISTORY_WINDOW_SIZE:]
+                    cache.set(key, window, timeout=settings.CHAT_HISTORY_CACHE_TIMEOUT)
+            finally:
+                cache.delete(lock)
+
+    @staticmethod
+    def _bump_generations(user_ids: Iterable[int]):
+        """make the windows being loaded for the given users be dropped once loaded"""
+
+        generation = uuid.uuid4().hex
+        ChatHistoryService._cache().set_many(
+            {ChatHistoryService.generation_key(user_id): generation for user_id in user_ids},
+            timeout=settings.CHAT_HISTORY_CACHE_TIMEOUT
+        )
+
+    @staticmethod
+    def invalidate(user_ids: Iterable[int]):
+        """drop the cached windows of the given users, including those being loaded"""
+
+        user_ids = list(user_ids)
+        ChatHistoryService._bump_generations(user_ids)
+        ChatHistoryService._cache().delete_many([ChatHistoryService.cache_key(user_id) for user_id in user_ids])
@@ -7,6 +7,7 @@ from langchain_core.documents import Document
 import json
 from langchain_community.vectorstores.pgvector import PGVector
 from langchain_openai import OpenAIEmbeddings
+from chat.retrieval import ReferenceCache
 from jusoor_backend.settings import env
 import pandas as pd
 import profanity_check
@@ -72,4 +73,7 @@ class Command(BaseCommand):
         # embed the documents in the vector DB
         vector_store.add_documents(results)
 
+        # the searches cached by the running processes may miss the imported references
+        ReferenceCache.invalidate()
+
    
\ No newline at end of file
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # the partial indexes are built concurrently to avoid locking the live tables
+    atomic = False
+
+    dependencies = [
+        ('chat', '0014_delete_chatroom'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='chatmessage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['sender', 'created_at'], name='chat_msg_sender_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='chatmessage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['receiver', 'created_at'], name='chat_msg_receiver_live_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # the partial index is built concurrently to avoid locking the live table
+    atomic = False
+
+    dependencies = [
+        ('chat', '0016_guardrailrule'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='chatmessage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['created_at', 'id'], name='chat_msg_keyset_live_idx'),
+        ),
+    ]
@@ -1,7 +1,10 @@
+import re
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.db.models import Q
 from chat.enums import FEEDBACK_STATUSES
 
+from core.db.indexes import live_index
 from core.models import StudentPatient, Therapist, TimeStampedModel
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator, MaxValueValidator
@@ -27,7 +30,13 @@ class ChatBot(TimeStampedModel):
         return self.name
     
     def get_agent(self, agent_cls):
-        return agent_cls(**self.get_config())
+        """
+            Method to get the agent of the bot, reused across messages from the process-wide agent registry
+        """
+
+        # imported here since the agents module depends on the chat models
+        from chat.agents import AgentRegistry
+        return AgentRegistry.get(self, agent_cls)
     
     def get_config(self):
         """
@@ -55,22 +64,32 @@ class ChatMessage(TimeStampedModel):
     # chat_room = models.ForeignKey(ChatRoom, on_delete=models.PROTECT, related_name='messages')
     read = models.BooleanField(default=False)
 
+    SOFT_DELETE_CASCADE = ('sentiment_result',)
+
 
     @staticmethod
     def get_chat_history(user, history_len: int = 8):
         """
-            Method to get the chat history between 2 users
+            Method to get the chat history between 2 users, from the rolling history window of the user
 
             @param user1: The used for whom the chat history is to be fetched
+            @return: the last history_len messages in chronological order
         """
 
-        queryset= ChatMessage.objects.filter(Q(sender=user) | Q(receiver=user)).order_by('created_at')    
-        starting_capture_idx = max(0, queryset.count() - history_len)
-
-        return queryset[starting_capture_idx:]
+        # imported here since the history service depends on the chat models
+        from chat.history import ChatHistoryService
+        return ChatHistoryService.get(user.pk, history_len)
     
     def __str__(self):
         return f'[MSG ID:{self.pk}] '
+
+    class Meta:
+        indexes = [
+            live_index(['sender', 'created_at'], name='chat_msg_sender_live_idx'),
+            live_index(['receiver', 'created_at'], name='chat_msg_receiver_live_idx'),
+            # the (created_at, id) order of the keyset pagination, scanned in both directions
+            live_index(['created_at', 'id'], name='chat_msg_keyset_live_idx'),
+        ]
     
 
 class ChatRoomFeedeback(TimeStampedModel):
@@ -80,6 +99,8 @@ class ChatRoomFeedeback(TimeStampedModel):
     feedback = models.TextField() # feedback from the patient
     # specifiyng the range of messages to be reported
     target_message = models.ForeignKey(ChatMessage, on_delete=models.PROTECT, related_name='message_feedbacks')
+
+    SOFT_DELETE_CASCADE = ('responses',)
     
 
 class ChatRoomFeedbackResponse(TimeStampedModel):
@@ -90,3 +111,42 @@ class ChatRoomFeedbackResponse(TimeStampedModel):
     feedback = models.ForeignKey(ChatRoomFeedeback, on_delete=models.PROTECT, related_name='responses')
     therapist = models.ForeignKey(Therapist, on_delete=models.PROTECT, related_name='feedback_responses')
     response = models.TextField() # response from the therapist
+
+
+class GuardrailRule(TimeStampedModel):
+    """
+        Model to store the regular expressions blocking the abusive patient messages before they reach the chatbot,
+        matched (case insensitively) from the start of the normalized message like the BLACKLIST_INPUTS patterns
+    """
+
+    pattern = models.TextField() ## regular expression matched against the normalized message
+    description = models.CharField(max_length=255, blank=True, default='')
+    is_active = models.BooleanField(default=True)
+
+    def __str__(self):
+        return self.description or self.pattern
+
+    def clean(self):
+        # imported here since the guardrails module loads the rules of this model
+        from chat.guardrails import normalize_guardrail_pattern
+
+        # validating the pattern compiled by the matcher, whose arabic letters and compatibility forms are folded
+        try:
+            re.compile(normalize_guardrail_pattern(self.pattern), re.IGNORECASE)
+        except re.error as error:
+            raise ValidationError({'pattern': str(error)})
+
+    def soft_delete(self):
+        from chat.guardrails import GuardrailService
+
+        # soft deletes send no signal, so the matchers are reloaded here
+        result = super().soft_delete()
+        GuardrailService.bump_version()
+        return result
+
+    def hard_delete(self):
+        from chat.guardrails import GuardrailService
+
+        result = super().hard_delete()
+        GuardrailService.bump_version()
+        return result
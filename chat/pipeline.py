@@ -0,0 +1,30 @@
+"""
+File used to define the helpers running the stages of the chatbot answer pipeline concurrently
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Optional
+from chat.types import StageTimings
+
+logger = logging.getLogger(__name__)
+
+
+async def run_stage(name: str, stage: Awaitable, timings: StageTimings, timeout: Optional[float] = None, fallback: Any = None) -> Any:
+    """
+        await a stage of the answer pipeline, recording its duration
+
+        @param name: the name of the stage within the timings
+        @param stage: the awaitable running the stage
+        @param timings: the timings of the pipeline
+        @param timeout: the seconds after which the stage is abandoned (no timeout if None)
+        @param fallback: the result used in place of an abandoned stage
+        @return: the result of the stage, or the fallback if it timed out
+    """
+
+    with timings.measure(name):
+        try:
+            return await asyncio.wait_for(stage, timeout)
+        except asyncio.TimeoutError:
+            logger.warning('chat pipeline stage %s timed out after %ss', name, timeout)
+            timings.timed_out.append(name)
+            return fallback
@@ -0,0 +1,178 @@
+"""
+File used to define the process-local cache of the reference conversations retrieved for the
+few-shot prompts of the chatbot, sparing the embeddings API call and the vector search of the
+short messages repeated across patients
+"""
+import math
+import re
+import threading
+import uuid
+from typing import Dict, List, Optional, Sequence, Tuple
+from django.conf import settings
+from django.core.cache import caches
+from langchain_core.documents import Document
+from chat.types import ReferenceCacheStats
+from core.db.search import normalize_search_text
+from core.utils.lru import LRUCache
+
+# cache key changed whenever the reference conversations are re-imported, making the processes drop their cached searches
+REFERENCE_VERSION_KEY = 'chat:references:version'
+# number of leading embedding dimensions whose signs key the near-duplicate tier
+QUANTIZED_DIMENSIONS = 16
+# number of embeddings kept per quantized key, compared to the searched embedding by cosine similarity
+BUCKET_SIZE = 8
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+
+
+class ReferenceCache:
+    """
+        Two-tier cache of the reference conversations found for a message: the first tier is keyed by the
+        normalized text of the message (checked before embedding it), and the second one by the sign
+        quantization of its embedding (checked before the vector search), confirming the near-duplicate
+        messages by the cosine similarity of their embeddings. Both tiers are bounded by REFERENCE_CACHE_SIZE
+        entries expiring after REFERENCE_CACHE_TIMEOUT seconds, and emptied once the shared reference version
+        changes (after every import of the reference conversations)
+
+        NOTE: the hit counters are kept per process
+    """
+
+    _exact: Optional[LRUCache] = None
+    _near: Optional[LRUCache] = None
+    _version: Optional[str] = None
+    _counts: Dict[str, int] = {'exact_hits': 0, 'near_hits': 0, 'misses': 0}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _cache():
+        return caches[settings.FAST_CACHE_ALIAS]
+
+    @staticmethod
+    def _tiers() -> Tuple[LRUCache, LRUCache]:
+        """the tiers of the process, rebuilt empty when the shared reference version changed"""
+
+        service = ReferenceCache
+        cache = service._cache()
+        version = cache.get(REFERENCE_VERSION_KEY)
+        if version is None:
+            cache.add(REFERENCE_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+            version = cache.get(REFERENCE_VERSION_KEY)
+
+        if service._exact is None or version != service._version:
+            with service._lock:
+                if service._exact is None or version != service._version:
+                    service._exact = LRUCache(settings.REFERENCE_CACHE_SIZE, settings.REFERENCE_CACHE_TIMEOUT)
+                    service._near = LRUCache(settings.REFERENCE_CACHE_SIZE, settings.REFERENCE_CACHE_TIMEOUT)
+                    service._version = version
+
+        return service._exact, service._near
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        """fold the case, arabic spelling variants, punctuation and whitespace of a message"""
+        return ' '.join(_PUNCTUATION.sub(' ', normalize_search_text(message)).split())
+
+    @staticmethod
+    def quantize(embedding: Sequence[float]) -> int:
+        """quantize an embedding into the sign bits of its leading dimensions"""
+        return sum(1 << i for i, value in enumerate(embedding[:QUANTIZED_DIMENSIONS]) if value > 0)
+
+    @staticmethod
+    def _similarity(first: Sequence[float], second: Sequence[float]) -> float:
+        norms = math.sqrt(sum(x * x for x in first)) * math.sqrt(sum(y * y for y in second))
+        return sum(x * y for x, y in zip(first, second)) / norms if norms else 0.0
+
+    @staticmethod
+    def _count(outcome: str):
+        with ReferenceCache._lock:
+            ReferenceCache._counts[outcome] += 1
+
+    @staticmethod
+    def lookup(collection: str, k: int, message: str) -> Optional[List[Document]]:
+        """
+            get the cached references of a message with the same normalized text
+
+            @return: the cached documents, or None on a miss (left to lookup_similar to count)
+        """
+
+        documents = ReferenceCache._tiers()[0].get((collection, k, ReferenceCache.normalize(message)))
+        if documents is not None:
+            ReferenceCache._count('exact_hits')
+        return documents
+
+    @staticmethod
+    def lookup_similar(collection: str, k: int, message: str, embedding: Sequence[float]) -> Optional[List[Document]]:
+        """
+            get the cached references of a near-duplicate message, caching them for the text of this message too
+
+            @return: the cached documents, or None on a miss
+        """
+
+        exact, near = ReferenceCache._tiers()
+        bucket = near.get((collection, k, ReferenceCache.quantize(embedding))) or []
+
+        for cached_embedding, documents in bucket:
+            if ReferenceCache._similarity(embedding, cached_embedding) >= settings.REFERENCE_CACHE_SIMILARITY:
+                ReferenceCache._count('near_hits')
+                exact.set((collection, k, ReferenceCache.normalize(message)), documents)
+                return documents
+
+        ReferenceCache._count('misses')
+        return None
+
+    @staticmethod
+    def store(collection: str, k: int, message: str, embedding: Sequence[float], documents: List[Document]):
+        """cache the references searched for a message in both tiers"""
+
+        exact, near = ReferenceCache._tiers()
+        exact.set((collection, k, ReferenceCache.normalize(message)), documents)
+
+        key = (collection, k, ReferenceCache.quantize(embedding))
+        bucket = near.get(key) or []
+        near.set(key, [*bucket, (list(embedding), documents)][-BUCKET_SIZE:])
+
+    @staticmethod
+    def search(vector_store, message: str, k: int = 1) -> List[Document]:
+        """
+            search the reference conversations of a message through the cache
+
+            @param vector_store: the vector store of the reference conversations (with its embeddings)
+            @param message: the message of the patient
+            @param k: the number of returned documents
+        """
+
+        collection = vector_store.collection_name
+        documents = ReferenceCache.lookup(collection, k, message)
+        if documents is not None:
+            return documents
+
+        embedding = vector_store.embeddings.embed_query(message)
+        documents = ReferenceCache.lookup_similar(collection, k, message, embedding)
+        if documents is None:
+            documents = vector_store.similarity_search_by_vector(embedding, k=k)
+            ReferenceCache.store(collection, k, message, embedding, documents)
+
+        return documents
+
+    @staticmethod
+    def invalidate():
+        """drop the cached searches of all the processes, after the reference conversations were re-imported"""
+
+        ReferenceCache._cache().set(REFERENCE_VERSION_KEY, uuid.uuid4().hex, timeout=None)
+        with ReferenceCache._lock:
+            ReferenceCache._exact = ReferenceCache._near = None
+
+    @staticmethod
+    def stats() -> ReferenceCacheStats:
+        """the hit counters of the process, and the number of cached entries"""
+
+        exact, near = ReferenceCache._exact, ReferenceCache._near
+        with ReferenceCache._lock:
+            counts = dict(ReferenceCache._counts)
+
+        return ReferenceCacheStats(**counts, size=(len(exact) if exact else 0) + (len(near) if near else 0))
+
+    @staticmethod
+    def reset_stats():
+        with ReferenceCache._lock:
+            ReferenceCache._counts = {'exact_hits': 0, 'near_hits': 0, 'misses': 0}
@@ -0,0 +1,41 @@
+"""
+    signal handlers used to drop the cached agents of the chatbots whose configuration changed,
+    to keep the cached chat history windows of the users up to date, and to reload the guardrail rules
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from chat.guardrails import GuardrailService
+from chat.history import ChatHistoryService
+from chat.models import ChatBot, ChatMessage, GuardrailRule
+
+
+@receiver(post_save, sender=ChatBot)
+@receiver(post_delete, sender=ChatBot)
+def invalidate_chatbot_agents(sender, instance, **kwargs):
+    """drop the agents of an updated or deleted chatbot from the registry of this process"""
+
+    # imported here to keep the LLM clients out of the processes that never load an agent
+    from chat.agents import AgentRegistry
+    AgentRegistry.invalidate(instance.pk)
+
+
+@receiver(post_save, sender=ChatMessage)
+def append_chat_history(sender, instance, created, **kwargs):
+    """append a new message to the history windows of its users once it is committed, and drop them when it is soft deleted"""
+
+    if created:
+        transaction.on_commit(lambda: ChatHistoryService.append(instance))
+    elif instance.deleted_at is not None:
+        ChatHistoryService.invalidate([instance.sender_id, instance.receiver_id])
+
+
+@receiver(post_delete, sender=ChatMessage)
+def invalidate_chat_history(sender, instance, **kwargs):
+    ChatHistoryService.invalidate([instance.sender_id, instance.receiver_id])
+
+
+@receiver(post_save, sender=GuardrailRule)
+@receiver(post_delete, sender=GuardrailRule)
+def reload_guardrails(sender, instance, **kwargs):
+    GuardrailService.bump_version()
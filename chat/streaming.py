@@ -0,0 +1,97 @@
+"""
+File used to define a chat turn between a patient and the chatbot, whose reply is streamed
+token by token (over the WebSocket consumer or the SSE endpoint) before being persisted
+"""
+import json
+import logging
+from typing import AsyncIterator, Tuple
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from django.db import transaction
+from authentication.models import User
+from chat.agents import AIAgent, get_agent_class
+from chat.chat_serializers.base import ChatMessageReadSerializer
+from chat.models import ChatBot, ChatMessage
+from chat.types import ChatWebSocketEvent, ChatWebSocketResponse, StageTimings
+from sentiment_ai.tasks import calculate_sentiment
+
+logger = logging.getLogger(__name__)
+
+
+class ChatTurnService:
+    """
+        Service used to run a chat turn: the message of the user is stored first, the reply of the
+        chatbot is generated (at once or as a stream of tokens), and the reply is stored once complete
+
+        NOTE: a stream interrupted before its end (e.g. a closed socket) stores no reply, and the
+        message of the user is then left unanswered like a failed blocking request would
+    """
+
+    @staticmethod
+    def start(user: User, content: str) -> Tuple[ChatBot, ChatMessage, AIAgent]:
+        """
+            store the message of a user and resolve the agent answering it
+
+            @return: the chatbot, the stored message of the user, and the agent of the chatbot
+        """
+
+        bot = ChatBot.objects.select_related('user_profile').first()
+        user_message = ChatMessage.objects.create(sender_id=user.pk, receiver=bot.user_profile, content=content)
+
+        return bot, user_message, bot.get_agent(get_agent_class())
+
+    @staticmethod
+    def finish(bot: ChatBot, user: User, user_message: ChatMessage, reply: str) -> ChatMessage:
+        """
+            store the complete reply of the chatbot, then enqueue the sentiment analysis of the message of the user
+
+            @return: the stored reply of the chatbot
+        """
+
+        with transaction.atomic():
+            bot_message = ChatMessage.objects.create(sender=bot.user_profile, receiver_id=user.pk, content=reply)
+            # the worker must find the committed messages of the turn
+            transaction.on_commit(lambda: calculate_sentiment.delay(user_message.id))
+
+        return bot_message
+
+    @staticmethod
+    def answer(user: User, content: str) -> Tuple[ChatMessage, StageTimings]:
+        """
+            run a blocking chat turn
+
+            @return: the stored reply of the chatbot, and the timings of the stages of its answer
+        """
+
+        bot, user_message, agent = ChatTurnService.start(user, content)
+        reply = async_to_sync(agent.aanswer)(user=user, message=content)
+        return ChatTurnService.finish(bot, user, user_message, reply.content), reply.timings
+
+    @staticmethod
+    async def astream(user: User, content: str) -> AsyncIterator[ChatWebSocketResponse]:
+        """
+            run a streamed chat turn, yielding a start event (with the id of the stored user message),
+            a content event per generated token, and an end event with the stored reply of the chatbot
+            (and the timings of the stages of its answer).
+            A failing turn ends with an error event instead
+        """
+
+        try:
+            bot, user_message, agent = await database_sync_to_async(ChatTurnService.start)(user, content)
+            yield ChatWebSocketResponse(event=ChatWebSocketEvent.START, data=json.dumps({'message_id': user_message.pk}))
+
+            tokens, timings = [], StageTimings()
+            async for token in agent.astream(user=user, message=content, timings=timings):
+                tokens.append(token)
+                yield ChatWebSocketResponse(event=ChatWebSocketEvent.CONTENT, data=token)
+
+            bot_message = await database_sync_to_async(ChatTurnService.finish)(bot, user, user_message, ''.join(tokens))
+            yield ChatWebSocketResponse(event=ChatWebSocketEvent.END, data=json.dumps(ChatMessageReadSerializer(bot_message).data, default=str), timings=timings)
+        except Exception:
+            logger.exception('chat turn of user %s failed', user.pk)
+            yield ChatWebSocketResponse(event=ChatWebSocketEvent.ERROR, data=json.dumps({'detail': 'the chatbot could not answer the message'}))
+
+    @staticmethod
+    def format_sse(response: ChatWebSocketResponse) -> str:
+        """format a chat event as a server-sent event, JSON encoding its data so tokens keep their spaces and newlines"""
+        return f'event: {response.event.value}\ndata: {json.dumps(response.data)}\n\n'
@@ -1,5 +1,36 @@
+import time
+from contextlib import contextmanager
 from enum import Enum
-from pydantic import BaseModel
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
+
+
+class StageTimings(BaseModel):
+    """
+        Used to profile the stages of the chatbot answer pipeline (durations in milliseconds)
+    """
+    stages: Dict[str, float] = {}
+    timed_out: List[str] = [] ## stages abandoned after their timeout, whose fallback was used
+
+    @contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[stage] = (time.perf_counter() - start) * 1000
+
+    def server_timing(self) -> str:
+        """format the stage durations as a Server-Timing header value"""
+        return ', '.join(f'{stage};dur={duration:.1f}' for stage, duration in self.stages.items())
+
+
+class ChatAnswer(BaseModel):
+    """
+        Used to return the answer of a chatbot agent along with the timings of its stages
+    """
+    content: str
+    timings: StageTimings = Field(default_factory=StageTimings)
 
 
 class ChatWebSocketEvent(str, Enum):
@@ -10,7 +41,24 @@ class ChatWebSocketEvent(str, Enum):
     START = "chat.message_start"
     CONTENT = "chat.message_content"
     END = "chat.message_end"
+    ERROR = "chat.message_error"
 
 class ChatWebSocketResponse(BaseModel):
     event: ChatWebSocketEvent = ChatWebSocketEvent.CONTENT
-    data: str
\ No newline at end of file
+    data: str
+    timings: Optional[StageTimings] = None ## sent with the end event
+
+
+class ReferenceCacheStats(BaseModel):
+    """
+        Used to report the hit rate of the reference conversations cache of a process
+    """
+    exact_hits: int = 0 ## messages with the same normalized text as a cached one
+    near_hits: int = 0 ## messages whose embedding is a near-duplicate of a cached one
+    misses: int = 0
+    size: int = 0 ## number of cached entries (both tiers)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.exact_hits + self.near_hits + self.misses
+        return (self.exact_hits + self.near_hits) / lookups if lookups else 0.0
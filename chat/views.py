@@ -1,20 +1,20 @@
 from rest_framework.decorators import action
 from authentication.permissions import IsPatient, IsTherapist
-from chat.agents import ChatGPTAgent, DummyAIAgent
-from chat.chat_serializers.base import ChatBotFullReadSerializer, ChatBotReadSerializer, ChatBotWriteSerializer, ChatMessageCreateSerializer, ChatMessageReadSerializer, ChatRoomReportReadSerializer, ReportChatroomCreateSerializer, ReviewChatRoomFeedbackSerializer
-from chat.chat_serializers.http import ChatBotFullRetrieveHttpSuccessSerializer, ChatBotListHttpSuccessResponseSerializer, ChatBotRetrieveHttpSuccessSerializer, ChatBotWriteSerializerSuccessSerializer, CreateChatRoomReportHttpSuccessSerializer,  HttpErrorCreateChatMessageSerializer, HttpErrorReportChatRoomFeedbackSerializer, HttpSuccessChatMessageReadSerializer, ListChatMessageHttpSuccessSerializer, ListChatRoomFeedbackResponseHttpSuccessResponseSerializer, ListChatRoomFeedbackResponseHttpSuccessSerializer,  ListReportChatroomReportHttpSuccessResposneSerializer, RetrieveChatRoomReportHttpSerializer, ReviewChatRoomFeedbackHttpErrorSerializer, ReviewChatRoomFeedbackHttpSuccessSerializer
+from chat.chat_serializers.base import ChatBotFullReadSerializer, ChatBotReadSerializer, ChatBotWriteSerializer, ChatMessageCreateSerializer, ChatMessageReadSerializer, ChatRoomReportReadSerializer, ReferenceCacheStatsSerializer, ReportChatroomCreateSerializer, ReviewChatRoomFeedbackSerializer
+from chat.chat_serializers.http import ChatBotFullRetrieveHttpSuccessSerializer, ChatBotListHttpSuccessResponseSerializer, ChatBotRetrieveHttpSuccessSerializer, ChatBotWriteSerializerSuccessSerializer, CreateChatRoomReportHttpSuccessSerializer,  HttpErrorCreateChatMessageSerializer, HttpErrorReportChatRoomFeedbackSerializer, HttpReferenceCacheStatsResponseSerializer, HttpSuccessChatMessageReadSerializer, ListChatMessageHttpSuccessSerializer, ListChatRoomFeedbackResponseHttpSuccessResponseSerializer, ListChatRoomFeedbackResponseHttpSuccessSerializer,  ListReportChatroomReportHttpSuccessResposneSerializer, RetrieveChatRoomReportHttpSerializer, ReviewChatRoomFeedbackHttpErrorSerializer, ReviewChatRoomFeedbackHttpSuccessSerializer
 from chat.models import ChatBot, ChatMessage,  ChatRoomFeedeback
+from chat.retrieval import ReferenceCache
+from chat.streaming import ChatTurnService
 from core.enums import QuerysetBranching, UserRole
 from core.querysets import OwnedQS, QSWrapper
-from core.viewssets import AugmentedViewSet, CustomPagination
+from core.viewssets import AugmentedViewSet, KeysetPagination
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin, CreateModelMixin, UpdateModelMixin, DestroyModelMixin
 from rest_framework.permissions import IsAdminUser
 from drf_yasg.utils import swagger_auto_schema
-from django.db import transaction
+from django.http import StreamingHttpResponse
 from django.utils.translation import gettext_lazy as _
-from jusoor_backend.settings import env
-from sentiment_ai.tasks import calculate_sentiment
 
 class ChatMessageViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin, CreateModelMixin):
     """
@@ -24,17 +24,19 @@ class ChatMessageViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin, C
     ordering_fields = ['created_at']
     ordering = ['-created_at']
     filterset_fields = ['sender', 'receiver', 'created_at']
-    pagination_class = CustomPagination
+    pagination_class = KeysetPagination
     action_permissions = {
         'list': [IsTherapist() | (IsPatient())],
         'retrieve': [IsTherapist() | (IsPatient())],
         'create': [IsPatient()],
+        'stream': [IsPatient()],
     }
 
     serializer_class_by_action = {
         'list': ChatMessageReadSerializer,
         'retrieve': ChatMessageReadSerializer,
         'create': ChatMessageCreateSerializer,
+        'stream': ChatMessageCreateSerializer,
     }
 
     # ownership queryset mapping
@@ -63,42 +65,44 @@ class ChatMessageViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin, C
         return super().retrieve(request, *args, **kwargs)
     
     
-    @transaction.atomic
     @swagger_auto_schema( responses={200: HttpSuccessChatMessageReadSerializer, 400: HttpErrorCreateChatMessageSerializer})
     def create(self, request, *args, **kwargs):
         """send a message and get a responsew by the chatbot
         
         ."""
 
-        # create the message
-        bot = ChatBot.objects.get(id=ChatBot.objects.first().id)
         serializer: ChatMessageCreateSerializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        data = serializer.data
+        # store the message, and the complete response of the chatbot (not within a transaction, since the
+        # stages of the agent reach the DB from the threads of database_sync_to_async, which close their connection)
+        msg, timings = ChatTurnService.answer(request.user, serializer.validated_data['content'])
 
-        user_message = ChatMessage.objects.create(
-            sender=request.user,
-            receiver=bot.user_profile,
-            content=data['content']
-            )
+        # the durations of the answer stages are exposed for profiling
+        return Response( ChatMessageReadSerializer(msg).data, status=201, headers={'Server-Timing': timings.server_timing()})
 
-        # return a resposne from the chatbot
-        agent = bot.get_agent(ChatGPTAgent if env('CONTEXT') != 'test' else DummyAIAgent)
-        bot_message = agent.answer(
-            user=request.user,
-            message=data['content']
+    @swagger_auto_schema( responses={200: 'text/event-stream of chat.message_start, chat.message_content, chat.message_end (or chat.message_error) events', 400: HttpErrorCreateChatMessageSerializer})
+    @action(detail=False, methods=['post'])
+    def stream(self, request, *args, **kwargs):
+        """send a message and stream the response of the chatbot token by token as server-sent events
 
-        )
-        # create the bot message
-        msg: ChatMessage = ChatMessage.objects.create(
-            sender=bot.user_profile,
-            receiver=request.user,
-            content=bot_message
-        )
+        .
+        """
+
+        serializer: ChatMessageCreateSerializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        user, content = request.user, serializer.validated_data['content']
 
-        calculate_sentiment.delay(user_message.id)
-        return Response( ChatMessageReadSerializer(msg).data, status=201)
+        async def events():
+            async for event in ChatTurnService.astream(user, content):
+                yield ChatTurnService.format_sse(event)
+
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        # the events must reach the client as they are generated, without any caching or proxy buffering
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 
 # class ChatRoomViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin, CreateModelMixin):
@@ -353,6 +357,32 @@ class ChatBotViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin, Creat
         .
         """
         return super().partial_update(request, *args, **kwargs)
-    
 
 
+class ReferenceCacheStatsViewset(AugmentedViewSet):
+    """
+        Admin-only viewset exposing the hit rate of the reference conversations cache of the serving worker process
+    """
+
+    action_permissions = {
+        'list': [IsAdminUser],
+        'reset': [IsAdminUser]
+    }
+
+    @swagger_auto_schema(responses={status.HTTP_200_OK: HttpReferenceCacheStatsResponseSerializer()})
+    def list(self, request, *args, **kwargs):
+        """
+            Get the hit counters, hit rate and size of the reference conversations cache
+        """
+
+        return Response(data=ReferenceCacheStatsSerializer(ReferenceCache.stats()).data)
+
+    @swagger_auto_schema(responses={status.HTTP_204_NO_CONTENT: None})
+    @action(detail=False, methods=['post'])
+    def reset(self, request, *args, **kwargs):
+        """
+            Reset the hit counters of the reference conversations cache
+        """
+
+        ReferenceCache.reset_stats()
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -0,0 +1,112 @@
+"""
+    File used to define the set-based cascade of soft and hard deletions across the
+    relations declared by the soft deletable models through SOFT_DELETE_CASCADE
+"""
+from datetime import datetime
+from typing import Callable, Dict, FrozenSet, List, Optional, Tuple
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import ModelSignal
+from django.db.models.fields.reverse_related import ForeignObjectRel
+from django.utils import timezone
+
+# name of the model attribute listing the reverse relations cascaded by deletions
+SOFT_DELETE_CASCADE_ATTR = 'SOFT_DELETE_CASCADE'
+
+# sent (with the queryset of the rows and whether the deletion is soft) before the rows of every model of a
+# cascade are deleted, since the UPDATE statements of the soft deletions send no post_delete signal
+cascade_pre_delete = ModelSignal(use_caching=True)
+
+
+def get_cascaded_relations(model) -> List[ForeignObjectRel]:
+    """
+        resolve the reverse relations declared in the SOFT_DELETE_CASCADE attribute of the model
+
+        @param model: the model whose deletions are cascaded
+    """
+
+    relations = []
+    for name in getattr(model, SOFT_DELETE_CASCADE_ATTR, ()):
+        rel = model._meta.get_field(name)
+
+        if not isinstance(rel, ForeignObjectRel) or rel.many_to_many:
+            raise ValueError(f'Invalid soft deletion cascade {model.__name__}.{name}: only reverse foreign key relations can be cascaded')
+
+        relations.append(rel)
+
+    return relations
+
+
+def _cascade(queryset: QuerySet, delete_level: Callable[[QuerySet], Dict[str, int]], live_only: bool, path: FrozenSet[type]) -> Dict[str, int]:
+    """
+        delete the related rows of every cascaded relation before the rows of the queryset itself,
+        so each related table is reached through a subquery on its (not yet deleted) parent rows
+
+        @param queryset: the rows deleted at this level of the relation graph
+        @param delete_level: callable deleting all the rows of a queryset, returning the number of deleted rows per model
+        @param live_only: whether to skip the related rows which are already soft deleted
+        @param path: the models visited from the root of the cascade, used to detect cycles
+    """
+
+    model = queryset.model
+    counts: Dict[str, int] = {}
+
+    def merge(level_counts: Dict[str, int]):
+        for label, count in level_counts.items():
+            counts[label] = counts.get(label, 0) + count
+
+    for rel in get_cascaded_relations(model):
+        related_model = rel.related_model
+
+        if related_model in path:
+            raise ValueError(f'Cyclic soft deletion cascade from {model.__name__} to {related_model.__name__}')
+
+        related_qs = related_model._base_manager.using(queryset.db).filter(**{
+            f'{rel.field.name}__in': queryset.values(rel.field.target_field.attname)
+        })
+        if live_only:
+            related_qs = related_qs.filter(deleted_at__isnull=True)
+
+        merge(_cascade(related_qs, delete_level, live_only, path | {related_model}))
+
+    if cascade_pre_delete.has_listeners(model):
+        cascade_pre_delete.send(sender=model, queryset=queryset, soft=live_only)
+    merge(delete_level(queryset))
+
+    return counts
+
+
+def cascade_soft_delete(queryset: QuerySet, deleted_at: Optional[datetime] = None) -> Tuple[int, Dict[str, int]]:
+    """
+        soft delete the rows of the queryset and all their live related rows reachable through the
+        declared cascades, using one UPDATE statement per related table of the relation graph
+
+        @param queryset: the rows to be soft deleted
+        @param deleted_at: the deletion timestamp shared by all the cascaded rows (defaults to now)
+        @return: the total number of soft deleted rows, and the number of soft deleted rows per model
+    """
+
+    deleted_at = deleted_at or timezone.now()
+
+    with transaction.atomic(using=queryset.db):
+        counts = _cascade(queryset, lambda qs: {qs.model._meta.label: QuerySet.update(qs, deleted_at=deleted_at)}, True, frozenset([queryset.model]))
+
+    return sum(counts.values()), counts
+
+
+def cascade_hard_delete(queryset: QuerySet) -> Tuple[int, Dict[str, int]]:
+    """
+        permanently delete the rows of the queryset and all their related rows (including soft deleted ones)
+        reachable through the declared cascades, one related table at a time
+
+        NOTE: the on_delete behaviour of the relations that are not declared in the cascades
+        is still enforced by the default Django deletion collector
+
+        @param queryset: the rows to be permanently deleted
+        @return: the total number of deleted rows, and the number of deleted rows per model
+    """
+
+    with transaction.atomic(using=queryset.db):
+        counts = _cascade(queryset, lambda qs: QuerySet.delete(qs)[1], False, frozenset([queryset.model]))
+
+    return sum(counts.values()), counts
@@ -0,0 +1,85 @@
+"""
+    File used to define the strategies counting the rows of paginated querysets
+"""
+import hashlib
+import json
+from typing import Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import QuerySet
+
+
+def estimate_count(queryset: QuerySet) -> Optional[int]:
+    """
+        estimate the number of rows of a queryset from the PostgreSQL planner statistics,
+        without scanning the rows
+
+        @return: the estimated row count, or None if no estimate is available
+    """
+
+    if connections[queryset.db].vendor != 'postgresql':
+        return None
+
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class CountStrategy:
+    """
+        strategy used by the paginator to count the rows of a queryset, using planner estimates
+        for large querysets and caching the counts of recently requested filters
+
+        @param exact_threshold: estimated row count under which the exact count is computed (None to always count exactly)
+        @param cache_timeout: seconds during which the count of the same filtered queryset is reused (0 disables caching)
+    """
+
+    def __init__(self, exact_threshold: Optional[int] = None, cache_timeout: int = 0):
+        self.exact_threshold = exact_threshold
+        self.cache_timeout = cache_timeout
+
+    def cache_key(self, sql: str, params) -> str:
+        digest = hashlib.sha1(f'{sql}|{params!r}'.encode()).hexdigest()
+        return f'count:{digest}'
+
+    def count(self, queryset: QuerySet) -> Tuple[int, bool]:
+        """
+            count the rows of the queryset
+
+            @return: the row count, and whether the count is approximate (a planner estimate, or a cached count that may be stale)
+        """
+
+        queryset = queryset.order_by()
+
+        try:
+            sql, params = queryset.query.sql_with_params()
+        except EmptyResultSet:
+            return 0, False
+
+        cache = caches[settings.FAST_CACHE_ALIAS]
+        key = self.cache_key(sql, params) if self.cache_timeout else None
+
+        if key is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                # the rows written since the count was cached are not reflected by it
+                return cached[0], True
+
+        estimate = estimate_count(queryset) if self.exact_threshold is not None else None
+        if estimate is not None and estimate >= self.exact_threshold:
+            result = (estimate, True)
+        else:
+            result = (queryset.count(), False)
+
+        if key is not None:
+            cache.set(key, result, self.cache_timeout)
+
+        return result
+
+
+# default strategy of the viewsets that do not configure one
+EXACT_COUNT = CountStrategy()
+
+# strategy of the viewsets listing large tables
+ESTIMATED_COUNT = CountStrategy(exact_threshold=settings.PAGINATION_EXACT_COUNT_THRESHOLD, cache_timeout=settings.PAGINATION_COUNT_CACHE_TIMEOUT)
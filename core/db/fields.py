@@ -1,5 +1,8 @@
+from typing import Iterable, List, Optional
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.db import models
+from django.db.models.query_utils import DeferredAttribute
+from authentication.services.encryption import get_encryption_service
 
 class ZeroToOneDecimalField(models.DecimalField):
     """
@@ -12,3 +15,77 @@ class ZeroToOneDecimalField(models.DecimalField):
         kwargs['blank'] = False
         kwargs['null'] = False
         super().__init__(*args, **kwargs)
+
+
+class Ciphertext(str):
+    """
+    A ciphertext read from an encrypted column and not decrypted yet, written back as is when saved
+    """
+
+
+class EncryptedAttribute(DeferredAttribute):
+    """
+    Model attribute of an encrypted field, decrypting the loaded ciphertext on its first access only
+    """
+
+    def __get__(self, instance, cls=None):
+        if instance is None:
+            return self
+
+        value = super().__get__(instance, cls)
+        if isinstance(value, Ciphertext):
+            value = get_encryption_service().decrypt(value)
+            instance.__dict__[self.field.attname] = value
+
+        return value
+
+    def __set__(self, instance, value):
+        # defined so that the attribute lookups always go through __get__, even once the value is loaded
+        instance.__dict__[self.field.attname] = value
+
+
+class EncryptedTextField(models.TextField):
+    """
+    A custom text field storing its values encrypted with AES256, and decrypting them lazily on attribute access
+
+    NOTE: the encrypted values cannot be filtered on, and values()/values_list() return their Ciphertext
+    (decrypted in bulk through the encryption service)
+    """
+    descriptor_class = EncryptedAttribute
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else Ciphertext(value)
+
+    def get_prep_value(self, value):
+        value = super().get_prep_value(value)
+
+        if value is None or isinstance(value, Ciphertext):
+            return None if value is None else str.__str__(value)
+
+        return get_encryption_service().encrypt(value)
+
+
+def bulk_decrypt(instances: Iterable[models.Model], field_names: Optional[Iterable[str]] = None) -> List[models.Model]:
+    """
+    Decrypt the encrypted fields of many model instances at once, reusing the derived key and running the
+    block cipher once per batch of values, instead of decrypting every value on its own first access
+
+    @param instances: the model instances (e.g. an evaluated queryset)
+    @param field_names: the names of the decrypted fields (all the encrypted fields by default)
+    @return: the list of the passed instances
+    """
+
+    instances = list(instances)
+    pending = []
+
+    for instance in instances:
+        for field in instance._meta.concrete_fields:
+            if isinstance(field, EncryptedTextField) and (field_names is None or field.name in field_names):
+                if isinstance(instance.__dict__.get(field.attname), Ciphertext):
+                    pending.append((instance, field.attname))
+
+    plaintexts = get_encryption_service().decrypt_many([instance.__dict__[attname] for instance, attname in pending])
+    for (instance, attname), plaintext in zip(pending, plaintexts):
+        instance.__dict__[attname] = plaintext
+
+    return instances
@@ -0,0 +1,18 @@
+"""
+    File used to define index helpers shared by the models
+"""
+from typing import Iterable
+from django.db import models
+from django.db.models import Q
+
+
+def live_index(fields: Iterable[str], name: str) -> models.Index:
+    """
+        create a partial index covering only the rows that are not soft deleted, which
+        matches the `deleted_at IS NULL` predicate added by the SoftDeletedManager to every query
+
+        @param fields: the indexed fields (ordering prefixed with '-' is supported)
+        @param name: the index name (at most 30 characters)
+    """
+
+    return models.Index(fields=list(fields), name=name, condition=Q(deleted_at__isnull=True))
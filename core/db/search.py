@@ -0,0 +1,75 @@
+"""
+    File used to define the typo tolerant text search of the user directory, ranked by trigram
+    similarity and served by the pg_trgm GIN indexes of the normalized user columns
+"""
+from functools import reduce
+from operator import or_
+from typing import Iterable
+from django.contrib.postgres.lookups import TrigramWordSimilar
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Func, Q, QuerySet, TextField, Value
+from django.db.models.functions import Greatest, Lower
+
+# arabic letter variants folded into their base letter (alef forms, taa marbuta, alef maqsura)
+ARABIC_VARIANTS = 'أإآٱةى'
+ARABIC_BASE_LETTERS = 'ااااهي'
+# arabic characters removed from the searched text (tatweel, harakat and superscript alef)
+ARABIC_IGNORED = '\u0640\u064b\u064c\u064d\u064e\u064f\u0650\u0651\u0652\u0670'
+
+# user columns searched by the user directory, each covered by a GIN index over its normalized value
+USER_SEARCH_FIELDS = ('username', 'email', 'first_name', 'last_name')
+
+_NORMALIZATION_TABLE = str.maketrans(ARABIC_VARIANTS, ARABIC_BASE_LETTERS, ARABIC_IGNORED)
+
+
+def normalize_search_text(text: str) -> str:
+    """lowercase a searched text and fold its arabic spelling variants, as done by the indexed column expressions"""
+    return text.strip().lower().translate(_NORMALIZATION_TABLE)
+
+
+class NormalizedText(Func):
+    """
+        SQL counterpart of normalize_search_text, matching the expressions of the trigram indexes
+        (TRANSLATE drops the characters of its second argument that have no counterpart in the third one)
+    """
+
+    function = 'TRANSLATE'
+    output_field = TextField()
+
+    def __init__(self, expression, **extra):
+        super().__init__(
+            Lower(expression), Value(ARABIC_VARIANTS + ARABIC_IGNORED), Value(ARABIC_BASE_LETTERS), **extra
+        )
+
+
+def trigram_search(queryset: QuerySet, fields: Iterable[str], term: str) -> QuerySet:
+    """
+        filter a queryset to the rows having a field that contains a word similar to the searched term,
+        ranked by their best word similarity
+
+        @param queryset: the searched queryset
+        @param fields: the searched text fields
+        @param term: the searched term
+        @return: the matching rows ordered by relevance (annotated with their search_rank)
+    """
+
+    fields = list(fields)
+    term = normalize_search_text(term)
+
+    # the word similarity operator (term <% text) is served by the GIN indexes, unlike a threshold on the similarity function
+    matches = [TrigramWordSimilar(NormalizedText(field), Value(term)) for field in fields]
+    similarities = [TrigramWordSimilarity(Value(term), NormalizedText(field)) for field in fields]
+    rank = Greatest(*similarities) if len(similarities) > 1 else similarities[0]
+
+    return queryset.filter(reduce(or_, [Q(match) for match in matches])).annotate(search_rank=rank).order_by('-search_rank', 'pk')
+
+
+def create_trigram_extension(using: str = DEFAULT_DB_ALIAS, **kwargs):
+    """
+        pre_migrate handler creating pg_trgm before the trigram indexes of the user table, since the test
+        databases are created from the model state without running the migrations (TEST MIGRATE False)
+    """
+
+    with connections[using].cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
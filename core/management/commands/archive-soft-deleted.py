@@ -0,0 +1,142 @@
+"""
+    command used to move the rows soft deleted for a long time out of the live tables into
+    per-model archive tables, keeping the live tables (and their indexes) small
+"""
+from datetime import timedelta
+from typing import Any, List, Optional, Set
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import connection, transaction
+from django.utils import timezone
+from core.models import TimeStampedModel
+
+# prefix of the archive table created for every archived model table
+ARCHIVE_TABLE_PREFIX = 'archive_'
+
+
+class Command(BaseCommand):
+
+    help = "Move the rows soft deleted more than N days ago into per-model archive tables, in resumable batches"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--days', '-d', type=int, default=90, help="Minimum number of days since the soft deletion of an archived row")
+        parser.add_argument('--batch-size', '-b', type=int, default=1000, help="Number of rows moved within a single transaction")
+        parser.add_argument('--max-batches', type=int, default=None, help="Maximum number of batches moved per model in this run")
+        parser.add_argument('--models', '-m', nargs='*', default=None, help="Archived models as app_label.ModelName (defaults to all soft deletable models except users)")
+        parser.add_argument('--dry-run', action='store_true', help="Only report the number of archivable rows per model")
+
+    def _get_models(self, labels: Optional[List[str]]) -> List[type]:
+        """resolve the archived models, ordered such that every model is archived before the models it references"""
+
+        if labels:
+            try:
+                models = [apps.get_model(label) for label in labels]
+            except (LookupError, ValueError) as e:
+                raise CommandError(str(e))
+
+            invalid = [model.__name__ for model in models if not issubclass(model, TimeStampedModel)]
+            if invalid:
+                raise CommandError(f'Models without soft deletion cannot be archived: {", ".join(invalid)}')
+        else:
+            models = [model for model in apps.get_models() if issubclass(model, TimeStampedModel) and model is not get_user_model()]
+
+        # a referenced row can only be archived after all its referencing rows, so the referencing models go first
+        selected = set(models)
+        ordered: List[type] = []
+        visited: Set[type] = set()
+
+        def visit(model):
+            if model in visited:
+                return
+            visited.add(model)
+
+            for rel in model._meta.related_objects:
+                if rel.related_model in selected:
+                    visit(rel.related_model)
+
+            ordered.append(model)
+
+        for model in models:
+            visit(model)
+
+        return ordered
+
+    def _archivable_ids(self, model, cutoff):
+        """
+            query the ids of the rows soft deleted before the cutoff that are no longer referenced
+            by any other row (including soft deleted ones, which have to be archived first)
+        """
+
+        queryset = model._base_manager.filter(deleted_at__lt=cutoff)
+
+        for rel in model._meta.related_objects:
+            queryset = queryset.filter(**{f'{rel.name}__isnull': True})
+
+        for field in model._meta.many_to_many:
+            queryset = queryset.filter(**{f'{field.name}__isnull': True})
+
+        return queryset.order_by('pk').values_list('pk', flat=True)
+
+    def _ensure_archive_table(self, model) -> str:
+        """create the archive table of the model with the same columns as the live table if missing"""
+
+        qn = connection.ops.quote_name
+        table = model._meta.db_table
+        archive_table = f'{ARCHIVE_TABLE_PREFIX}{table}'
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {qn(archive_table)} (LIKE {qn(table)} INCLUDING DEFAULTS)')
+            cursor.execute(f'ALTER TABLE {qn(archive_table)} ADD COLUMN IF NOT EXISTS archived_at timestamp with time zone NOT NULL DEFAULT now()')
+
+        return archive_table
+
+    def _move_batch(self, model, archive_table: str, cutoff, batch_size: int) -> int:
+        """
+            move one batch of archivable rows using a single statement, within its own transaction
+            so that an interrupted run keeps all the batches moved so far and resumes from there
+        """
+
+        qn = connection.ops.quote_name
+        columns = ', '.join(qn(field.column) for field in model._meta.concrete_fields)
+        ids_sql, params = self._archivable_ids(model, cutoff)[:batch_size].query.sql_with_params()
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'WITH moved AS ('
+                f'DELETE FROM {qn(model._meta.db_table)} WHERE {qn(model._meta.pk.column)} IN ({ids_sql}) RETURNING {columns}'
+                f') INSERT INTO {qn(archive_table)} ({columns}) SELECT {columns} FROM moved',
+                params
+            )
+
+            return cursor.rowcount
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        if connection.vendor != 'postgresql':
+            raise CommandError('Archiving soft deleted rows is only supported on PostgreSQL')
+
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        batch_size = options['batch_size']
+
+        for model in self._get_models(options['models']):
+            label = model._meta.label
+
+            if options['dry_run']:
+                self.stdout.write(f'{label}: {self._archivable_ids(model, cutoff).count()} archivable rows')
+                continue
+
+            archive_table = self._ensure_archive_table(model)
+            moved, batches = 0, 0
+
+            while options['max_batches'] is None or batches < options['max_batches']:
+                batch_moved = self._move_batch(model, archive_table, cutoff, batch_size)
+                moved += batch_moved
+                batches += 1
+
+                if batch_moved < batch_size:
+                    break
+
+            self.stdout.write(f'{label}: moved {moved} rows into {archive_table}', style_func=self.style.SUCCESS)
@@ -0,0 +1,78 @@
+"""
+    benchmark measuring the per-message overhead of resolving the chatbot and its agent,
+    building a new agent per message versus reusing the agents of the process-wide registry
+"""
+from functools import partial
+from typing import Any, List
+from django.core.management.base import BaseCommand, CommandParser
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_core.language_models import FakeListChatModel
+from chat.agents import AgentRegistry, ChatGPTAgent, DummyAIAgent, build_vector_store
+from chat.mock import ChatBotMocker
+from chat.models import ChatBot
+from core.mock import PatientMock
+from core.types import BenchmarkResult
+from core.utils.benchmark import format_results, run_benchmark
+
+STUB_ANSWER = 'stub answer'
+# collection of the stub embeddings, kept apart from the reference embeddings
+BENCHMARK_COLLECTION = 'benchmark-chat-agent'
+
+
+def stub_chat_model(**kwargs) -> FakeListChatModel:
+    """chat model answering instantly, standing for the OpenAI chat model"""
+    return FakeListChatModel(responses=[STUB_ANSWER])
+
+
+def stub_embeddings(**kwargs) -> FakeEmbeddings:
+    """embeddings model returning random vectors, standing for the OpenAI embeddings"""
+    return FakeEmbeddings(size=1536)
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the per-message overhead of building chat agents versus reusing them"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--iterations', '-i', type=int, default=50, help="Number of measured messages per scenario")
+        parser.add_argument('--skip-vector-store', action='store_true', help="Only benchmark the dummy agent (no pgvector database needed)")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        bot = ChatBotMocker.mock_instances(n=1)[0]
+        user = PatientMock.mock_instances(n=1)[0].user
+        iterations = options['iterations']
+        results: List[BenchmarkResult] = []
+
+        def legacy_message(agent_cls):
+            # previous message path: two chatbot queries, and a new agent (and API clients) per message
+            current = ChatBot.objects.get(id=ChatBot.objects.first().id)
+            return agent_cls(**current.get_config()).answer(user=user, message='hello')
+
+        def registry_message(agent_cls):
+            current = ChatBot.objects.select_related('user_profile').first()
+            return current.get_agent(agent_cls).answer(user=user, message='hello')
+
+        try:
+            AgentRegistry.clear()
+            results.append(run_benchmark('DummyAIAgent, new agent per message', lambda: legacy_message(DummyAIAgent), iterations))
+            results.append(run_benchmark('DummyAIAgent, agent registry', lambda: registry_message(DummyAIAgent), iterations))
+
+            if not options['skip_vector_store']:
+                # the legacy agents build their own vector store (and DB connection pool) on every message
+                per_message_agent = partial(ChatGPTAgent, chat_model=stub_chat_model, embeddings=stub_embeddings, collection_name=BENCHMARK_COLLECTION)
+                shared_store = build_vector_store(BENCHMARK_COLLECTION, stub_embeddings())
+                registry_agent = partial(ChatGPTAgent, chat_model=stub_chat_model, vector_store=shared_store)
+
+                results.append(run_benchmark('ChatGPTAgent (stub LLM), new agent per message', lambda: legacy_message(per_message_agent), iterations))
+                results.append(run_benchmark('ChatGPTAgent (stub LLM), agent registry', lambda: registry_message(registry_agent), iterations))
+
+            self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
+        finally:
+            AgentRegistry.clear()
+            bot_user = bot.user_profile
+            bot.delete()
+            bot_user.delete()
+            user.delete()
@@ -0,0 +1,72 @@
+"""
+    benchmark measuring the latency of fetching the last messages of a user as the
+    conversation grows, comparing the count and OFFSET slicing to the indexed history window
+"""
+from typing import Any, List
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandParser
+from django.db.models import Q
+from chat.history import ChatHistoryService
+from chat.mock import ChatBotMocker
+from chat.models import ChatMessage
+from core.mock import PatientMock
+from core.types import BenchmarkResult
+from core.utils.benchmark import format_results, run_benchmark
+
+# number of messages written by every bulk insert
+SEED_BATCH_SIZE = 5000
+
+
+def legacy_history(user, history_len: int):
+    """previous history fetch: a count of the whole conversation, then an OFFSET slice"""
+
+    queryset = ChatMessage.objects.filter(Q(sender=user) | Q(receiver=user)).order_by('created_at')
+    return list(queryset[max(0, queryset.count() - history_len):])
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark fetching the chat history of a user against growing conversations"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--sizes', type=int, nargs='*', default=[100, 10000, 100000], help="Numbers of messages of the conversation")
+        parser.add_argument('--history', type=int, default=8, help="Number of fetched messages")
+        parser.add_argument('--iterations', '-i', type=int, default=50, help="Number of measured runs per benchmark")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        user = PatientMock.mock_instances(n=1)[0].user
+        bot = ChatBotMocker.mock_instances(n=1)[0]
+        cache = caches[settings.FAST_CACHE_ALIAS]
+        history_len, iterations = options['history'], options['iterations']
+        results: List[BenchmarkResult] = []
+
+        try:
+            written = 0
+            for size in sorted(options['sizes']):
+                for start in range(written, size, SEED_BATCH_SIZE):
+                    ChatMessage.objects.bulk_create([
+                        ChatMessage(content=f'message {i}', sender=user if i % 2 else bot.user_profile, receiver=bot.user_profile if i % 2 else user)
+                        for i in range(start, min(start + SEED_BATCH_SIZE, size))
+                    ])
+                written = max(written, size)
+
+                def cold():
+                    cache.delete(ChatHistoryService.cache_key(user.pk))
+                    return ChatHistoryService.get(user.pk, history_len)
+
+                results.append(run_benchmark(f'count + OFFSET ({size} messages)', lambda: legacy_history(user, history_len), iterations))
+                results.append(run_benchmark(f'index scans, cold window ({size} messages)', cold, iterations))
+                results.append(run_benchmark(f'cached window ({size} messages)', lambda: ChatHistoryService.get(user.pk, history_len), iterations))
+
+            self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
+        finally:
+            ChatHistoryService.invalidate([user.pk, bot.user_profile_id])
+            ChatMessage.objects.filter(Q(sender=user) | Q(receiver=user)).delete()
+            bot_user = bot.user_profile
+            bot.delete()
+            bot_user.delete()
+            user.delete()
@@ -0,0 +1,67 @@
+"""
+    benchmark measuring the critical path of preparing the chatbot prompt, running the history,
+    embedding and vector search stages one after another versus concurrently (stubbed stages)
+"""
+import itertools
+import time
+from functools import partial
+from typing import Any, List
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandParser
+from langchain_core.documents import Document
+from chat.agents import ChatGPTAgent
+from chat.fakes import FakeDelayedEmbeddings, FakeStreamingChatModel, FakeVectorStore
+from chat.types import StageTimings
+from core.types import BenchmarkResult
+from core.utils.benchmark import format_results, run_benchmark
+
+REFERENCES = [Document(page_content='I feel anxious before my exams', metadata={'response': 'That sounds stressful, what helps you relax?'})]
+
+
+class StubHistoryAgent(ChatGPTAgent):
+    """agent loading its history after a fixed delay, standing for the chat history query"""
+
+    history_delay = 0.0
+
+    def _retrieve_history(self, user):
+        time.sleep(self.history_delay)
+        return []
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the prompt preparation of the chatbot (sequential versus concurrent stages)"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--history-delay', type=float, default=0.03, help="Simulated history query latency (seconds)")
+        parser.add_argument('--embedding-delay', type=float, default=0.15, help="Simulated embeddings API latency (seconds)")
+        parser.add_argument('--search-delay', type=float, default=0.05, help="Simulated vector search latency (seconds)")
+        parser.add_argument('--iterations', '-i', type=int, default=20, help="Number of measured runs per benchmark")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        StubHistoryAgent.history_delay = options['history_delay']
+        agent = StubHistoryAgent(
+            prompt='You are a supportive assistant. {reference_message}',
+            chat_model=partial(FakeStreamingChatModel, response='stub answer'),
+            vector_store=FakeVectorStore(FakeDelayedEmbeddings(options['embedding_delay']), REFERENCES, options['search_delay']),
+        )
+        iterations = options['iterations']
+        last_timings = StageTimings()
+        # every run sends a new message, so that no search is served by the reference cache
+        messages = (f'I cannot sleep before my exams {i}' for i in itertools.count())
+
+        def concurrent():
+            nonlocal last_timings
+            last_timings = StageTimings()
+            return async_to_sync(agent.aprepare)(None, next(messages), last_timings)
+
+        results: List[BenchmarkResult] = [
+            run_benchmark('sequential stages', lambda: agent._prepare_messages(None, next(messages)), iterations),
+            run_benchmark('concurrent stages', concurrent, iterations),
+        ]
+
+        self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
+        self.stdout.write('stage timings of the last concurrent run: ' + last_timings.server_timing())
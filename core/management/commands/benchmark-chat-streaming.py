@@ -0,0 +1,74 @@
+"""
+    benchmark measuring the time until a patient sees the first words of the chatbot reply,
+    comparing the blocking answer to the streamed tokens of a simulated LLM (no API calls)
+"""
+import statistics
+import time
+from typing import Any, Callable, List
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandParser
+from chat.agents import DummyAIAgent
+from chat.fakes import FakeStreamingChatModel
+from core.types import BenchmarkResult
+from core.utils.benchmark import format_results, percentile
+
+# reply of the simulated LLM (around 60 tokens, like an average chatbot reply)
+REPLY = ' '.join(['I hear you, and it is completely understandable to feel this way.'] * 5)
+
+
+def summarize(label: str, timings: List[float]) -> BenchmarkResult:
+    return BenchmarkResult(
+        label=label, iterations=len(timings), queries=0,
+        mean_ms=statistics.fmean(timings), p50_ms=percentile(timings, 50), p95_ms=percentile(timings, 95),
+    )
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the time to the first token of the chatbot reply (blocking versus streamed)"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--first-token-delay', type=float, default=0.5, help="Simulated LLM latency before the first token (seconds)")
+        parser.add_argument('--token-delay', type=float, default=0.02, help="Simulated LLM latency between two tokens (seconds)")
+        parser.add_argument('--iterations', '-i', type=int, default=10, help="Number of measured replies per scenario")
+
+    def _measure(self, iterations: int, function: Callable[[], Any]) -> List[float]:
+        timings = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        model = FakeStreamingChatModel(response=REPLY, first_token_delay=options['first_token_delay'], token_delay=options['token_delay'])
+        agent = DummyAIAgent(streaming_model=model)
+        iterations = options['iterations']
+
+        first_tokens: List[float] = []
+        full_streams: List[float] = []
+
+        async def stream():
+            start = time.perf_counter()
+            first = None
+            async for _ in agent.astream(user=None, message='hello'):
+                if first is None:
+                    first = time.perf_counter()
+            first_tokens.append((first - start) * 1000)
+            full_streams.append((time.perf_counter() - start) * 1000)
+
+        # the blocking endpoint shows nothing until the whole reply is generated
+        blocking = self._measure(iterations, lambda: agent.answer(user=None, message='hello'))
+        for _ in range(iterations):
+            async_to_sync(stream)()
+
+        results = [
+            summarize('blocking answer, first visible token', blocking),
+            summarize('streamed answer, first token', first_tokens),
+            summarize('streamed answer, last token', full_streams),
+        ]
+
+        self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
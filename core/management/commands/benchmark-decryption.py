@@ -0,0 +1,66 @@
+"""
+    benchmark comparing the per-row decryption of encrypted model fields against
+    their bulk decryption, over in-memory model instances (no DB round trips)
+"""
+import random
+import statistics
+import time
+from typing import Any, Callable, List
+from django.core.management.base import BaseCommand, CommandParser
+from authentication.services.encryption import AES256EncryptionService, get_encryption_service
+from core.db.fields import Ciphertext, bulk_decrypt
+from sentiment_ai.models import SentimentReport
+
+# vocabulary used to build the encrypted texts (mixing arabic and english words like the real highlights)
+WORDS = ['patient', 'anxiety', 'sleep', 'exams', 'family', 'support', 'قلق', 'نوم', 'امتحانات', 'دعم', 'عائلة', 'therapy']
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark decrypting the encrypted fields of many rows, per row versus in bulk"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--rows', '-n', type=int, default=100000, help="Number of decrypted rows")
+        parser.add_argument('--words', type=int, default=60, help="Number of words of every encrypted text")
+        parser.add_argument('--iterations', '-i', type=int, default=3, help="Number of measured runs per strategy")
+
+    def _instances(self, ciphertexts: List[str]) -> List[SentimentReport]:
+        """build unsaved reports holding the ciphertexts the same way the rows loaded from the DB do"""
+        return [SentimentReport(conversation_highlights=Ciphertext(ciphertext)) for ciphertext in ciphertexts]
+
+    def _measure(self, label: str, ciphertexts: List[str], decrypt: Callable[[List[SentimentReport]], Any], iterations: int):
+
+        timings = []
+        for _ in range(iterations):
+            instances = self._instances(ciphertexts)
+
+            started = time.perf_counter()
+            decrypt(instances)
+            timings.append(time.perf_counter() - started)
+
+        elapsed = statistics.fmean(timings)
+        self.stdout.write(f'{label:<45} {elapsed * 1000:>12.1f} {len(ciphertexts) / elapsed:>12,.0f}', style_func=self.style.SUCCESS)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        rng = random.Random(0)
+        service = get_encryption_service()
+        plaintexts = [' '.join(rng.choices(WORDS, k=options['words'])) for _ in range(options['rows'])]
+        ciphertexts = [service.encrypt(plaintext) for plaintext in plaintexts]
+
+        # the bulk decryption must match the per-row one
+        assert bulk_decrypt(self._instances(ciphertexts[:100]))[0].conversation_highlights == plaintexts[0]
+
+        header = f'{"strategy":<45} {"total(ms)":>12} {"rows/s":>12}'
+        self.stdout.write('\n'.join([header, '-' * len(header)]))
+
+        iterations = max(1, options['iterations'])
+        self._measure(
+            'per row, key derived per call', ciphertexts,
+            lambda instances: [AES256EncryptionService().decrypt(str.__str__(instance.__dict__['conversation_highlights'])) for instance in instances],
+            iterations
+        )
+        self._measure('lazy attribute access', ciphertexts, lambda instances: [instance.conversation_highlights for instance in instances], iterations)
+        self._measure('bulk_decrypt', ciphertexts, bulk_decrypt, iterations)
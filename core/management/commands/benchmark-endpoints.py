@@ -0,0 +1,193 @@
+"""
+    benchmark suite measuring the latency, SQL queries and response size of every read endpoint
+    of the AugmentedViewSets against configurable volumes of mocked data
+"""
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.db import transaction
+from django.urls import URLPattern, URLResolver, get_resolver, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+from appointments.mock import AppointmentMocker
+from authentication.models import User
+from chat.mock import ChatBotMocker, ChatMessageMocker
+from core.mock import PatientMock, TherapistMock
+from core.models import StudentPatient, Therapist
+from core.types import BenchmarkResult
+from core.utils.benchmark import compare_results, format_results, load_baseline, run_benchmark, save_baseline
+from core.viewssets import AugmentedViewSet
+from sentiment_ai.mock import SentimentReportMocker
+from surveys.mock import TherapistSurveyMocker
+
+# host accepted by the ALLOWED_HOSTS setting, used to build the pagination links
+BENCHMARK_HOST = 'localhost'
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the p50/p95 latency, queries per request and response bytes of every AugmentedViewSet read endpoint"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--iterations', '-i', type=int, default=20, help="Number of measured requests per endpoint and role")
+        parser.add_argument('--patients', type=int, default=50, help="Number of mocked patients")
+        parser.add_argument('--therapists', type=int, default=5, help="Number of mocked therapists")
+        parser.add_argument('--messages', type=int, default=2000, help="Number of mocked chat messages (split over the patients)")
+        parser.add_argument('--appointments', type=int, default=200, help="Number of mocked appointments")
+        parser.add_argument('--reports', type=int, default=20, help="Number of mocked sentiment reports of the benchmarked patient")
+        parser.add_argument('--surveys', type=int, default=5, help="Number of mocked therapist surveys (with responses)")
+        parser.add_argument('--no-seed', action='store_true', help="Benchmark against the existing DB records without mocking any data")
+        parser.add_argument('--keep', action='store_true', help="Keep the mocked records instead of rolling them back")
+        parser.add_argument('--only', nargs='*', default=None, help="Only benchmark the given viewsets (by class name)")
+        parser.add_argument('--save-baseline', type=str, default=None, help="Path of a JSON file to store the results as a baseline")
+        parser.add_argument('--baseline', type=str, default=None, help="Path of a JSON baseline to compare the results against")
+        parser.add_argument('--threshold', type=float, default=10.0, help="Allowed p95 latency increase (%%) over the baseline")
+
+    # ---------------- seeding ----------------
+
+    def _seed(self, options: Dict) -> Tuple[User, User]:
+        """mock the benchmarked volumes, returning the benchmarked patient and therapist users"""
+
+        self.stdout.write('mocking benchmark records..')
+
+        patients = PatientMock.mock_instances(n=max(1, options['patients']))
+        therapists = TherapistMock.mock_instances(n=max(1, options['therapists']))
+        bot = ChatBotMocker.mock_instances(n=1)[0]
+
+        # the benchmarked patient receives the same share of the records as every other patient
+        pairs_per_patient = max(1, options['messages'] // (2 * len(patients)))
+        for patient in patients:
+            ChatMessageMocker.mock_instances(pairs_per_patient, user=patient.user, bot=bot)
+
+        appointments_per_therapist = max(1, options['appointments'] // len(therapists))
+        for i, therapist in enumerate(therapists):
+            AppointmentMocker.mock_instances(n=appointments_per_therapist, fixed_patient=patients[i % len(patients)], fixed_therapist=therapist)
+
+        if options['reports']:
+            SentimentReportMocker.mock_instances(n=1, n_messages=options['reports'], fixed_user=patients[0].user)
+        if options['surveys']:
+            TherapistSurveyMocker.mock_instances(survey_n=options['surveys'], include_responses=True)
+
+        return patients[0].user, therapists[0].user
+
+    def _existing_users(self) -> Tuple[User, User]:
+
+        patient = StudentPatient.objects.select_related('user').first()
+        therapist = Therapist.objects.select_related('user').first()
+
+        if patient is None or therapist is None:
+            raise CommandError('At least one patient and one therapist are needed to run the benchmark without seeding')
+
+        return patient.user, therapist.user
+
+    # ---------------- endpoint discovery ----------------
+
+    def _iter_patterns(self, patterns) -> Iterator[URLPattern]:
+
+        for pattern in patterns:
+            if isinstance(pattern, URLResolver):
+                yield from self._iter_patterns(pattern.url_patterns)
+            else:
+                yield pattern
+
+    def _discover_endpoints(self, only: Optional[List[str]]) -> List[Tuple[URLPattern, type, str, bool]]:
+        """
+            find the read (GET) actions of every AugmentedViewSet routed in the URL conf
+
+            @return: the URL pattern, viewset class, action name, and whether the action is a detail action
+        """
+
+        endpoints, seen = [], set()
+
+        for pattern in self._iter_patterns(get_resolver().url_patterns):
+            viewset = getattr(pattern.callback, 'cls', None)
+            actions = getattr(pattern.callback, 'actions', None) or {}
+
+            if viewset is None or not issubclass(viewset, AugmentedViewSet) or 'get' not in actions:
+                continue
+            if only and viewset.__name__ not in only:
+                continue
+
+            # the format suffix patterns of the default routers route to the same actions
+            key = (viewset, actions['get'])
+            if key in seen or 'format' in pattern.pattern.regex.groupindex:
+                continue
+            seen.add(key)
+
+            lookup_kwarg = viewset.lookup_url_kwarg or viewset.lookup_field
+            endpoints.append((pattern, viewset, actions['get'], lookup_kwarg in pattern.pattern.regex.groupindex))
+
+        return endpoints
+
+    def _detail_pk(self, viewset, action: str, user: User) -> Optional[Any]:
+        """pick the first record visible to the user through the viewset queryset of the action"""
+
+        view = viewset()
+        view.action = action
+        view.request = SimpleNamespace(user=user)
+
+        try:
+            return view.get_queryset().values_list('pk', flat=True).first()
+        except Exception:
+            return None
+
+    # ---------------- measurement ----------------
+
+    def _request(self, pattern: URLPattern, viewset, action: str, user: User, kwargs: Dict):
+
+        request = APIRequestFactory(SERVER_NAME=BENCHMARK_HOST).get(reverse(pattern.name, kwargs=kwargs))
+        force_authenticate(request, user=User.objects.get(pk=user.pk))
+
+        response = pattern.callback(request, **kwargs)
+        # rendering the response is part of the served request
+        response.render()
+
+        return response
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        with transaction.atomic():
+            patient_user, therapist_user = self._existing_users() if options['no_seed'] else self._seed(options)
+
+            results: List[BenchmarkResult] = []
+            for pattern, viewset, action, detail in self._discover_endpoints(options['only']):
+                for role, user in (('patient', patient_user), ('therapist', therapist_user)):
+                    label = f'{viewset.__name__}.{action} ({role})'
+                    kwargs = {}
+
+                    if detail:
+                        pk = self._detail_pk(viewset, action, user)
+                        if pk is None:
+                            self.stdout.write(f'skipping {label}: no visible record')
+                            continue
+                        kwargs[viewset.lookup_url_kwarg or viewset.lookup_field] = pk
+
+                    # endpoints rejecting the role are not benchmarked for it
+                    status_code = self._request(pattern, viewset, action, user, kwargs).status_code
+                    if status_code >= 400:
+                        self.stdout.write(f'skipping {label}: HTTP {status_code}')
+                        continue
+
+                    results.append(run_benchmark(
+                        label,
+                        lambda: self._request(pattern, viewset, action, user, kwargs),
+                        iterations=options['iterations'],
+                        warmup=0
+                    ))
+
+            self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
+
+            if not options['keep']:
+                transaction.set_rollback(True)
+
+        if options['save_baseline']:
+            save_baseline(results, options['save_baseline'])
+            self.stdout.write(f'baseline saved to {options["save_baseline"]}')
+
+        if options['baseline']:
+            table, regressions = compare_results(results, load_baseline(options['baseline']), threshold=options['threshold'])
+            self.stdout.write(table)
+
+            if regressions:
+                raise CommandError(f'{len(regressions)} endpoints regressed: {", ".join(regressions)}')
@@ -0,0 +1,82 @@
+"""
+    load benchmark measuring how many logins per second a single ASGI worker can serve,
+    firing concurrent login requests through the Django ASGI handler
+"""
+import asyncio
+import statistics
+import time
+import uuid
+from typing import Any, Dict, List
+from asgiref.sync import async_to_sync
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandParser
+from django.test import AsyncClient
+from django.urls import reverse
+from authentication.models import User
+from core.utils.benchmark import percentile
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the throughput of concurrent logins served by one ASGI worker"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--logins', '-n', type=int, default=200, help="Number of measured logins per concurrency level")
+        parser.add_argument('--concurrency', '-c', type=int, nargs='*', default=[1, 8, 32, 128], help="Numbers of logins in flight at once")
+        parser.add_argument('--users', type=int, default=50, help="Number of mocked users logging in")
+        parser.add_argument('--password', type=str, default='benchmark-password', help="Password shared by the mocked users")
+
+    async def _login(self, client: AsyncClient, url: str, email: str, password: str, semaphore: asyncio.Semaphore) -> float:
+        """perform a login request, returning its latency in ms or -1 if it failed"""
+
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(url, {'email': email, 'password': password}, content_type='application/json')
+            latency = (time.perf_counter() - started) * 1000
+
+        return latency if response.status_code == 200 else -1
+
+    async def _run(self, emails: List[str], concurrency: int, options: Dict) -> Dict[str, float]:
+
+        client, url = AsyncClient(), reverse('auth-login')
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        n = options['logins']
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*[self._login(client, url, emails[i % len(emails)], options['password'], semaphore) for i in range(n)])
+        elapsed = time.perf_counter() - started
+
+        succeeded = [latency for latency in latencies if latency >= 0]
+        return {
+            'rate': len(succeeded) / max(elapsed, 1e-9),
+            'mean': statistics.fmean(succeeded) if succeeded else 0.0,
+            'p50': percentile(succeeded, 50),
+            'p95': percentile(succeeded, 95),
+            'failed': n - len(succeeded),
+        }
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        # the requests are served by other threads, so the mocked users are committed and removed afterwards
+        run_id = uuid.uuid4().hex[:8]
+        password_hash = make_password(options['password'])
+        users = User.objects.bulk_create([
+            User(username=f'login benchmark {i}', email=f'login-{run_id}-{i}@benchmark.jusoor.test', password=password_hash)
+            for i in range(max(1, options['users']))
+        ])
+        emails = [user.email for user in users]
+
+        try:
+            header = f'{"concurrency":>11} {"logins/s":>10} {"mean(ms)":>10} {"p50(ms)":>10} {"p95(ms)":>10} {"failed":>7}'
+            self.stdout.write('\n'.join([header, '-' * len(header)]))
+
+            for concurrency in options['concurrency']:
+                stats = async_to_sync(self._run)(emails, concurrency, options)
+                self.stdout.write(
+                    f'{concurrency:>11} {stats["rate"]:>10,.1f} {stats["mean"]:>10.2f} {stats["p50"]:>10.2f} {stats["p95"]:>10.2f} {stats["failed"]:>7}',
+                    style_func=self.style.SUCCESS
+                )
+        finally:
+            User.objects.filter(email__in=emails).delete()
@@ -0,0 +1,62 @@
+"""
+    benchmark used to compare the permission checks done through the default django
+    permission backend against the cached per-user permission sets
+"""
+from types import SimpleNamespace
+from typing import Any, List
+from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+from authentication.models import User
+from authentication.services.permission_set import PermissionSetService
+from core.enums import UserRole
+from core.mock import TherapistMock
+from core.types import BenchmarkResult
+from core.utils.benchmark import format_results, run_benchmark
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the permission checks of a request with and without the cached permission sets"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--iterations', '-i', type=int, default=50, help="Number of measured requests per strategy")
+        parser.add_argument('--checks', '-c', type=int, default=3, help="Number of permission checks done per request")
+
+    def _legacy_checks(self, user_id: int, perms: List[str]):
+        """check the permissions on a fresh user instance, the same way every new request does"""
+
+        user = User.objects.get(pk=user_id)
+        return [user.has_perm(perm) for perm in perms]
+
+    def _cached_checks(self, user_id: int, perms: List[str]):
+        """check the permissions through the permission set memoized on a fresh request"""
+
+        request = SimpleNamespace(user=User.objects.get(pk=user_id))
+        return [PermissionSetService.for_request(request).has_perm(perm) for perm in perms]
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        with transaction.atomic():
+            # 1. mock a therapist whose group holds a few permissions
+            therapist = TherapistMock.mock_instances(n=1)[0]
+            group, _ = Group.objects.get_or_create(name=UserRole.THERAPIST.value)
+            therapist.user.groups.add(group)
+
+            permissions = list(Permission.objects.select_related('content_type')[:options['checks']])
+            group.permissions.add(*permissions)
+            perms = [f'{perm.content_type.app_label}.{perm.codename}' for perm in permissions]
+
+            # 2. measure both strategies (the cached one includes a single warm-up cache miss)
+            user_id = therapist.user.pk
+            results: List[BenchmarkResult] = [
+                run_benchmark('django permission backend', lambda: self._legacy_checks(user_id, perms), iterations=options['iterations']),
+                run_benchmark('cached permission set', lambda: self._cached_checks(user_id, perms), iterations=options['iterations']),
+            ]
+
+            self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
+
+            # 3. discard all mocked records
+            transaction.set_rollback(True)
@@ -0,0 +1,82 @@
+"""
+    benchmark used to measure the SQL round trips spent on the role-based queryset branching
+    of the main list endpoints
+"""
+from types import SimpleNamespace
+from typing import Any, List
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+from appointments.mock import AppointmentMocker
+from appointments.views import AppointmentsViewset
+from authentication.models import User
+from chat.mock import ChatBotMocker, ChatMessageMocker
+from chat.views import ChatMessageViewset
+from core.mock import PatientMock, TherapistMock
+from core.types import BenchmarkResult
+from core.utils.benchmark import count_queries, format_results, run_benchmark
+from sentiment_ai.mock import SentimentReportMocker
+from sentiment_ai.views import SentimentReportViewset
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the SQL round trips and latency of the role-branched list endpoints"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--iterations', '-i', type=int, default=20, help="Number of measured requests per endpoint")
+        parser.add_argument('--rows', '-r', type=int, default=50, help="Number of mocked records per endpoint")
+
+    def _list(self, viewset, url: str, user_id: int):
+        """issue a list request the same way an authenticated client does (including the user lookup)"""
+
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=User.objects.get(pk=user_id))
+
+        return viewset.as_view({'get': 'list'})(request)
+
+    def _branch_queries(self, viewset, user_id: int) -> int:
+        """count the queries needed to resolve the branched queryset of the list action only"""
+
+        view = viewset()
+        view.action = 'list'
+        view.request = SimpleNamespace(user=User.objects.get(pk=user_id))
+
+        queries, _ = count_queries(view.get_queryset)
+        return queries
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        with transaction.atomic():
+            # 1. mock the benchmarked records
+            patient = PatientMock.mock_instances(n=1)[0]
+            therapist = TherapistMock.mock_instances(n=1)[0]
+            bot = ChatBotMocker.mock_instances(n=1)[0]
+            ChatMessageMocker.mock_instances(options['rows'] // 2, user=patient.user, bot=bot)
+            AppointmentMocker.mock_instances(n=options['rows'], fixed_patient=patient, fixed_therapist=therapist)
+            SentimentReportMocker.mock_instances(n=1, n_messages=options['rows'], fixed_user=patient.user)
+
+            roles = {'patient': patient.user.pk, 'therapist': therapist.user.pk}
+            targets = [
+                (ChatMessageViewset, 'chat/messages/', ['patient', 'therapist']),
+                (AppointmentsViewset, 'appointments/', ['patient', 'therapist']),
+                (SentimentReportViewset, 'sentiment-reports/', ['therapist']),
+            ]
+
+            # 2. measure every list action for each allowed role
+            results: List[BenchmarkResult] = []
+            for viewset, url, allowed_roles in targets:
+                for role in allowed_roles:
+                    self.stdout.write(f'{viewset.__name__}.list ({role}): {self._branch_queries(viewset, roles[role])} queries to resolve the queryset branch')
+                    results.append(run_benchmark(
+                        f'{viewset.__name__}.list ({role})',
+                        lambda: self._list(viewset, url, roles[role]),
+                        iterations=options['iterations']
+                    ))
+
+            self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
+
+            # 3. discard all mocked records
+            transaction.set_rollback(True)
@@ -0,0 +1,82 @@
+"""
+    benchmark measuring the latency and hit rate of the reference conversations search over a
+    workload of repeated short messages, searching every message versus the two-tier reference cache
+"""
+import random
+from typing import Any, List
+from django.core.management.base import BaseCommand, CommandParser
+from django.test.utils import override_settings
+from langchain_core.documents import Document
+from chat.fakes import FakeDelayedEmbeddings, FakeVectorStore
+from chat.retrieval import ReferenceCache
+from core.types import BenchmarkResult
+from core.utils.benchmark import format_results, run_benchmark
+
+# messages repeated across patients, sent as is or with a different case, punctuation or a typo
+COMMON_MESSAGES = [
+    'hi', 'hello', 'thank you', 'thanks', 'ok', 'I feel sad', 'I feel anxious', 'I cannot sleep',
+    'I have been feeling really anxious lately', 'I do not know what to do anymore',
+    'my exams are stressing me out', 'I feel lonely at the university',
+]
+REFERENCES = [
+    Document(page_content=message, metadata={'response': f'reference answer to: {message}'})
+    for message in ['I feel sad all the time', 'I am anxious about my exams', 'I cannot sleep at night', 'I feel alone']
+]
+
+
+def variant(message: str, rng: random.Random) -> str:
+    """a message as typed by another patient"""
+
+    choice = rng.random()
+    if choice < 0.4:
+        return message
+    if choice < 0.7:
+        return message.upper() if rng.random() < 0.5 else f'{message}!!'
+    if choice < 0.85 and len(message) > 12:
+        i = rng.randrange(len(message))
+        return message[:i] + message[i] * 2 + message[i + 1:]
+    return f'  {message.lower()}... '
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the reference conversations search with and without the reference cache"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--messages', '-n', type=int, default=500, help="Number of messages of the workload")
+        parser.add_argument('--unique-ratio', type=float, default=0.3, help="Share of the messages that are never repeated")
+        parser.add_argument('--embedding-delay', type=float, default=0.1, help="Simulated embeddings API latency (seconds)")
+        parser.add_argument('--search-delay', type=float, default=0.02, help="Simulated vector search latency (seconds)")
+        parser.add_argument('--similarity', type=float, default=0.9, help="Near-duplicate cosine similarity (the fake embeddings are coarser than the real ones)")
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        rng = random.Random(options['seed'])
+        workload = [
+            f'message number {i} about my day' if rng.random() < options['unique_ratio'] else variant(rng.choice(COMMON_MESSAGES), rng)
+            for i in range(options['messages'])
+        ]
+        vector_store = FakeVectorStore(FakeDelayedEmbeddings(options['embedding_delay']), REFERENCES, options['search_delay'])
+        iterations = len(workload)
+        results: List[BenchmarkResult] = []
+
+        uncached = iter(workload)
+        results.append(run_benchmark('vector search per message', lambda: vector_store.similarity_search(next(uncached), k=1), iterations, warmup=0))
+
+        with override_settings(REFERENCE_CACHE_SIMILARITY=options['similarity']):
+            ReferenceCache.invalidate()
+            ReferenceCache.reset_stats()
+            vector_store.searches = 0
+            cached = iter(workload)
+            results.append(run_benchmark('reference cache', lambda: ReferenceCache.search(vector_store, next(cached), k=1), iterations, warmup=0))
+
+        stats = ReferenceCache.stats()
+        self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
+        self.stdout.write(
+            f'hit rate {stats.hit_rate:.1%} (exact {stats.exact_hits}, near-duplicate {stats.near_hits}, misses {stats.misses}), '
+            f'{vector_store.searches} vector searches for {iterations} messages, {stats.size} cached entries'
+        )
+        ReferenceCache.invalidate()
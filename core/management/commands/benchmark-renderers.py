@@ -0,0 +1,72 @@
+"""
+    benchmark used to compare the stock JSON renderer of the API against the orjson-based renderer
+    on list pages shaped like the timeslot and sentiment list responses
+"""
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+from typing import Any, Dict, List
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+from core.renderer import FastJSONRenderer, FormattedJSONRenderrer
+from core.types import BenchmarkResult
+from core.utils.benchmark import format_results, run_benchmark
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the FormattedJSONRenderrer against the FastJSONRenderer on 100 and 1000 row pages"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--iterations', '-i', type=int, default=50, help="Number of measured renders per page size")
+        parser.add_argument('--page-sizes', nargs='*', type=int, default=[100, 1000], help="Number of rows of the rendered pages")
+
+    def _timeslot_row(self, i: int) -> Dict[str, Any]:
+        """a timeslot row with a nested therapist, as returned by the timeslot list endpoint"""
+
+        start_at = timezone.now() + timedelta(hours=i)
+        return {
+            'id': i,
+            'start_at': start_at,
+            'end_at': start_at + timedelta(minutes=50),
+            'active': True,
+            'therapist': {
+                'id': i % 20,
+                'user': {'id': uuid.uuid4(), 'username': f'therapist {i % 20}', 'email': f'therapist{i % 20}@kfupm.edu.sa'},
+                'bio': 'معالج نفسي متخصص في العلاج المعرفي السلوكي ' * 3,
+                'specializations': [{'name': 'CBT', 'description': 'cognitive behavioral therapy'}] * 2,
+            },
+        }
+
+    def _sentiment_row(self, i: int) -> Dict[str, Any]:
+        """a message sentiment row with decimal scores"""
+
+        scores = ['sad', 'joy', 'fear', 'anger', 'surprise', 'depression', 'anxiety', 'adhd', 'ocd']
+        return {
+            'id': i,
+            'message': i * 2,
+            'created_at': timezone.now(),
+            **{score: Decimal(random.randint(0, 100)) / 100 for score in scores},
+        }
+
+    def _page(self, rows: List[Dict]) -> Dict[str, Any]:
+        return {'count': len(rows) * 10, 'next': 'http://localhost/timeslots/?page=2', 'previous': None, 'results': rows}
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        context = {'response': SimpleNamespace(status_code=200)}
+        results: List[BenchmarkResult] = []
+
+        for size in options['page_sizes']:
+            for kind, make_row in (('timeslots', self._timeslot_row), ('sentiments', self._sentiment_row)):
+                page = self._page([make_row(i) for i in range(size)])
+                iterations = options['iterations']
+
+                results.append(run_benchmark(f'stock renderer ({kind}, {size} rows)', lambda: FormattedJSONRenderrer().render(page, renderer_context=context), iterations=iterations))
+                results.append(run_benchmark(f'fast renderer ({kind}, {size} rows)', lambda: FastJSONRenderer().render(page, renderer_context=context), iterations=iterations))
+
+        self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
@@ -0,0 +1,71 @@
+"""
+    benchmark measuring the latency of verifying and rotating refresh tokens as the
+    outstanding/blacklisted token tables grow, with and without the blacklist filter
+"""
+import uuid
+from datetime import timedelta
+from typing import Any, List
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from authentication.models import User
+from authentication.services.auth import AuthService
+from authentication.services.blacklist import TokenBlacklistService
+from core.mock import UserMock
+from core.types import BenchmarkResult
+from core.utils.benchmark import format_results, run_benchmark
+
+# number of rows written by every bulk insert while growing the tables
+GROW_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the refresh token verify and rotation latency against growing blacklist tables"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--sizes', type=int, nargs='*', default=[0, 10000, 100000], help="Numbers of blacklisted tokens in the tables")
+        parser.add_argument('--iterations', '-i', type=int, default=200, help="Number of measured runs per benchmark")
+
+    def _grow(self, user: User, run_id: str, start: int, end: int):
+        """blacklist mocked tokens until the tables hold the requested number of rows of this run"""
+
+        now = timezone.now()
+        for offset in range(start, end, GROW_BATCH_SIZE):
+            tokens = OutstandingToken.objects.bulk_create([
+                OutstandingToken(user=user, jti=f'{run_id}-{i}', token='', created_at=now, expires_at=now + timedelta(days=30))
+                for i in range(offset, min(offset + GROW_BATCH_SIZE, end))
+            ])
+            BlacklistedToken.objects.bulk_create([BlacklistedToken(token=token) for token in tokens])
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        run_id = uuid.uuid4().hex[:8]
+        user = UserMock.mock_instances(n=1)[0]
+        results: List[BenchmarkResult] = []
+
+        try:
+            grown = 0
+            for size in sorted(options['sizes']):
+                self._grow(user, run_id, grown, size)
+                grown = max(grown, size)
+
+                token = str(RefreshToken.for_user(user))
+                TokenBlacklistService.sync(force=True)
+
+                results.append(run_benchmark(f'verify, DB lookup ({size} blacklisted)', lambda: RefreshToken(token), options['iterations']))
+                results.append(run_benchmark(f'verify, filter ({size} blacklisted)', lambda: AuthService.validate_refresh_token(token), options['iterations']))
+                results.append(run_benchmark(
+                    f'rotate, filter ({size} blacklisted)',
+                    lambda: AuthService.logout(AuthService.validate_refresh_token(str(RefreshToken.for_user(user)))),
+                    options['iterations']
+                ))
+
+            self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
+        finally:
+            TokenBlacklistService.clear()
+            OutstandingToken.objects.filter(user=user).delete()
+            user.delete()
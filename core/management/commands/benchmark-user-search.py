@@ -0,0 +1,80 @@
+"""
+    benchmark comparing the ILIKE containment filters of the user directory against its
+    trigram indexed search, over a table of mocked english and arabic named users
+"""
+import uuid
+from typing import Any, List
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection
+from django.db.models import Q
+from faker import Faker
+from authentication.models import User
+from core.db.search import USER_SEARCH_FIELDS, trigram_search
+from core.types import BenchmarkResult
+from core.utils.benchmark import format_results, run_benchmark
+
+# number of users written by every bulk insert
+SEED_BATCH_SIZE = 5000
+# domain of the mocked users emails, used to remove them afterwards
+BENCHMARK_DOMAIN = 'search.benchmark.jusoor.test'
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the user directory search (ILIKE filters versus trigram indexes)"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--users', '-n', type=int, default=100000, help="Number of mocked users")
+        parser.add_argument('--iterations', '-i', type=int, default=20, help="Number of measured runs per benchmark")
+
+    def _seed(self, n: int) -> List[str]:
+        """insert n users named by the english and arabic faker locales, returning a few of their names"""
+
+        fakers = [Faker('en'), Faker('ar_AA')]
+        run_id = uuid.uuid4().hex[:8]
+        names: List[str] = []
+
+        for start in range(0, n, SEED_BATCH_SIZE):
+            users = []
+            for i in range(start, min(start + SEED_BATCH_SIZE, n)):
+                faker = fakers[i % 2]
+                first_name, last_name = faker.first_name(), faker.last_name()
+                users.append(User(
+                    username=f'{first_name} {last_name}', first_name=first_name, last_name=last_name,
+                    email=f'{run_id}.{i}@{BENCHMARK_DOMAIN}', password='!'
+                ))
+            User.objects.bulk_create(users)
+            names.extend(user.last_name for user in users[:2])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE authentication_user')
+
+        return names
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        results: List[BenchmarkResult] = []
+        iterations = options['iterations']
+
+        try:
+            english, arabic = self._seed(options['users'])[:2]
+            terms = [
+                ('english', english),
+                ('english typo', english[:-2] + english[-1:] + english[-2]),
+                ('arabic', arabic),
+                ('arabic spelling variant', arabic.replace('ا', 'أ', 1) if 'ا' in arabic else 'أ' + arabic),
+            ]
+
+            for label, term in terms:
+                ilike = Q()
+                for field in USER_SEARCH_FIELDS:
+                    ilike |= Q(**{f'{field}__icontains': term})
+
+                results.append(run_benchmark(f'ILIKE, {label}', lambda: list(User.objects.filter(ilike).order_by('pk')[:20]), iterations))
+                results.append(run_benchmark(f'trigram, {label}', lambda: list(trigram_search(User.objects.all(), USER_SEARCH_FIELDS, term)[:20]), iterations))
+
+            self.stdout.write(format_results(results), style_func=self.style.SUCCESS)
+        finally:
+            User.objects.filter(email__endswith=f'@{BENCHMARK_DOMAIN}').delete()
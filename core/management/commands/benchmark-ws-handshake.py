@@ -0,0 +1,127 @@
+"""
+    benchmark measuring the throughput and latency of concurrent JWT authenticated WebSocket
+    handshakes on a single event loop, against an in-memory channel layer
+"""
+import asyncio
+import statistics
+import time
+from typing import Any, Dict, List
+import jwt
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.middleware import BaseMiddleware
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import close_old_connections
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import AccessToken, UntypedToken
+from authentication.middleware import JWTAuthMiddlewareStack
+from authentication.models import User
+from authentication.services.socket_auth import SocketAuthService
+from core.mock import UserMock
+from core.utils.benchmark import percentile
+
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+class HandshakeConsumer(AsyncWebsocketConsumer):
+    """consumer joining the group of the authenticated user before accepting the handshake"""
+
+    async def connect(self):
+        self.group_name = f'user_{self.scope["user"].pk}'
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept(subprotocol=self.scope['subprotocols'][0])
+
+    async def disconnect(self, code):
+        await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+
+class LegacyJWTAuthMiddleware(BaseMiddleware):
+    """previous handshake authentication (two token decodes and a user query per handshake), kept as the comparison baseline"""
+
+    async def __call__(self, scope, receive, send):
+        close_old_connections()
+
+        token = dict(scope['headers'])[b'sec-websocket-protocol'].decode('utf-8').split(',')[1].strip()
+        UntypedToken(token)
+        claims = jwt.decode(token, settings.SIMPLE_JWT['SIGNING_KEY'], algorithms=[settings.SIMPLE_JWT['ALGORITHM']])
+        user = await database_sync_to_async(User.objects.get)(id=claims['user_id'])
+
+        return await self.app({**scope, 'user': user}, receive, send)
+
+
+class Command(BaseCommand):
+
+    help = "Benchmark the throughput of concurrent JWT authenticated WebSocket handshakes"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--handshakes', '-n', type=int, default=2000, help="Number of measured handshakes per scenario")
+        parser.add_argument('--concurrency', '-c', type=int, default=500, help="Number of handshakes in flight at once")
+        parser.add_argument('--users', type=int, default=20, help="Number of mocked users sharing the handshakes (one token each)")
+
+    async def _handshake(self, app, token: str, semaphore: asyncio.Semaphore) -> float:
+        """perform a full handshake (connect, then disconnect), returning its latency in ms or -1 if it was denied"""
+
+        async with semaphore:
+            communicator = WebsocketCommunicator(app, '/ws/chat/', subprotocols=['Authorization', token])
+
+            started = time.perf_counter()
+            connected, _ = await communicator.connect()
+            latency = (time.perf_counter() - started) * 1000
+
+            await communicator.disconnect()
+
+        return latency if connected else -1
+
+    async def _run(self, app, tokens: List[str], options: Dict) -> Dict[str, float]:
+
+        semaphore = asyncio.Semaphore(max(1, options['concurrency']))
+        n = options['handshakes']
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*[self._handshake(app, tokens[i % len(tokens)], semaphore) for i in range(n)])
+        elapsed = time.perf_counter() - started
+
+        accepted = [latency for latency in latencies if latency >= 0]
+        return {
+            'rate': len(accepted) / max(elapsed, 1e-9),
+            'mean': statistics.fmean(accepted) if accepted else 0.0,
+            'p50': percentile(accepted, 50),
+            'p95': percentile(accepted, 95),
+            'denied': n - len(accepted),
+        }
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        # the handshakes load the users from other threads, so the mocked users are committed and removed afterwards
+        users = UserMock.mock_instances(n=max(1, options['users']))
+        tokens = [str(AccessToken.for_user(user)) for user in users]
+
+        try:
+            with override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS):
+                consumer = HandshakeConsumer.as_asgi()
+                scenarios = [
+                    ('legacy (double decode, query per handshake)', LegacyJWTAuthMiddleware(consumer), False),
+                    ('single decode, cold user cache', JWTAuthMiddlewareStack(consumer), True),
+                    ('single decode, warm user cache', JWTAuthMiddlewareStack(consumer), False),
+                ]
+
+                header = f'{"scenario":<45} {"handshakes/s":>13} {"mean(ms)":>10} {"p50(ms)":>10} {"p95(ms)":>10} {"denied":>7}'
+                self.stdout.write('\n'.join([header, '-' * len(header)]))
+
+                for label, app, cold in scenarios:
+                    if cold:
+                        SocketAuthService.clear()
+
+                    stats = async_to_sync(self._run)(app, tokens, options)
+                    self.stdout.write(
+                        f'{label:<45} {stats["rate"]:>13,.0f} {stats["mean"]:>10.2f} {stats["p50"]:>10.2f} {stats["p95"]:>10.2f} {stats["denied"]:>7}',
+                        style_func=self.style.SUCCESS
+                    )
+        finally:
+            SocketAuthService.clear()
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
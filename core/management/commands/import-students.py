@@ -0,0 +1,47 @@
+"""
+    command used to onboard the KFUPM students of a CSV or JSONL file (email, username, department, optional password)
+    as patients, hashing their passwords in a process pool and writing them in bulk
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from core.utils.student_import import IMPORT_FORMATS, detect_format, import_students, parse_students
+
+
+class Command(BaseCommand):
+
+    help = "Import KFUPM students in bulk as patients from a CSV or JSONL file"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('file', type=str, help="Path of the CSV (with a header row) or JSONL file of the students")
+        parser.add_argument('--format', choices=IMPORT_FORMATS, default=None, help="Format of the file (guessed from its extension by default)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of password hashing processes")
+        parser.add_argument('--default-password', type=str, default=None, help="Password of the students without one (unusable password by default)")
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        try:
+            with open(options['file'], encoding='utf-8-sig') as f:
+                content = f.read()
+        except OSError as e:
+            raise CommandError(f'Could not read {options["file"]}: {e}')
+
+        started = time.perf_counter()
+        rows, errors = parse_students(content, options['format'] or detect_format(options['file']))
+
+        # the forked workers only hash the passwords, and never use the DB connection inherited from this process
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            result = import_students(rows, executor=executor, default_password=options['default_password'])
+
+        for error in errors + result.errors:
+            self.stderr.write(error)
+
+        self.stdout.write(
+            f'created {result.created} students in {time.perf_counter() - started:.1f}s '
+            f'(skipped {result.skipped_existing} existing, {result.skipped_duplicates} duplicated, {len(errors) + len(result.errors)} invalid)',
+            style_func=self.style.SUCCESS
+        )
@@ -0,0 +1,131 @@
+"""
+    command used to seed large volumes of users, profiles, timeslots, appointments, chat messages
+    and message sentiments for load testing, generating the rows in a process pool and writing them in bulk
+"""
+import os
+import time
+import uuid
+from datetime import timedelta
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.management.base import BaseCommand, CommandParser
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from faker import Faker
+from appointments.constants.enums import ACTIVE, CONFIRMED
+from appointments.models import Appointment, AvailabilityTimeSlot, TherapistAssignment
+from authentication.models import User
+from chat.mock import ChatBotMocker
+from chat.models import ChatMessage
+from core.enums import UserRole
+from core.models import KFUPMDepartment, StudentPatient, Therapist
+from core.utils import seeding
+from sentiment_ai.models import MessageSentiment
+
+
+class Command(BaseCommand):
+
+    help = "Seed large volumes of records in bulk (COPY on PostgreSQL) for load testing"
+
+
+    def add_arguments(self, parser: CommandParser) -> None:
+
+        parser.add_argument('--patients', type=int, default=5000, help="Number of seeded patients")
+        parser.add_argument('--therapists', type=int, default=50, help="Number of seeded therapists")
+        parser.add_argument('--timeslots-per-therapist', type=int, default=100, help="Number of availability timeslots per therapist")
+        parser.add_argument('--appointments', type=int, default=50000, help="Number of seeded appointments (at most one per timeslot)")
+        parser.add_argument('--message-pairs-per-patient', type=int, default=200, help="Number of patient/bot message pairs per patient")
+        parser.add_argument('--no-sentiments', action='store_true', help="Skip seeding the sentiments of the patient messages")
+        parser.add_argument('--chunk-size', type=int, default=20000, help="Number of rows generated and written per chunk")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Number of row generating processes")
+        parser.add_argument('--password', type=str, default='seed-password', help="Password shared by all the seeded users")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed of the generated values")
+
+    def _seed_table(self, executor: ProcessPoolExecutor, label: str, model: type, generator: Callable, total: int, ctx: Dict, chunk_size: int, include_pk: bool = True):
+        """generate the rows of a table in chunks within the process pool, and write every chunk in its own transaction"""
+
+        if total <= 0:
+            return
+
+        columns, defaults = seeding.get_columns(model, include_pk=include_pk)
+        use_copy = connection.vendor == 'postgresql'
+        starts = range(0, total, chunk_size)
+        counts = [min(chunk_size, total - start) for start in starts]
+
+        started = time.perf_counter()
+        generate = partial(seeding.generate_chunk, generator, ctx=ctx, columns=columns, defaults=defaults, as_csv=use_copy)
+
+        # the chunks are generated in parallel while the already generated ones are written
+        for payload in executor.map(generate, starts, counts):
+            with transaction.atomic():
+                seeding.write_chunk(model, columns, payload)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f'{label}: {total} rows in {elapsed:.1f}s ({total / max(elapsed, 1e-9) * 60:,.0f} rows/min)')
+
+    def handle(self, *args: Any, **options: Any) -> None:
+
+        n_patients, n_therapists = max(1, options['patients']), max(1, options['therapists'])
+        n_users = n_patients + n_therapists
+        n_timeslots = n_therapists * options['timeslots_per_therapist']
+        n_appointments = min(options['appointments'], n_timeslots)
+        n_messages = 2 * n_patients * options['message_pairs_per_patient']
+
+        # 1. prepare the shared values once (a single password hash for all users, and a small faker vocabulary)
+        fake = Faker()
+        bot = ChatBotMocker.mock_instances(n=1)[0]
+
+        ctx: Dict[str, Any] = {
+            'seed': options['seed'],
+            'run_id': uuid.uuid4().hex[:8],
+            'base_time': timezone.now() - timedelta(days=365),
+            'password_hash': make_password(options['password']),
+            'vocabulary': [fake.word() for _ in range(seeding.SEED_VOCABULARY_SIZE)],
+            'first_names': [fake.first_name() for _ in range(200)],
+            'last_names': [fake.last_name() for _ in range(200)],
+            'department_ids': list(KFUPMDepartment.objects.values_list('pk', flat=True)),
+            'patient_group_id': Group.objects.get_or_create(name=UserRole.PATIENT.value)[0].pk,
+            'therapist_group_id': Group.objects.get_or_create(name=UserRole.THERAPIST.value)[0].pk,
+            'bot_user_id': bot.user_profile_id,
+            'n_patients': n_patients,
+            'timeslots_per_therapist': max(1, options['timeslots_per_therapist']),
+            'message_pairs_per_patient': options['message_pairs_per_patient'],
+            'appointment_status': CONFIRMED,
+            'assignment_status': ACTIVE,
+            'sentiment_scores': [
+                field.column for field in MessageSentiment._meta.concrete_fields
+                if field.get_internal_type() == 'DecimalField'
+            ],
+            # 2. reserve the id ranges used to derive every foreign key within the workers
+            'user_start': seeding.reserve_ids(User, n_users),
+            'patient_start': seeding.reserve_ids(StudentPatient, n_patients),
+            'therapist_start': seeding.reserve_ids(Therapist, n_therapists),
+            'timeslot_start': seeding.reserve_ids(AvailabilityTimeSlot, n_timeslots),
+            'appointment_start': seeding.reserve_ids(Appointment, n_appointments),
+            'message_start': seeding.reserve_ids(ChatMessage, n_messages),
+        }
+
+        # the forked workers must not share the open DB connection of the parent process
+        connections.close_all()
+
+        chunk_size = options['chunk_size']
+        started = time.perf_counter()
+
+        # 3. generate and write every table, parents first
+        with ProcessPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            self._seed_table(executor, 'users', User, seeding.generate_users, n_users, ctx, chunk_size)
+            self._seed_table(executor, 'user groups', User.groups.through, seeding.generate_user_groups, n_users, ctx, chunk_size, include_pk=False)
+            self._seed_table(executor, 'patients', StudentPatient, seeding.generate_profiles, n_patients, {**ctx, 'profile': 'patient'}, chunk_size)
+            self._seed_table(executor, 'therapists', Therapist, seeding.generate_profiles, n_therapists, {**ctx, 'profile': 'therapist'}, chunk_size)
+            self._seed_table(executor, 'timeslots', AvailabilityTimeSlot, seeding.generate_timeslots, n_timeslots, ctx, chunk_size)
+            self._seed_table(executor, 'appointments', Appointment, seeding.generate_appointments, n_appointments, ctx, chunk_size)
+            self._seed_table(executor, 'therapist assignments', TherapistAssignment, seeding.generate_therapist_assignments, n_appointments, ctx, chunk_size, include_pk=False)
+            self._seed_table(executor, 'chat messages', ChatMessage, seeding.generate_messages, n_messages, ctx, chunk_size)
+
+            if not options['no_sentiments']:
+                self._seed_table(executor, 'message sentiments', MessageSentiment, seeding.generate_sentiments, n_messages // 2, ctx, chunk_size, include_pk=False)
+
+        self.stdout.write(f'seeding finished in {time.perf_counter() - started:.1f}s', style_func=self.style.SUCCESS)
@@ -9,6 +9,7 @@ from rest_framework import serializers
 from django.db.models import QuerySet, Model
 
 from core.querysets import QSWrapper
+from core.utils.query_stats import QUERY_STATS_ENDPOINT_ATTR, get_endpoint_label
 class SerializerMapperMixin:
 	"""
 	utility mixin used to assign a different serializer class for each viewset action endpoint
@@ -54,4 +55,12 @@ class QuerysetMapperMixin:
 		return queryset
 
 
+class QueryStatsMixin:
+	"""
+	utility mixin used to label the served HTTP request with its (viewset, action) endpoint,
+	so that the query stats middleware can aggregate the recorded queries per endpoint
+	"""
 
+	def initial(self, request, *args, **kwargs):
+		setattr(request._request, QUERY_STATS_ENDPOINT_ATTR, get_endpoint_label(self, self.action))
+		return super().initial(request, *args, **kwargs)
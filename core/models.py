@@ -2,15 +2,22 @@
 General utility DB models
 """
 
+from django.conf import settings
+from django.core.cache import caches
 from django.db import models
 from django.contrib.auth import get_user_model
 from numpy import save
+from core.db.cascade import cascade_hard_delete, cascade_soft_delete
 from core.db.managers import SoftDeletedManager
 from django.contrib.auth.models import Group
 
 from core.enums import UserRole
+from authentication.services.hash import PasswordHashService
 # Create your models here.
 
+# fast cache key of the id of the patients group
+PATIENT_GROUP_CACHE_KEY = 'group:patient:id'
+
 
 class TimeStampedModel(models.Model):
     """
@@ -23,12 +30,30 @@ class TimeStampedModel(models.Model):
 
     objects = SoftDeletedManager() ## custom object manager to mask out soft deleted objects
 
+    # reverse relations whose rows are soft/hard deleted along with the model rows (e.g. ('survey_response',))
+    SOFT_DELETE_CASCADE = ()
+
     class Meta:
         """
         Meta class for the model
         """
         abstract = True
 
+    def soft_delete(self):
+        """
+        Method to soft delete the object along with its cascaded related rows
+        """
+        result = cascade_soft_delete(type(self)._base_manager.filter(pk=self.pk))
+        self.refresh_from_db(fields=['deleted_at'])
+
+        return result
+
+    def hard_delete(self):
+        """
+        Method to permanently delete the object along with its cascaded related rows
+        """
+        return cascade_hard_delete(type(self)._base_manager.filter(pk=self.pk))
+
 
 
 class Therapist(TimeStampedModel):
@@ -64,16 +89,33 @@ class StudentPatient(TimeStampedModel):
     user = models.OneToOneField(get_user_model(), unique=True, on_delete=models.PROTECT, related_name='patient_profile')
     department = models.ForeignKey('KFUPMDepartment', on_delete=models.PROTECT, related_name='students', null=True, blank=True)
 
+    @staticmethod
+    def get_group_id() -> int:
+        """
+        Method to get the id of the patients group, cached across requests
+        """
+        cache = caches[settings.FAST_CACHE_ALIAS]
+        group_id = cache.get(PATIENT_GROUP_CACHE_KEY)
+
+        if group_id is None:
+            group_id = Group.objects.get_or_create(name=UserRole.PATIENT.value)[0].pk
+            cache.set(PATIENT_GROUP_CACHE_KEY, group_id, timeout=None)
+
+        return group_id
+
     @staticmethod
     def create(username: str, email: str, password: str):
         """
-        Method to create a new patient profile
+        Method to create a new patient profile (the password is hashed in the bounded hashing pool)
         """
-        user = get_user_model().objects.create_user(username=username, email=email, password=password)       
-        patient = StudentPatient.objects.create(user=user)
-        user.groups.add(Group.objects.get(name=UserRole.PATIENT.value))
+        User = get_user_model()
+        user = User(username=User.normalize_username(username), email=User.objects.normalize_email(email))
+        user.password = PasswordHashService.make(password)
         user.save()
 
+        patient = StudentPatient.objects.create(user=user)
+        user.groups.add(StudentPatient.get_group_id())
+
         return patient, user
 
 
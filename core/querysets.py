@@ -1,12 +1,14 @@
 from os import name
-from typing import Any, List, Dict, Union
+from typing import Any, FrozenSet, List, Dict, Optional, Tuple, Union
 from django.db.models import QuerySet, Q
-from django.utils import timezone
 from numpy import isin
 from rest_framework.generics import GenericAPIView
 from django.contrib.auth import get_user_model
 from core.enums import PATIENT_PROFILE_FIELD, QuerysetBranching, UserRole, THERAPIST_PROFILE_FIELD
 from abc import ABC, abstractmethod
+from core.db.cascade import cascade_hard_delete, cascade_soft_delete
+from authentication.services.permission_set import PermissionSetService
+from authentication.services.principal import PrincipalService
 
 class SoftDeletedQuerySet(QuerySet):
     """
@@ -15,20 +17,22 @@ class SoftDeletedQuerySet(QuerySet):
 
     def delete(self):
         """
-        Overriding the default delete method to soft delete the objects
+        Overriding the default delete method to soft delete the objects, cascading
+        to the related rows declared in the SOFT_DELETE_CASCADE attribute of the model
         """
-        return super(SoftDeletedQuerySet, self).update(deleted_at=timezone.now())
+        return cascade_soft_delete(self)
 
     def hard_delete(self):
         """
-        Method to permanently delete the objects from the database
+        Method to permanently delete the objects from the database, cascading
+        to the related rows declared in the SOFT_DELETE_CASCADE attribute of the model
         """
-        return super(SoftDeletedQuerySet, self).delete()
+        return cascade_hard_delete(self)
 
         
 
 # ---------------- Utilities for action-based QS mapping ----------------
-    
+
 class QSExtractor:
     """
         Utility class used to extract the quertset either directly or through invoking
@@ -54,6 +58,9 @@ class QSExtractor:
             raise ValueError('Invalid queryset/mapper definition') 
 
 
+# user model relations of role profiles whose ids are held by the request principal
+ROLE_PROFILE_FIELDS = (PATIENT_PROFILE_FIELD, THERAPIST_PROFILE_FIELD)
+
 class QSWrapperFilter(ABC, QSExtractor):
     """
         Utility class used for conditional queryset filtering
@@ -77,6 +84,15 @@ class QSWrapperFilter(ABC, QSExtractor):
         pass
 
     @abstractmethod
+    def to_q(self, view: GenericAPIView) -> Optional[Q]:
+        """
+            compile the filtering layer into a single Q object on request-time
+
+            @view: the view instance to supply the request information for filtering
+            @return: the Q object to be applied on the queryset, or None if the queryset must be emptied
+        """
+        pass
+
     def __call__(self, view: GenericAPIView, qs: Union[QuerySet, 'QSWrapperFilter'], *args: Any, **kwds: Any) -> QuerySet:
         """
             starting dynamic recursive queryset filtering on request-time
@@ -84,28 +100,69 @@ class QSWrapperFilter(ABC, QSExtractor):
             @view: the view instance to supply the request information for filtering
             @qs: the queryset to be filtered or another nested dynamic queryset mapper
         """
-        pass
+
+        filters = self.to_q(view)
+
+        if filters is None:
+            return self._pass_qs_or_reject(view, qs)
+
+        return self._extract_qs(view, qs).filter(filters)
 
 class QSWrapperBranch(QSWrapperFilter):
+    """
+        Utility class used for branching a queryset on a set of keys held by the requesting user.
+        The mapper is compiled once on definition time into an ordered plan, so that the branch is resolved
+        on request-time with a single lookup of the user keys
+    """
 
+    def __init__(self, mapper: Dict[str, Union[Q, QSWrapperFilter]], pass_through: List[str] = None) -> None:
 
-    
-    def _map_filter_qs(self, view: GenericAPIView, qs: Union[QuerySet, 'QSWrapperFilter'], lookup_key: str) -> QuerySet:
+        super().__init__(mapper, pass_through=pass_through or [])
+
+        for branch_filter in self.mapper.values():
+            if not isinstance(branch_filter, (Q, QSWrapperFilter)):
+                raise ValueError('Invalid mapper object')
+
+        # NOTE: the order of the mapper keys matters. The first key held by the user will be the one whose filters are applied
+        self.plan: Tuple[Tuple[str, Union[Q, QSWrapperFilter]], ...] = tuple(self.mapper.items())
+        self.pass_through_keys: FrozenSet[str] = frozenset(self.pass_through)
+        # all keys used for branching, either mapped or passed-through
+        self.branch_keys: FrozenSet[str] = frozenset(self.mapper.keys()) | self.pass_through_keys
+
+    @abstractmethod
+    def _resolve_keys(self, view: GenericAPIView) -> FrozenSet[str]:
+        """return all the keys held by the requesting user (e.g. group names, permissions)"""
+        pass
+
+    def _pass_qs_or_reject(self, view: GenericAPIView, qs: Union[QuerySet, QSWrapperFilter], *args, **kwargs) -> QuerySet:
+        """ empty the currently pending queryset if the user holds none of the branching keys"""
+        return self._extract_qs(view, qs).none()
+
+    def _map_filter_q(self, view: GenericAPIView, branch_filter: Union[Q, QSWrapperFilter]) -> Optional[Q]:
         """
-            utility used to filter the existing queryset object based
-            on a string -> Q() object OR a QSWrapperFilter mapping object stored in the instance before hand
-            
+            utility used to compile a mapped branch into a Q object, either directly
+            or through the nested QSWrapperFilter mapping object
         """
-        
-        # if the value of the mapper is a Q object, use it to filter the queryset
-        if isinstance(self.mapper[lookup_key], Q):
-            return self._extract_qs(view, qs).filter(self.mapper[lookup_key])
-        
-        # if the value of the mapper is a QSWrapperFilter object, invoke it to return the filtered queryset
-        elif isinstance(self.mapper[lookup_key], QSWrapperFilter):
-            return self.mapper[lookup_key](view, qs)
 
-        raise ValueError('Invalid mapper object')           
+        if isinstance(branch_filter, Q):
+            return branch_filter
+
+        return branch_filter.to_q(view)
+
+    def to_q(self, view: GenericAPIView) -> Optional[Q]:
+
+        user_keys = self._resolve_keys(view)
+
+        # if the user has a passthrough key, return the queryset as is with no filtering
+        if user_keys & self.pass_through_keys:
+            return Q()
+
+        for key, branch_filter in self.plan:
+            if key in user_keys:
+                return self._map_filter_q(view, branch_filter)
+
+        # if there is no match with any specified keys, the queryset is emptied
+        return None
 
 
 class OwnedQS(QSWrapperFilter):
@@ -129,17 +186,25 @@ class OwnedQS(QSWrapperFilter):
         """ empty the currently pending queryset if the user role does not match the ownership field"""
         return self._extract_qs(view, qs).none()
 
-    def __call__(self, view: GenericAPIView, qs: Union[QuerySet, QSWrapperFilter], *args: Any, **kwds: Any) -> QuerySet:
+    def to_q(self, view: GenericAPIView) -> Optional[Q]:
 
         user = view.request.user
 
+        # role profile ids are read from the request principal with no extra queries
+        if self.user_model_rel in ROLE_PROFILE_FIELDS:
+            user = PrincipalService.for_request(view.request).get_profile_id(self.user_model_rel)
+
+            # the user does not own any records if he does not hold the role profile
+            if user is None:
+                return None
+
         # checking if a custom user model field is used for ownership determination
-        if self.user_model_rel is not None:
+        elif self.user_model_rel is not None:
 
             # if the user object does not have the specified attribute, return an empty queryset
             ## in Django ORM terms, this means that the user does not own any records of the target model
             if not hasattr(user, self.user_model_rel):
-                return self._pass_qs_or_reject(view, qs)
+                return None
             
             user = getattr(user, self.user_model_rel)
         # filtering the passed queryset based on the ownership field
@@ -148,7 +213,7 @@ class OwnedQS(QSWrapperFilter):
             for field in self.ownership_fields[1:]:
                 filters |= Q(**{field: user})
         
-        return self._extract_qs(view, qs).filter(filters)
+        return filters
         
 
 class PatientOwnedQS(OwnedQS):
@@ -169,72 +234,26 @@ class TherapistOwnedQS(OwnedQS):
 class UserGroupQS(QSWrapperBranch):
     """Queryset mapper based on user group membership"""
 
-    def _pass_qs_or_reject(self, view: GenericAPIView, qs: Union[QuerySet, QSWrapperFilter], *args, **kwargs) -> QuerySet:
-
-        user = view.request.user
-        
-        if kwargs.get('user_groups') is None:
-            raise ValueError('User groups not passed to qs passthrough handler')
-        
-        user_groups = kwargs.get('user_groups')
-
-        # if the user has a passthrough group, return the queryset as is with no filtering
-        if user_groups.filter(name__in=self.pass_through).exists():
-            return self._extract_qs(view, qs)
-        else:
-            return self._extract_qs(view, qs).none()
-
-    def __call__(self, view: GenericAPIView, qs: Union[QuerySet, QSWrapperFilter], *args: Any, **kwds: Any) -> QuerySet:
-        user = view.request.user
-
-        user_groups = user.groups.filter(name__in= list(self.mapper.keys()) + self.pass_through)
-        
-        # if the user has a passthrough group, return the queryset as is with no filtering
-        if user_groups.filter(name__in=self.pass_through).exists():
-            return self._extract_qs(view, qs)
-        
-        # if there is no match with any specified user groups, return an empty queryset or full dataset for passthrough groups
-        if not user_groups.exists():
-            return self._pass_qs_or_reject(view, qs, user_groups=user_groups)
-
-        else:
-            # NOTE: the order of group keys matters
-            for key in self.mapper.keys():
-                if user_groups.filter(name=key).exists():
-                    return self._map_filter_qs(view, qs, lookup_key=key)
-
-        raise ValueError('Unexpcted output of conditional queryset mapping')
+    def _resolve_keys(self, view: GenericAPIView) -> FrozenSet[str]:
+        return PrincipalService.for_request(view.request).groups
 
 class PermissionQS(QSWrapperBranch):
     """Queryset mapper based on user permissions"""
 
-    def __call__(self, view: GenericAPIView, qs: Union[QuerySet, QSWrapperFilter], *args: Any, **kwds: Any) -> QuerySet:
-        
-        user = view.request.user
-        user_permissions = user.get_all_permissions()
-        # if the user has a passthrough permission, return the queryset as is with no filtering
-        if set(user.get_all_permissions()) & set(self.pass_through):
-            return self._extract_qs(view, qs)
-
-        if not set(user.get_all_permissions()) & set(self.mapper.keys()):
-            return self._pass_qs_or_reject(view, qs)
-
-        else:
-            # NOTE: the order of permission keys matters. The first matching
-            # key will be the one whose filters are applied
-            for key in self.mapper.items():
-                if user.has_perm(key):
-                    return self._map_filter_qs(view, qs, lookup_key=key)
-
-        raise ValueError('Unexpcted output of conditional queryset mapping')
+    def _resolve_keys(self, view: GenericAPIView) -> FrozenSet[str]:
+        permission_set = PermissionSetService.for_request(view.request)
+        return frozenset(key for key in self.branch_keys if permission_set.has_perm(key))
 
 
 
 
-class QSWrapper:
+class QSWrapper(QSExtractor):
     """
         Wrapper class to abstract the dynamic queryset mapping
         for DRF viewsets
+
+        NOTE: the mapper stack is compiled when the viewset class is defined, and on request-time
+        the whole stack is reduced into a single Q object applied on the base queryset
     """
 
     def __init__(self, queryset: QuerySet) -> None:    
@@ -259,11 +278,17 @@ class QSWrapper:
         if not self.mapper_stack:
             return self.queryset
 
-        qs = self.queryset
+        filters = Q()
         for mapper in self.mapper_stack:
-            qs = mapper(view, qs)
+            mapper_filters = mapper.to_q(view)
+
+            # a rejecting mapper empties the queryset with no need to compile the remaining mappers
+            if mapper_filters is None:
+                return self._extract_qs(view, self.queryset).none()
+
+            filters &= mapper_filters
 
-        return qs
+        return self._extract_qs(view, self.queryset).filter(filters)
     
     def __call__(self, *args: Any, **kwds: Any) -> Any:
         """used to create a compatible interface with DRF get_queryset"""
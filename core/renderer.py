@@ -1,5 +1,8 @@
-from typing import Any
+from decimal import Decimal
+from typing import Any, Dict, Optional
 
+import orjson
+from django.utils.functional import Promise
 from rest_framework.viewsets import ModelViewSet
 
 from core.http import Response
@@ -7,21 +10,65 @@ from core.placeholders import SUCCESS, ERROR
 
 from rest_framework.renderers import JSONRenderer
 
+# encoding options matching the output of the stock DRF encoder (UTC datetimes ending with Z, non-string dict keys)
+ORJSON_OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+
+def format_envelope(data: Any, status_code: int) -> Dict:
+    """wrap the response data within the standard API response structure"""
+
+    if not str(status_code).startswith('2'):
+        return {
+            "status": status_code,
+            "data": data.get('data', None) or None,
+            "message": data.get('message', None) or ERROR
+        }
+
+    return {
+        "status": status_code,
+        "data": data,
+        "message": SUCCESS
+    }
+
+
 class FormattedJSONRenderrer(JSONRenderer):
     """Custom JSON renderer to format the response to be consistent with the API response structure"""
     def render(self, data: Any, accepted_media_type: str = None, renderer_context: dict = None) -> bytes:
         """Format the response"""
 
         status_code = renderer_context['response'].status_code
-        response = response = {
-          "status": status_code,
-          "data": data,
-          "message": SUCCESS
-        }
 
-        if not str(status_code).startswith('2'):
-            response["status"] = status_code
-            response["data"] = data.get('data', None) or None
-            response["message"] = data.get('message', None) or ERROR
+        return super().render(format_envelope(data, status_code), accepted_media_type, renderer_context)
+
+
+def _encode_default(obj: Any) -> Any:
+    """encode the types not supported natively by orjson the same way the DRF encoder does"""
+
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, Promise):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return obj.decode()
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(data: Any) -> bytes:
+    return orjson.dumps(data, default=_encode_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONRenderer(FormattedJSONRenderrer):
+    """
+        Same response structure as the FormattedJSONRenderrer, encoded through orjson
+        (with native Decimal, datetime and UUID support)
+    """
+
+    def render(self, data: Any, accepted_media_type: str = None, renderer_context: dict = None) -> bytes:
+
+        return dumps(format_envelope(data, renderer_context['response'].status_code))
 
-        return super().render(response, accepted_media_type, renderer_context)
\ No newline at end of file
@@ -26,7 +26,8 @@ class HttpSuccessResponseNestedMessageSerializer(serializers.Serializer):
     
 class HttpPaginatedSerializer(serializers.Serializer):
 
-    count = serializers.IntegerField()
+    count = serializers.IntegerField(allow_null=True) ## null for keyset paginated viewsets, which skip counting
+    approximate = serializers.BooleanField(required=False) ## whether the count is approximate (a planner estimate or a cached count)
     next = serializers.URLField(allow_null=True)
     previous = serializers.URLField(allow_null=True)
     results = serializers.ListField(child=serializers.DictField())
@@ -70,4 +71,37 @@ class CounterSerializer(serializers.Serializer):
     last_month_count = serializers.IntegerField()
 
 class HttpCounterSerializer(HttpSuccessResponseSerializer):
-    data = CounterSerializer()
\ No newline at end of file
+    data = CounterSerializer()
+
+
+class EndpointQueryStatsSerializer(serializers.Serializer):
+    endpoint = serializers.CharField()
+    requests = serializers.IntegerField()
+    avg_queries = serializers.FloatField()
+    max_queries = serializers.IntegerField()
+    avg_sql_ms = serializers.FloatField()
+    duplicates = serializers.DictField(child=serializers.IntegerField())
+
+class HttpEndpointQueryStatsListResponseSerializer(HttpSuccessResponseSerializer):
+    data = EndpointQueryStatsSerializer(many=True)
+
+
+class StudentImportUploadSerializer(serializers.Serializer):
+    """Serializer for the uploaded file of a bulk student import"""
+    file = serializers.FileField()
+    format = serializers.ChoiceField(choices=['csv', 'jsonl'], required=False) ## guessed from the file extension by default
+    default_password = serializers.CharField(required=False, write_only=True)
+
+class StudentImportResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    skipped_existing = serializers.IntegerField()
+    skipped_duplicates = serializers.IntegerField()
+    errors = serializers.ListField(child=serializers.CharField())
+
+class HttpStudentImportResponseSerializer(HttpSuccessResponseSerializer):
+    data = StudentImportResultSerializer()
+
+
+class SearchQuerySerializer(serializers.Serializer):
+    """Serializer for the query params of the trigram search actions"""
+    q = serializers.CharField(min_length=2, max_length=100) ## matched against words similar to it (typos and arabic spelling variants tolerated)
@@ -1,3 +1,424 @@
-from django.test import TestCase
+import json
+import uuid
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from django.db import connection
+from django.test import TestCase, tag
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, force_authenticate
+from authentication.models import User
+from chat.mock import ChatBotMocker, ChatMessageMocker
+from chat.models import ChatMessage
+from chat.views import ChatMessageViewset
+from core.db.counting import CountStrategy
+from core.db.search import normalize_search_text
+from core.enums import QuerysetBranching, UserRole
+from core.mock import PatientMock, TherapistMock, UserMock
+from core.models import KFUPMDepartment, StudentPatient
+from core.querysets import OwnedQS, PatientOwnedQS, QSWrapper
+from core.renderer import FastJSONRenderer, FormattedJSONRenderrer
+from core.utils.query_stats import QueryRecorder, QueryStatsRegistry, assert_query_budget, fingerprint
+from core.utils import student_import
+from core.utils.student_import import JSONL_FORMAT, import_students, parse_students, registered_emails
+from core.utils.testing import CachedStateTestCase
+from core.views import KFUPMDeptViewset, PatientViewSet
+from core.viewssets import CountStrategyPaginator, KeysetPagination
+from sentiment_ai.mock import SentimentReportMocker
+from sentiment_ai.models import MessageSentiment, ReportSentimentMessage
 
 # Create your tests here.
+
+class QSWrapperBranchingTestCase(TestCase):
+
+    def setUp(self):
+        self.bot = ChatBotMocker.mock_instances(n=1)[0]
+        self.patients = PatientMock.mock_instances(n=2)
+        self.therapist = TherapistMock.mock_instances(n=1)[0]
+
+        for patient in self.patients:
+            ChatMessageMocker.mock_instances(n_msg_pairs=2, user=patient.user, bot=self.bot)
+
+        self.qs_wrapper = QSWrapper(ChatMessage.objects.all()).branch({
+            UserRole.PATIENT.value: OwnedQS(ownership_fields=['sender', 'receiver']),
+        }, by=QuerysetBranching.USER_GROUP, pass_through=[UserRole.THERAPIST.value])
+
+    def _mock_view(self, user: User):
+        # fetching a fresh user instance to avoid relying on relations cached while mocking
+        return SimpleNamespace(request=SimpleNamespace(user=User.objects.get(pk=user.pk)))
+
+    @tag('qs-branch-owned')
+    def test_branch_owned_single_query(self):
+
+        view = self._mock_view(self.patients[0].user)
+
+        with self.assertNumQueries(1):
+            queryset = self.qs_wrapper()(view)
+
+        self.assertEqual(queryset.count(), 4)
+
+    @tag('qs-branch-pass-through')
+    def test_branch_pass_through_single_query(self):
+
+        view = self._mock_view(self.therapist.user)
+
+        with self.assertNumQueries(1):
+            queryset = self.qs_wrapper()(view)
+
+        self.assertEqual(queryset.count(), 8)
+
+    @tag('qs-branch-rejected')
+    def test_branch_no_matching_group(self):
+
+        user = UserMock.mock_instances(n=1)[0]
+        view = self._mock_view(user)
+
+        with self.assertNumQueries(1):
+            queryset = self.qs_wrapper()(view)
+
+        self.assertEqual(queryset.count(), 0)
+
+    @tag('qs-branch-memoized-roles')
+    def test_branch_roles_resolved_once_per_request(self):
+
+        view = self._mock_view(self.patients[0].user)
+        self.qs_wrapper()(view)
+
+        # the request principal is memoized on the request object for all the following mappers
+        with self.assertNumQueries(0):
+            self.qs_wrapper()(view)
+
+    @tag('qs-branch-profile-ownership')
+    def test_branch_profile_ownership(self):
+
+        qs_wrapper = QSWrapper(User.objects.all()).branch({
+            UserRole.PATIENT.value: PatientOwnedQS(ownership_fields=['patient_profile']),
+        }, by=QuerysetBranching.USER_GROUP)
+
+        patient_view = self._mock_view(self.patients[0].user)
+        therapist_view = self._mock_view(self.therapist.user)
+
+        self.assertEqual(list(qs_wrapper()(patient_view).values_list('pk', flat=True)), [self.patients[0].user.pk])
+        self.assertEqual(qs_wrapper()(therapist_view).count(), 0)
+
+
+class SoftDeleteCascadeTestCase(TestCase):
+
+    def setUp(self):
+        self.patient = PatientMock.mock_instances(n=1)[0]
+        SentimentReportMocker.mock_instances(n=1, n_messages=4, fixed_user=self.patient.user)
+
+    @tag('soft-delete-cascade')
+    def test_soft_delete_cascade_one_update_per_table(self):
+
+        messages = ChatMessage.objects.filter(sender=self.patient.user)
+        n_messages = messages.count()
+
+        with CaptureQueriesContext(connection) as ctx:
+            total, counts = messages.delete()
+
+        updates = [query for query in ctx.captured_queries if query['sql'].startswith('UPDATE')]
+        # one statement for each of the messages, message sentiments and report messages tables
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(counts[ChatMessage._meta.label], n_messages)
+        self.assertEqual(total, sum(counts.values()))
+
+        self.assertFalse(ChatMessage.objects.filter(sender=self.patient.user).exists())
+        self.assertFalse(MessageSentiment.objects.filter(message__sender=self.patient.user).exists())
+        self.assertFalse(ReportSentimentMessage.objects.filter(message__message__sender=self.patient.user).exists())
+
+    @tag('hard-delete-cascade')
+    def test_hard_delete_cascade(self):
+
+        message = ChatMessage.objects.filter(sender=self.patient.user).first()
+        message.hard_delete()
+
+        self.assertFalse(ChatMessage._base_manager.filter(pk=message.pk).exists())
+        self.assertFalse(MessageSentiment._base_manager.filter(message_id=message.pk).exists())
+
+
+class QueryBudgetTestCase(TestCase):
+
+    def setUp(self):
+        self.patient = PatientMock.mock_instances(n=1)[0]
+        bot = ChatBotMocker.mock_instances(n=1)[0]
+        ChatMessageMocker.mock_instances(n_msg_pairs=15, user=self.patient.user, bot=bot)
+
+    def _list(self, viewset, url: str, user: User = None):
+
+        request = APIRequestFactory().get(url)
+        if user is not None:
+            force_authenticate(request, user=User.objects.get(pk=user.pk))
+
+        return viewset.as_view({'get': 'list'})(request)
+
+    @tag('query-budget-chat-messages')
+    def test_chat_messages_list_budget(self):
+
+        with assert_query_budget(self, 'ChatMessageViewset.list'):
+            response = self._list(ChatMessageViewset, 'chat/messages/', self.patient.user)
+
+        self.assertEqual(response.status_code, 200)
+
+    @tag('query-budget-kfupm-departments')
+    def test_kfupm_departments_list_budget(self):
+
+        with assert_query_budget(self, 'KFUPMDeptViewset.list'):
+            response = self._list(KFUPMDeptViewset, 'kfupm-departments/')
+
+        self.assertEqual(response.status_code, 200)
+
+    @tag('query-budget-exceeded')
+    def test_budget_exceeded_reports_duplicates(self):
+
+        with self.assertRaises(AssertionError) as ctx:
+            with assert_query_budget(self, 'ChatMessageViewset.list', budgets={'ChatMessageViewset.list': 1}):
+                for message in ChatMessage.objects.all()[:3]:
+                    User.objects.get(pk=message.sender_id)
+
+        self.assertIn('duplicated queries', str(ctx.exception))
+
+    @tag('query-stats-registry')
+    def test_registry_aggregates_duplicates(self):
+
+        QueryStatsRegistry.reset()
+        recorder = QueryRecorder()
+        recorder.statements = ['SELECT * FROM t WHERE id = %s'] * 3 + ['SELECT * FROM t WHERE id IN (%s, %s)']
+
+        QueryStatsRegistry.record('Viewset.list', recorder)
+        QueryStatsRegistry.record('Viewset.list', QueryRecorder())
+
+        stats = QueryStatsRegistry.snapshot()[0]
+        self.assertEqual((stats.requests, stats.total_queries, stats.max_queries), (2, 4, 4))
+        self.assertEqual(stats.duplicates, {fingerprint('SELECT * FROM t WHERE id = %s'): 3})
+        QueryStatsRegistry.reset()
+
+
+class FastJSONRendererTestCase(TestCase):
+
+    def setUp(self):
+        self.page = {
+            'count': 3,
+            'next': None,
+            'previous': None,
+            'results': [
+                {'id': uuid.uuid4(), 'score': Decimal('0.25'), 'created_at': timezone.now(), 'name': 'تجربة'}
+                for _ in range(3)
+            ],
+        }
+
+    def _render(self, renderer, data, status_code: int = 200) -> bytes:
+        return renderer.render(data, renderer_context={'response': SimpleNamespace(status_code=status_code)})
+
+    @tag('fast-renderer-same-envelope')
+    def test_same_envelope(self):
+
+        for status_code, data in [(200, self.page), (400, {'message': 'invalid', 'data': {'field': ['required']}})]:
+            self.assertEqual(
+                json.loads(self._render(FastJSONRenderer(), data, status_code)),
+                json.loads(self._render(FormattedJSONRenderrer(), data, status_code))
+            )
+
+
+class KeysetPaginationTestCase(TestCase):
+
+    def setUp(self):
+        patient = PatientMock.mock_instances(n=1)[0]
+        bot = ChatBotMocker.mock_instances(n=1)[0]
+        ChatMessageMocker.mock_instances(n_msg_pairs=12, user=patient.user, bot=bot)
+
+        self.queryset = ChatMessage.objects.order_by('-created_at')
+        self.expected_ids = list(ChatMessage.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+
+    def _page(self, cursor: str = None):
+
+        params = {'page_size': 10, **({'cursor': cursor} if cursor else {})}
+        paginator = KeysetPagination()
+        rows = paginator.paginate_queryset(self.queryset, Request(APIRequestFactory(SERVER_NAME='localhost').get('/chat/messages/', params)))
+
+        return [row.id for row in rows], paginator
+
+    def _cursor(self, link: str) -> str:
+        return parse_qs(urlparse(link).query)['cursor'][0]
+
+    @tag('keyset-pagination-walk')
+    def test_walk_forward_and_back(self):
+
+        first_ids, paginator = self._page()
+        self.assertIsNone(paginator.get_previous_link())
+
+        collected, current = list(first_ids), paginator
+        while current.get_next_link():
+            ids, current = self._page(self._cursor(current.get_next_link()))
+            collected.extend(ids)
+
+        self.assertEqual(collected, self.expected_ids)
+
+        second_ids, second = self._page(self._cursor(paginator.get_next_link()))
+        previous_ids, _ = self._page(self._cursor(second.get_previous_link()))
+        self.assertEqual(previous_ids, first_ids)
+
+    @tag('keyset-pagination-no-count')
+    def test_single_query_without_count(self):
+
+        with CaptureQueriesContext(connection) as ctx:
+            self._page()
+
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('COUNT', ctx.captured_queries[0]['sql'].upper())
+
+
+class UnderEstimatedCount(CountStrategy):
+    """count strategy reporting a fixed (under) estimate, standing for the planner estimates of PostgreSQL"""
+
+    def count(self, queryset):
+        return 5, True
+
+
+class CountStrategyTestCase(CachedStateTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patient = PatientMock.mock_instances(n=1)[0]
+        bot = ChatBotMocker.mock_instances(n=1)[0]
+        ChatMessageMocker.mock_instances(n_msg_pairs=12, user=patient.user, bot=bot)
+
+        self.queryset = ChatMessage.objects.order_by('-created_at', '-id')
+
+    @tag('count-strategy-cache')
+    def test_cached_count_reused_for_same_filters(self):
+
+        strategy = CountStrategy(cache_timeout=30)
+        self.assertEqual(strategy.count(self.queryset), (24, False))
+
+        # the cached count may be stale, so it is reported as approximate
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(strategy.count(self.queryset.order_by('id')), (24, True))
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        # a different filter set is counted on its own
+        self.assertEqual(strategy.count(self.queryset.filter(sender=self.queryset.first().sender)), (12, False))
+
+    @tag('count-strategy-estimate-pages')
+    def test_estimated_count_does_not_truncate_pages(self):
+
+        paginator = CountStrategyPaginator(self.queryset, 10, count_strategy=UnderEstimatedCount())
+
+        first, last = paginator.page(1), paginator.page(3)
+        self.assertTrue(paginator.approximate)
+        self.assertEqual((len(first), first.has_next()), (10, True))
+        self.assertEqual((len(last), last.has_next()), (4, False))
+
+
+class StudentImportTestCase(CachedStateTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.department = KFUPMDepartment.objects.create(short_name='ICS', long_name='Information and Computer Science')
+        self.existing = UserMock.mock_instances(n=1)[0]
+
+    @tag('student-import-csv')
+    def test_import_csv(self):
+
+        content = '\n'.join([
+            'email,username,department,password',
+            'First@KFUPM.edu.sa,first,ICS,first-password',
+            'first@kfupm.edu.sa,first again,ICS,',
+            f'{self.existing.email},existing,ICS,',
+            'second@kfupm.edu.sa,second,,',
+            'third@kfupm.edu.sa,third,UNKNOWN,',
+            ',missing email,ICS,',
+        ])
+
+        rows, errors = parse_students(content)
+        result = import_students(rows)
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual((result.created, result.skipped_existing, result.skipped_duplicates, len(result.errors)), (2, 1, 1, 1))
+
+        first = StudentPatient.objects.select_related('user').get(user__email='first@kfupm.edu.sa')
+        self.assertEqual(first.department_id, self.department.pk)
+        self.assertTrue(first.user.check_password('first-password'))
+        self.assertEqual(list(first.user.groups.values_list('pk', flat=True)), [StudentPatient.get_group_id()])
+        self.assertFalse(StudentPatient.objects.get(user__email='second@kfupm.edu.sa').user.has_usable_password())
+
+    @tag('student-import-bulk-queries')
+    def test_import_constant_queries(self):
+
+        content = '\n'.join(f'{{"email": "student{i}@kfupm.edu.sa", "username": "student {i}", "department": "ICS"}}' for i in range(50))
+        rows, _ = parse_students(content, JSONL_FORMAT)
+        StudentPatient.get_group_id()
+
+        # departments, existing emails, and one insert per table (within a savepoint)
+        with self.assertNumQueries(7):
+            result = import_students(rows)
+
+        self.assertEqual(result.created, 50)
+
+    @tag('student-import-existing-case')
+    def test_existing_email_case_insensitive(self):
+
+        User.objects.filter(pk=self.existing.pk).update(email='Registered@KFUPM.edu.sa')
+        rows, _ = parse_students('email,username,department\nregistered@kfupm.edu.sa,registered,ICS')
+
+        result = import_students(rows)
+        self.assertEqual((result.created, result.skipped_existing), (0, 1))
+
+    @tag('student-import-concurrent')
+    def test_concurrently_registered_email(self):
+
+        rows, _ = parse_students('email,username,department\nlate@kfupm.edu.sa,late,ICS\nfree@kfupm.edu.sa,free,ICS')
+        checks = []
+
+        def registered_during_import(emails):
+            # the email is registered by another import right after the first check
+            if not checks:
+                User.objects.create(username='late', email='late@kfupm.edu.sa')
+            checks.append(emails)
+            return registered_emails(emails) if len(checks) > 1 else set()
+
+        with mock.patch.object(student_import, 'registered_emails', registered_during_import):
+            result = import_students(rows)
+
+        self.assertEqual((result.created, result.skipped_existing), (1, 1))
+        self.assertTrue(StudentPatient.objects.filter(user__email='free@kfupm.edu.sa').exists())
+
+
+class UserSearchTestCase(CachedStateTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.therapist = TherapistMock.mock_instances(n=1)[0]
+        self.patients = PatientMock.mock_instances(n=3)
+
+        User.objects.filter(pk=self.patients[0].user_id).update(username='أحمد الغامدي', first_name='Ahmad')
+        User.objects.filter(pk=self.patients[1].user_id).update(username='Zubaida Qasim', first_name='Zubaida')
+
+    def _search(self, query: str):
+
+        request = APIRequestFactory().get('/patients/search/', {'q': query})
+        force_authenticate(request, user=User.objects.get(pk=self.therapist.user_id))
+
+        return PatientViewSet.as_view({'get': 'search'})(request)
+
+    @tag('user-search-arabic-normalization')
+    def test_arabic_normalization(self):
+
+        self.assertEqual(normalize_search_text(' أَحْمَد '), normalize_search_text('احمد'))
+        self.assertEqual(normalize_search_text('مدرسة'), 'مدرسه')
+        self.assertEqual(normalize_search_text('ZUBAIDA'), 'zubaida')
+
+    @tag('user-search-action')
+    def test_search_patients(self):
+
+        response = self._search('zubaida')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.patients[1].user_id])
+
+        response = self._search('الغامدي')
+        self.assertEqual([row['id'] for row in response.data['results']], [self.patients[0].user_id])
+
+        self.assertEqual(self._search('x').status_code, 400)
@@ -2,7 +2,7 @@
 Generic utility custom pydnatic types 
 """
 import datetime
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 from pydantic import BaseModel as Model, model_validator
 
 
@@ -48,3 +48,57 @@ class DatetimeWeeklySchedule(DatetimeInterval):
     tuesday: Optional[List[Tuple[datetime.datetime, datetime.datetime]]]
     wednesday: Optional[List[Tuple[datetime.datetime, datetime.datetime]]]
     thursday: Optional[List[Tuple[datetime.datetime, datetime.datetime]]]
+
+
+class BenchmarkResult(Model):
+    """
+        Used to store the measurements of a single benchmarked code path
+    """
+    label: str
+    iterations: int
+    queries: float ## average number of SQL queries per iteration
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    response_bytes: Optional[float] = None ## average size of the HTTP response body (for endpoint benchmarks)
+
+
+class EndpointQueryStats(Model):
+    """
+        Used to store the SQL query measurements aggregated for a single (viewset, action) endpoint
+    """
+    endpoint: str
+    requests: int = 0
+    total_queries: int = 0
+    max_queries: int = 0
+    total_sql_ms: float = 0
+    # highest number of times each duplicated query fingerprint was repeated within a single request
+    duplicates: Dict[str, int] = {}
+
+    @property
+    def avg_queries(self) -> float:
+        return self.total_queries / self.requests if self.requests else 0
+
+    @property
+    def avg_sql_ms(self) -> float:
+        return self.total_sql_ms / self.requests if self.requests else 0
+
+
+class StudentImportRow(Model):
+    """
+        Used to store a single KFUPM student read from an import file
+    """
+    email: str
+    username: str
+    department: Optional[str] = None ## short name of the KFUPM department
+    password: Optional[str] = None ## students without a password get an unusable one (set later through a password reset)
+
+
+class StudentImportResult(Model):
+    """
+        Used to store the outcome of a bulk student import
+    """
+    created: int = 0
+    skipped_existing: int = 0 ## rows whose email is already registered
+    skipped_duplicates: int = 0 ## rows repeating an email already read from the same file
+    errors: List[str] = []
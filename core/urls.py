@@ -1,11 +1,14 @@
 
 from rest_framework.routers import DefaultRouter
-from .views import KFUPMDeptViewset, PatientViewSet, TherapistViewSet
+from chat.views import ReferenceCacheStatsViewset
+from .views import KFUPMDeptViewset, PatientViewSet, QueryStatsViewset, TherapistViewSet
 
 router = DefaultRouter()
 
 router.register(r'kfupm-departments', KFUPMDeptViewset, basename='kfupm-departments')
 router.register(r'patients', PatientViewSet, basename='patients')
 router.register(r'therapists', TherapistViewSet, basename='therapists')
+router.register(r'admin-stats/queries', QueryStatsViewset, basename='query-stats')
+router.register(r'admin-stats/reference-cache', ReferenceCacheStatsViewset, basename='reference-cache-stats')
 
 urlpatterns = router.urls
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+    utilities used to measure the latency and SQL round trips of a code path
+    for benchmarking management commands
+"""
+import json
+import math
+import statistics
+import time
+from typing import Any, Callable, Dict, List, Tuple
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from core.types import BenchmarkResult
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """
+        nearest-rank percentile of a list of samples
+
+        @param samples: the measured samples
+        @param pct: the percentile to compute in the range of 0-100
+    """
+
+    if not samples:
+        return 0.0
+
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def count_queries(function: Callable[[], Any]) -> Tuple[int, Any]:
+    """
+        run the passed function once and count the SQL queries it executed
+
+        @return: the number of executed queries, and the return value of the function
+    """
+
+    with CaptureQueriesContext(connection) as context:
+        result = function()
+
+    return len(context.captured_queries), result
+
+
+def run_benchmark(label: str, function: Callable[[], Any], iterations: int = 20, warmup: int = 1) -> BenchmarkResult:
+    """
+        run the passed function multiple times, while recording its latency and the number of SQL queries it fires
+
+        @param label: a descriptive name of the benchmarked code path
+        @param function: a function with no arguments wrapping the benchmarked code path
+        @param iterations: the number of measured runs
+        @param warmup: the number of unmeasured runs used to warm up caches and connections
+    """
+
+    for _ in range(warmup):
+        function()
+
+    timings: List[float] = []
+    total_queries = 0
+    sizes: List[int] = []
+
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            result = function()
+            timings.append((time.perf_counter() - start) * 1000)
+        total_queries += len(context.captured_queries)
+
+        # HTTP responses returned by the benchmarked function are measured by their body size
+        if hasattr(result, 'content'):
+            sizes.append(len(result.content))
+
+    return BenchmarkResult(
+        label=label,
+        iterations=iterations,
+        queries=total_queries / max(1, iterations),
+        mean_ms=statistics.fmean(timings) if timings else 0.0,
+        p50_ms=percentile(timings, 50),
+        p95_ms=percentile(timings, 95),
+        response_bytes=statistics.fmean(sizes) if sizes else None,
+    )
+
+
+def format_results(results: List[BenchmarkResult]) -> str:
+    """format a list of benchmark results into a printable table"""
+
+    header = f'{"benchmark":<50} {"queries":>8} {"mean(ms)":>10} {"p50(ms)":>10} {"p95(ms)":>10} {"bytes":>10}'
+    rows = [
+        f'{result.label:<50} {result.queries:>8.1f} {result.mean_ms:>10.2f} {result.p50_ms:>10.2f} {result.p95_ms:>10.2f} '
+        f'{f"{result.response_bytes:.0f}" if result.response_bytes is not None else "-":>10}'
+        for result in results
+    ]
+
+    return '\n'.join([header, '-' * len(header), *rows])
+
+
+def save_baseline(results: List[BenchmarkResult], path: str):
+    """store the benchmark results as a JSON baseline for later comparisons"""
+
+    with open(path, 'w') as f:
+        json.dump([result.model_dump() for result in results], f, indent=4)
+
+
+def load_baseline(path: str) -> Dict[str, BenchmarkResult]:
+    """load a JSON baseline of benchmark results, keyed by the benchmark label"""
+
+    with open(path) as f:
+        return {result['label']: BenchmarkResult(**result) for result in json.load(f)}
+
+
+def compare_results(results: List[BenchmarkResult], baseline: Dict[str, BenchmarkResult], threshold: float = 10.0) -> Tuple[str, List[str]]:
+    """
+        compare benchmark results against a baseline
+
+        @param results: the current benchmark results
+        @param baseline: the baseline results keyed by their label
+        @param threshold: the allowed p95 latency increase (in percent) before flagging a regression
+        @return: a printable comparison table, and the labels of the regressed benchmarks
+        (a higher query count than the baseline is always a regression)
+    """
+
+    def delta(current: float, previous: float) -> float:
+        return (current - previous) / previous * 100 if previous else 0.0
+
+    header = f'{"benchmark":<50} {"queries":>14} {"p50 delta":>10} {"p95 delta":>10} {"bytes delta":>12}'
+    rows, regressions = [header, '-' * len(header)], []
+
+    for result in results:
+        previous = baseline.get(result.label)
+        if previous is None:
+            rows.append(f'{result.label:<50} {"(new)":>14}')
+            continue
+
+        p95_delta = delta(result.p95_ms, previous.p95_ms)
+        bytes_delta = delta(result.response_bytes or 0, previous.response_bytes or 0)
+        regressed = p95_delta > threshold or result.queries > previous.queries
+        if regressed:
+            regressions.append(result.label)
+
+        rows.append(
+            f'{result.label:<50} {f"{previous.queries:.1f}->{result.queries:.1f}":>14} {delta(result.p50_ms, previous.p50_ms):>+9.1f}% '
+            f'{p95_delta:>+9.1f}% {bytes_delta:>+11.1f}%' + (' REGRESSED' if regressed else '')
+        )
+
+    return '\n'.join(rows), regressions
@@ -0,0 +1,48 @@
+"""
+    bloom filter used as a compact in-memory pre-check of set membership, answering
+    "definitely absent" without false negatives, and "maybe present" otherwise
+"""
+import hashlib
+import math
+from typing import Iterable, Iterator
+
+
+class BloomFilter:
+    """
+        fixed-size bloom filter over string keys, sized for a capacity and a target false positive rate
+        (inserting more keys than the capacity only raises the false positive rate)
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001, keys: Iterable[str] = ()):
+        """
+            @param capacity: the expected number of inserted keys
+            @param error_rate: the target false positive rate once the capacity is reached
+            @param keys: keys inserted right away
+        """
+
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+        for key in keys:
+            self.add(key)
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # double hashing: the k positions are derived from the two halves of a single digest
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def __len__(self) -> int:
+        return self.count
@@ -0,0 +1,54 @@
+"""
+    size-bounded in-memory cache evicting its least recently used entries and its expired entries,
+    used for process-local caches of hot read paths
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Tuple
+
+
+class LRUCache:
+    """
+        thread-safe mapping holding at most max_size entries, each one living for ttl seconds
+        (the expired entries are dropped when read, or evicted like any other entry)
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+            @param max_size: the maximum number of entries, above which the least recently used ones are evicted
+            @param ttl: the seconds after which an entry expires
+        """
+
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        # key -> (monotonic expiry, value), ordered from the least to the most recently used
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
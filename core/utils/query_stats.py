@@ -0,0 +1,147 @@
+"""
+    utilities used to record the SQL queries issued by each (viewset, action) endpoint,
+    and to enforce the query budgets checked in for the endpoints within the tests
+"""
+import json
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db import connection
+from core.types import EndpointQueryStats
+
+# attribute set on the HTTP request by the AugmentedViewSet to label the served endpoint
+QUERY_STATS_ENDPOINT_ATTR = '_query_stats_endpoint'
+# maximum number of duplicated query fingerprints kept per endpoint
+MAX_DUPLICATES_PER_ENDPOINT = 20
+
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+_IN_LIST_PATTERN = re.compile(r'\bIN \((?:%s|\?)(?:, ?(?:%s|\?))*\)', re.IGNORECASE)
+_STRING_LITERAL_PATTERN = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL_PATTERN = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+def get_endpoint_label(viewset, action: Optional[str]) -> str:
+    return f'{type(viewset).__name__}.{action}'
+
+
+def fingerprint(sql: str) -> str:
+    """
+        normalize a SQL statement so that the same query issued with different parameters
+        (e.g. once per serialized row) maps to the same fingerprint
+    """
+
+    sql = _WHITESPACE_PATTERN.sub(' ', sql).strip()
+    sql = _STRING_LITERAL_PATTERN.sub('?', sql)
+    sql = _NUMBER_LITERAL_PATTERN.sub('?', sql)
+
+    return _IN_LIST_PATTERN.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """
+        DB execute wrapper recording the statements and the SQL time spent within a request
+    """
+
+    def __init__(self):
+        self.statements: List[str] = []
+        self.sql_ms = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_ms += (time.perf_counter() - start) * 1000
+            self.statements.append(sql)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def duplicates(self) -> Dict[str, int]:
+        """get the fingerprints of the queries repeated within the request, with their repetition count"""
+        return {sql: count for sql, count in Counter(map(fingerprint, self.statements)).items() if count > 1}
+
+
+class QueryStatsRegistry:
+    """
+        process-wide registry aggregating the recorded query stats of every endpoint
+        NOTE: every worker process holds its own registry
+    """
+
+    _lock = threading.Lock()
+    _stats: Dict[str, EndpointQueryStats] = dict()
+
+    @staticmethod
+    def record(endpoint: str, recorder: QueryRecorder):
+
+        duplicates = recorder.duplicates()
+
+        with QueryStatsRegistry._lock:
+            stats = QueryStatsRegistry._stats.setdefault(endpoint, EndpointQueryStats(endpoint=endpoint))
+            stats.requests += 1
+            stats.total_queries += recorder.count
+            stats.max_queries = max(stats.max_queries, recorder.count)
+            stats.total_sql_ms += recorder.sql_ms
+
+            for sql, count in duplicates.items():
+                if sql in stats.duplicates or len(stats.duplicates) < MAX_DUPLICATES_PER_ENDPOINT:
+                    stats.duplicates[sql] = max(stats.duplicates.get(sql, 0), count)
+
+    @staticmethod
+    def snapshot() -> List[EndpointQueryStats]:
+        """get a copy of the stats of all endpoints, sorted by the highest average query count"""
+
+        with QueryStatsRegistry._lock:
+            stats = [endpoint_stats.model_copy(deep=True) for endpoint_stats in QueryStatsRegistry._stats.values()]
+
+        return sorted(stats, key=lambda endpoint_stats: endpoint_stats.avg_queries, reverse=True)
+
+    @staticmethod
+    def reset():
+        with QueryStatsRegistry._lock:
+            QueryStatsRegistry._stats.clear()
+
+
+# ---------------- Query budget test helpers ----------------
+
+def load_query_budgets(path: Optional[str] = None) -> Dict[str, int]:
+    """
+        load the checked-in maximum query count of every endpoint, keyed by "<viewset>.<action>"
+
+        @param path: path of the JSON budget file (defaults to the QUERY_BUDGET_FILE setting)
+    """
+
+    with open(path or settings.QUERY_BUDGET_FILE) as f:
+        return json.load(f)
+
+
+@contextmanager
+def assert_query_budget(testcase, endpoint: str, budgets: Optional[Dict[str, int]] = None):
+    """
+        fail the test when the queries issued within the context exceed the budget of the endpoint
+
+        @param testcase: the running test case
+        @param endpoint: the endpoint label as "<viewset>.<action>" (e.g. "ChatMessageViewset.list")
+        @param budgets: the query budgets (defaults to the checked-in budget file)
+    """
+
+    budgets = budgets if budgets is not None else load_query_budgets()
+    if endpoint not in budgets:
+        testcase.fail(f'No query budget is defined for {endpoint} in {settings.QUERY_BUDGET_FILE}')
+
+    recorder = QueryRecorder()
+    with connection.execute_wrapper(recorder):
+        yield recorder
+
+    if recorder.count > budgets[endpoint]:
+        duplicates = '\n'.join(f'  {count}x {sql}' for sql, count in recorder.duplicates().items())
+        testcase.fail(
+            f'{endpoint} issued {recorder.count} queries, exceeding its budget of {budgets[endpoint]}'
+            + (f'\nduplicated queries:\n{duplicates}' if duplicates else '')
+        )
@@ -0,0 +1,267 @@
+"""
+    utilities used to seed large volumes of realistic records, generating the rows in worker
+    processes and writing them with PostgreSQL COPY (or bulk_create on other databases)
+
+    NOTE: the row generators never touch the DB, every foreign key is derived from
+    the id ranges reserved upfront by the seeding process
+"""
+import io
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Tuple
+from django.db import connection
+
+# shared vocabulary used to build the generated texts without calling faker for every row
+SEED_VOCABULARY_SIZE = 2000
+
+
+def reserve_ids(model: type, n: int) -> int:
+    """
+        reserve a contiguous range of n primary keys for the model
+
+        @return: the first id of the reserved range
+    """
+
+    table, pk_column = model._meta.db_table, model._meta.pk.column
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [table, pk_column])
+            sequence = cursor.fetchone()[0]
+            cursor.execute('SELECT setval(%s, nextval(%s) + %s - 1)', [sequence, sequence, n])
+            return cursor.fetchone()[0] - n + 1
+
+        cursor.execute(f'SELECT MAX({connection.ops.quote_name(pk_column)}) FROM {connection.ops.quote_name(table)}')
+        return (cursor.fetchone()[0] or 0) + 1
+
+
+def get_columns(model: type, include_pk: bool = True) -> Tuple[List[str], Dict[str, Any]]:
+    """
+        get the written columns of the model table, along with the value written for the columns
+        that are not generated (the field default, or NULL)
+    """
+
+    columns, defaults = [], {}
+    for field in model._meta.concrete_fields:
+        if field.primary_key and not include_pk:
+            continue
+
+        columns.append(field.column)
+        default = field.get_default() if field.has_default() else None
+        defaults[field.column] = default() if callable(default) else default
+
+    return columns, defaults
+
+
+# ---------------- row generators ----------------
+
+def _text(rng: random.Random, ctx: Dict, min_words: int = 8, max_words: int = 40) -> str:
+    return ' '.join(rng.choices(ctx['vocabulary'], k=rng.randint(min_words, max_words)))
+
+def _timestamp(ctx: Dict, index: int, spacing_seconds: int = 60) -> datetime:
+    return ctx['base_time'] + timedelta(seconds=index * spacing_seconds)
+
+def _score(rng: random.Random) -> Decimal:
+    return Decimal(rng.randint(0, 100)) / 100
+
+
+def generate_users(start: int, count: int, ctx: Dict) -> List[Dict]:
+    rng = random.Random(ctx['seed'] + start)
+    rows = []
+
+    for index in range(start, start + count):
+        user_id = ctx['user_start'] + index
+        first_name, last_name = rng.choice(ctx['first_names']), rng.choice(ctx['last_names'])
+        created_at = _timestamp(ctx, index)
+
+        rows.append({
+            'id': user_id,
+            'password': ctx['password_hash'],
+            'username': f'{first_name} {last_name}',
+            'first_name': first_name,
+            'last_name': last_name,
+            'email': f'seed-{ctx["run_id"]}-{user_id}@seed.jusoor.test',
+            'is_active': True,
+            'date_joined': created_at,
+            'created_at': created_at,
+            'last_updated_at': created_at,
+        })
+
+    return rows
+
+
+def generate_profiles(start: int, count: int, ctx: Dict) -> List[Dict]:
+    """generate the patient (first seeded users) or therapist (remaining seeded users) profiles, depending on ctx['profile']"""
+    rng = random.Random(ctx['seed'] + start)
+    rows = []
+
+    for index in range(start, start + count):
+        created_at = _timestamp(ctx, index)
+        row = {'created_at': created_at, 'last_updated_at': created_at}
+
+        if ctx['profile'] == 'patient':
+            row.update(id=ctx['patient_start'] + index, user_id=ctx['user_start'] + index,
+                       department_id=rng.choice(ctx['department_ids']) if ctx['department_ids'] else None)
+        else:
+            row.update(id=ctx['therapist_start'] + index, user_id=ctx['user_start'] + ctx['n_patients'] + index, bio=_text(rng, ctx))
+
+        rows.append(row)
+
+    return rows
+
+
+def generate_user_groups(start: int, count: int, ctx: Dict) -> List[Dict]:
+    rows = []
+
+    for index in range(start, start + count):
+        is_patient = index < ctx['n_patients']
+        rows.append({
+            'user_id': ctx['user_start'] + index,
+            'group_id': ctx['patient_group_id'] if is_patient else ctx['therapist_group_id'],
+        })
+
+    return rows
+
+
+def generate_timeslots(start: int, count: int, ctx: Dict) -> List[Dict]:
+    rows = []
+
+    for index in range(start, start + count):
+        start_at = ctx['base_time'] + timedelta(hours=index % ctx['timeslots_per_therapist'], days=index % 30)
+        rows.append({
+            'id': ctx['timeslot_start'] + index,
+            'therapist_id': ctx['therapist_start'] + index // ctx['timeslots_per_therapist'],
+            'start_at': start_at,
+            'end_at': start_at + timedelta(minutes=50),
+            'active': True,
+            'created_at': start_at,
+            'last_updated_at': start_at,
+        })
+
+    return rows
+
+
+def generate_appointments(start: int, count: int, ctx: Dict) -> List[Dict]:
+    """generate one appointment for each of the first timeslots"""
+    rows = []
+
+    for index in range(start, start + count):
+        start_at = ctx['base_time'] + timedelta(hours=index % ctx['timeslots_per_therapist'], days=index % 30)
+        rows.append({
+            'id': ctx['appointment_start'] + index,
+            'timeslot_id': ctx['timeslot_start'] + index,
+            'patient_id': ctx['patient_start'] + index % ctx['n_patients'],
+            'status': ctx['appointment_status'],
+            'start_at': start_at,
+            'end_at': start_at + timedelta(minutes=50),
+            'created_at': start_at,
+            'last_updated_at': start_at,
+        })
+
+    return rows
+
+
+def generate_therapist_assignments(start: int, count: int, ctx: Dict) -> List[Dict]:
+    rows = []
+
+    for index in range(start, start + count):
+        created_at = _timestamp(ctx, index)
+        rows.append({
+            'therapist_timeslot_id': ctx['timeslot_start'] + index,
+            'appointment_id': ctx['appointment_start'] + index,
+            'status': ctx['assignment_status'],
+            'created_at': created_at,
+            'last_updated_at': created_at,
+        })
+
+    return rows
+
+
+def generate_messages(start: int, count: int, ctx: Dict) -> List[Dict]:
+    """generate alternating patient/bot messages, every patient owning a contiguous block of message pairs"""
+    rng = random.Random(ctx['seed'] + start)
+    messages_per_patient = 2 * ctx['message_pairs_per_patient']
+    rows = []
+
+    for index in range(start, start + count):
+        patient_user_id = ctx['user_start'] + index // messages_per_patient
+        from_patient = index % 2 == 0
+        created_at = _timestamp(ctx, index % messages_per_patient, spacing_seconds=30)
+
+        rows.append({
+            'id': ctx['message_start'] + index,
+            'content': _text(rng, ctx),
+            'sender_id': patient_user_id if from_patient else ctx['bot_user_id'],
+            'receiver_id': ctx['bot_user_id'] if from_patient else patient_user_id,
+            'read': True,
+            'created_at': created_at,
+            'last_updated_at': created_at,
+        })
+
+    return rows
+
+
+def generate_sentiments(start: int, count: int, ctx: Dict) -> List[Dict]:
+    """generate the sentiment of every message sent by a patient (the even message indexes)"""
+    rng = random.Random(ctx['seed'] + start)
+    rows = []
+
+    for index in range(start, start + count):
+        created_at = _timestamp(ctx, index)
+        rows.append({
+            'message_id': ctx['message_start'] + 2 * index,
+            **{score: _score(rng) for score in ctx['sentiment_scores']},
+            'created_at': created_at,
+            'last_updated_at': created_at,
+        })
+
+    return rows
+
+
+# ---------------- serialization and writing ----------------
+
+def _csv_value(value: Any) -> str:
+    """serialize a CSV value, quoting every non-NULL value so that only the unquoted empty values are read as NULL by COPY"""
+
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        value = 't' if value else 'f'
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def generate_chunk(generator: Callable[[int, int, Dict], List[Dict]], start: int, count: int, ctx: Dict, columns: List[str], defaults: Dict[str, Any], as_csv: bool):
+    """
+        generate a chunk of rows within a worker process
+
+        @return: the rows serialized as a CSV payload ready for COPY, or the list of row dicts
+    """
+
+    rows = generator(start, count, ctx)
+    if not as_csv:
+        return rows
+
+    return ''.join(
+        ','.join(_csv_value(row.get(column, defaults[column])) for column in columns) + '\n'
+        for row in rows
+    )
+
+
+def write_chunk(model: type, columns: List[str], payload):
+    """write a generated chunk using COPY for CSV payloads, or bulk_create for row dicts"""
+
+    if isinstance(payload, str):
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {qn(model._meta.db_table)} ({", ".join(qn(column) for column in columns)}) FROM STDIN WITH (FORMAT csv)',
+                io.StringIO(payload)
+            )
+        return
+
+    attnames = {field.column: field.attname for field in model._meta.concrete_fields}
+    model._base_manager.bulk_create([model(**{attnames.get(key, key): value for key, value in row.items()}) for row in payload])
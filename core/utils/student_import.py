@@ -0,0 +1,180 @@
+"""
+    utilities used to import KFUPM students in bulk from CSV or JSONL files, hashing
+    their passwords in parallel and writing the users, patient profiles and group
+    memberships with one bulk insert per table
+"""
+import csv
+import io
+import json
+from concurrent.futures import Executor
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models.functions import Lower
+from pydantic import ValidationError
+from core.models import KFUPMDepartment, StudentPatient
+from core.types import StudentImportResult, StudentImportRow
+
+CSV_FORMAT = 'csv'
+JSONL_FORMAT = 'jsonl'
+IMPORT_FORMATS = (CSV_FORMAT, JSONL_FORMAT)
+
+# number of rows written by every bulk insert statement
+IMPORT_BATCH_SIZE = 2000
+# number of passwords sent at once to every hashing worker
+HASH_CHUNK_SIZE = 64
+# number of times the students are written when their emails get registered concurrently
+IMPORT_WRITE_ATTEMPTS = 3
+
+
+def detect_format(filename: str) -> str:
+    """guess the format of an import file from its extension (CSV by default)"""
+    return JSONL_FORMAT if filename.lower().endswith(('.jsonl', '.ndjson')) else CSV_FORMAT
+
+
+def parse_students(content: str, fmt: str = CSV_FORMAT) -> Tuple[List[StudentImportRow], List[str]]:
+    """
+        parse the students of an import file
+
+        @param content: the decoded content of the file (CSV with a header row, or one JSON object per line)
+        @param fmt: the format of the file (csv or jsonl)
+        @return: the valid rows, and the errors of the invalid ones
+    """
+
+    if fmt == JSONL_FORMAT:
+        records: Iterable = (
+            (number, line) for number, line in enumerate(content.splitlines(), start=1) if line.strip()
+        )
+    else:
+        # the line numbers count the header row
+        records = enumerate(csv.DictReader(io.StringIO(content)), start=2)
+
+    rows, errors = [], []
+    for number, record in records:
+        try:
+            if fmt == JSONL_FORMAT:
+                record = json.loads(record)
+            rows.append(StudentImportRow(**{key: value or None for key, value in record.items() if key}))
+        except (ValueError, TypeError, AttributeError, ValidationError) as e:
+            errors.append(f'line {number}: {e}')
+
+    return rows, errors
+
+
+def hash_passwords(passwords: List[Optional[str]], executor: Optional[Executor] = None, default_password: Optional[str] = None) -> List[str]:
+    """
+        hash the passwords of the imported students
+
+        @param passwords: the raw passwords (None for the students without a password)
+        @param executor: the pool hashing the passwords in parallel (process or thread pool, as PBKDF2 releases the GIL)
+        @param default_password: password of the students without one, hashed once and shared by all of them
+        (when not passed, these students get an unusable password)
+    """
+
+    default_hash = make_password(default_password) if default_password else None
+    raw = [password for password in passwords if password]
+
+    if executor is not None:
+        hashed = iter(list(executor.map(make_password, raw, chunksize=HASH_CHUNK_SIZE)))
+    else:
+        hashed = iter([make_password(password) for password in raw])
+
+    return [next(hashed) if password else default_hash or make_password(None) for password in passwords]
+
+
+def registered_emails(emails: List[str]) -> Set[str]:
+    """
+        find the already registered emails among lowercased ones, case insensitively
+
+        @return: the lowercased registered emails (including those of the soft deleted users, which stay unique)
+    """
+
+    return set(get_user_model()._base_manager.annotate(lowered_email=Lower('email')).filter(
+        lowered_email__in=emails
+    ).values_list('lowered_email', flat=True))
+
+
+def write_students(students: List[Tuple[str, StudentImportRow]], password_hashes: List[str], departments: Dict[str, int]) -> list:
+    """
+        write the users, patient profiles and group memberships of the students with one bulk insert per table
+
+        @return: the created users
+    """
+
+    User = get_user_model()
+
+    with transaction.atomic():
+        users = User.objects.bulk_create([
+            User(username=User.normalize_username(row.username), email=email, password=password_hash)
+            for (email, row), password_hash in zip(students, password_hashes)
+        ], batch_size=IMPORT_BATCH_SIZE)
+
+        StudentPatient.objects.bulk_create([
+            StudentPatient(user=user, department_id=departments.get(row.department))
+            for user, (_, row) in zip(users, students)
+        ], batch_size=IMPORT_BATCH_SIZE)
+
+        group_id = StudentPatient.get_group_id()
+        User.groups.through.objects.bulk_create([
+            User.groups.through(user_id=user.pk, group_id=group_id) for user in users
+        ], batch_size=IMPORT_BATCH_SIZE)
+
+    return users
+
+
+def import_students(rows: List[StudentImportRow], executor: Optional[Executor] = None, default_password: Optional[str] = None) -> StudentImportResult:
+    """
+        create the patient accounts of the imported students, skipping the already registered emails
+
+        @param rows: the parsed student rows
+        @param executor: the pool hashing the passwords in parallel
+        @param default_password: password shared by the students without one
+    """
+
+    result = StudentImportResult()
+
+    # 1. keep the first row of every email
+    unique = {}
+    for row in rows:
+        email = row.email.strip().lower()
+        if email in unique:
+            result.skipped_duplicates += 1
+        else:
+            unique[email] = row
+
+    # 2. resolve all the departments, and all the already registered emails, with one query each
+    departments = dict(KFUPMDepartment.objects.filter(
+        short_name__in={row.department for row in unique.values() if row.department}
+    ).values_list('short_name', 'pk'))
+    existing = registered_emails(list(unique))
+
+    students = []
+    for email, row in unique.items():
+        if email in existing:
+            result.skipped_existing += 1
+        elif row.department and row.department not in departments:
+            result.errors.append(f'{email}: unknown department {row.department}')
+        else:
+            students.append((email, row))
+
+    # 3. hash the passwords in parallel, then write every table in bulk
+    password_hashes = hash_passwords([row.password for _, row in students], executor=executor, default_password=default_password)
+
+    for attempt in range(IMPORT_WRITE_ATTEMPTS):
+        try:
+            users = write_students(students, password_hashes, departments)
+            break
+        except IntegrityError:
+            # some emails were registered (e.g. by a concurrent import) since they were checked: they are skipped
+            taken = registered_emails([email for email, _ in students])
+            if not taken or attempt == IMPORT_WRITE_ATTEMPTS - 1:
+                raise
+
+            kept = [index for index, (email, _) in enumerate(students) if email not in taken]
+            result.skipped_existing += len(students) - len(kept)
+            students = [students[index] for index in kept]
+            password_hashes = [password_hashes[index] for index in kept]
+
+    result.created = len(users)
+    return result
@@ -1,5 +1,8 @@
-from typing import Dict
+from typing import Callable, Dict, Tuple
 from urllib import parse
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase, TransactionTestCase
 from authentication.models import User
 from rest_framework.test import force_authenticate
 
@@ -16,3 +19,35 @@ def auth_request(factory_function, url: str, body: Dict = None, user: User = Use
     force_authenticate(request, user=user)
 
     return request
+
+
+class CachedStateResetMixin:
+    """
+    test mixin starting and ending every test with an empty fast cache, and with the process-wide state
+    of the services listed in reset_state dropped (the cached ids of the fast cache may otherwise
+    point at the rows of a previous test)
+    """
+
+    # callables dropping the process-wide state of the services used by the tests (e.g. AgentRegistry.clear)
+    reset_state: Tuple[Callable[[], None], ...] = ()
+
+    def setUp(self):
+        super().setUp()
+        self.reset_cached_state()
+
+    def tearDown(self):
+        self.reset_cached_state()
+        super().tearDown()
+
+    def reset_cached_state(self):
+        caches[settings.FAST_CACHE_ALIAS].clear()
+        for reset in self.reset_state:
+            reset()
+
+
+class CachedStateTestCase(CachedStateResetMixin, TestCase):
+    pass
+
+
+class CachedStateTransactionTestCase(CachedStateResetMixin, TransactionTestCase):
+    pass
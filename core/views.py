@@ -1,12 +1,20 @@
 from authentication.models import User
 from authentication.permissions import IsPatient, IsTherapist
+from authentication.services.activity import ActivityService
+from authentication.services.principal import PrincipalService
 from authentication.serializers import PaginatedPatientResponseSerializer, HttpPatientReadResponseSerializer, HttpTherapistListResponseSerializer, HttpTherapistReadResponseSerializer, PatientHttpListResposneSerializer, PatientReadSerializer, PatientRetrieveSerializer
 from core.enums import QuerysetBranching, UserRole
+from core.db.search import USER_SEARCH_FIELDS, trigram_search
 from core.models import KFUPMDepartment
 from core.querysets import PatientOwnedQS, QSWrapper
-from core.serializers import HttpCounterSerializer, HttpErrorResponseSerializer, HttpKFUPMDepartmentListResponseSerializer, HttpKFUPMDepartmentRetrieveResponseSerializer,  KFUPMDepartmentSerializer
+from core.serializers import EndpointQueryStatsSerializer, HttpCounterSerializer, HttpEndpointQueryStatsListResponseSerializer, HttpErrorResponseSerializer, HttpKFUPMDepartmentListResponseSerializer, HttpKFUPMDepartmentRetrieveResponseSerializer, HttpStudentImportResponseSerializer,  KFUPMDepartmentSerializer, SearchQuerySerializer, StudentImportUploadSerializer
+from core.utils.query_stats import QueryStatsRegistry
+from core.utils.student_import import detect_format, import_students, parse_students
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from rest_framework.parsers import MultiPartParser
 from core.viewssets import AugmentedViewSet
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -17,6 +25,19 @@ from rest_framework.decorators import action
 from django.utils import timezone
 from datetime import timedelta
 from dateutil.relativedelta import relativedelta
+
+
+def search_users(viewset: AugmentedViewSet, request):
+    """paginated trigram search of the users listed by a viewset"""
+
+    serializer = SearchQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+
+    queryset = trigram_search(viewset.filter_queryset(viewset.get_queryset()), USER_SEARCH_FIELDS, serializer.validated_data['q'])
+    page = viewset.paginate_queryset(queryset)
+    return viewset.get_paginated_response(viewset.get_serializer(page, many=True).data)
+
+
 class KFUPMDeptViewset(AugmentedViewSet, ListModelMixin):
     """Viewset for KFUPMDept"""
 
@@ -48,7 +69,9 @@ class PatientViewSet(AugmentedViewSet, ListModelMixin, RetrieveModelMixin):
         'list': [IsTherapist()],
         "retrieve": [IsTherapist()],
         'count': [IsTherapist()],
-        'active_count': [IsTherapist()]
+        'active_count': [IsTherapist()],
+        'search': [IsTherapist()],
+        'import_students': [IsAdminUser]
     }
 
     filterset_fields = {
@@ -73,14 +96,25 @@ class PatientViewSet(AugmentedViewSet, ListModelMixin, RetrieveModelMixin):
             Fetch a single user profile by either the owner patien or any active therapist
         """
 
-        if request.user.groups.filter(name=UserRole.THERAPIST.value).exists():
+        user_groups = PrincipalService.for_request(request).groups
+
+        if UserRole.THERAPIST.value in user_groups:
             return super().retrieve(request, *args, **kwargs)
-        elif request.user.groups.filter(name=UserRole.PATIENT.value).exists():
+        elif UserRole.PATIENT.value in user_groups:
             self.queryset = self.queryset.filter(id=request.user.id)
             return super().retrieve(request, *args, **kwargs)
         else:
             return Response(status=status.HTTP_403_FORBIDDEN, data= {"message": _("You do not have permission to perform this action")})
 
+    @swagger_auto_schema(query_serializer=SearchQuerySerializer, responses={status.HTTP_200_OK: PatientHttpListResposneSerializer()})
+    @action(detail=False, methods=['get'])
+    def search(self, request, *args, **kwargs):
+        """
+            Search the patients by username, email, first or last name, listing the most similar matches first
+        """
+
+        return search_users(self, request)
+
     @swagger_auto_schema(responses={status.HTTP_200_OK: HttpCounterSerializer()})
     @action(detail=False, methods=['get'])
     def count(self, request, *args, **kwargs):
@@ -93,6 +127,29 @@ class PatientViewSet(AugmentedViewSet, ListModelMixin, RetrieveModelMixin):
         last_month_count = self.filter_queryset(self.get_queryset().filter(created_at__lte=last_month_end_timestamp)).count()
 
         return Response(data={"current_count": current_count, "last_month_count": last_month_count})
+
+    @swagger_auto_schema(request_body=StudentImportUploadSerializer, responses={status.HTTP_201_CREATED: HttpStudentImportResponseSerializer(), status.HTTP_400_BAD_REQUEST: HttpErrorResponseSerializer()})
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def import_students(self, request, *args, **kwargs):
+        """
+            Import the KFUPM students of a CSV or JSONL file (email, username, department, optional password) as patients
+
+            **@validation**:
+                - the already registered emails, and the repeated emails of the file, are skipped
+                - the rows with missing fields or unknown department short names are reported as errors
+        """
+
+        serializer = StudentImportUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = serializer.validated_data['file']
+
+        rows, errors = parse_students(upload.read().decode('utf-8-sig'), serializer.validated_data.get('format') or detect_format(upload.name))
+        # the passwords are hashed by threads of the import (PBKDF2 releases the GIL), leaving the login hashing pool to the logins
+        with ThreadPoolExecutor(max_workers=settings.STUDENT_IMPORT_WORKERS, thread_name_prefix='student-import') as executor:
+            result = import_students(rows, executor=executor, default_password=serializer.validated_data.get('default_password'))
+        result.errors = errors + result.errors
+
+        return Response(data=result.model_dump(), status=status.HTTP_201_CREATED)
     
     @swagger_auto_schema(responses={status.HTTP_200_OK: HttpCounterSerializer()})
     @action(detail=False, methods=['get'])
@@ -101,6 +158,9 @@ class PatientViewSet(AugmentedViewSet, ListModelMixin, RetrieveModelMixin):
             Get the count of active patients
         """
 
+        # writing the buffered activity first, so the users seen since the last flush are counted
+        ActivityService.flush(include_current=True)
+
         current_month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         last_month_start = current_month_start - relativedelta(months=1)
         
@@ -115,7 +175,8 @@ class TherapistViewSet(AugmentedViewSet, ListModelMixin, RetrieveModelMixin):
 
     action_permissions = {
         'list': [IsTherapist() | IsPatient()],
-        "retrieve": [IsTherapist() | IsPatient()]
+        "retrieve": [IsTherapist() | IsPatient()],
+        'search': [IsTherapist() | IsPatient()]
     }
 
     queryset= User.objects.filter(therapist_profile__isnull=False).select_related('therapist_profile__department')
@@ -133,3 +194,41 @@ class TherapistViewSet(AugmentedViewSet, ListModelMixin, RetrieveModelMixin):
         """
         return super().retrieve(request, *args, **kwargs)
 
+    @swagger_auto_schema(query_serializer=SearchQuerySerializer, responses={status.HTTP_200_OK: HttpTherapistListResponseSerializer()})
+    @action(detail=False, methods=['get'])
+    def search(self, request, *args, **kwargs):
+        """
+            Search the therapists by username, email, first or last name, listing the most similar matches first
+        """
+
+        return search_users(self, request)
+
+
+class QueryStatsViewset(AugmentedViewSet):
+    """
+        Admin-only viewset exposing the SQL query stats recorded per (viewset, action) endpoint
+        by the serving worker process
+    """
+
+    action_permissions = {
+        'list': [IsAdminUser],
+        'reset': [IsAdminUser]
+    }
+
+    @swagger_auto_schema(responses={status.HTTP_200_OK: HttpEndpointQueryStatsListResponseSerializer()})
+    def list(self, request, *args, **kwargs):
+        """
+            List the recorded query stats of all endpoints, sorted by the highest average query count
+        """
+
+        return Response(data=EndpointQueryStatsSerializer(QueryStatsRegistry.snapshot(), many=True).data)
+
+    @swagger_auto_schema(responses={status.HTTP_204_NO_CONTENT: None})
+    @action(detail=False, methods=['post'])
+    def reset(self, request, *args, **kwargs):
+        """
+            Discard all the recorded query stats
+        """
+
+        QueryStatsRegistry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
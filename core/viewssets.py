@@ -1,20 +1,243 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import datetime
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 from rest_framework import viewsets
+from rest_framework.compat import coreapi, coreschema
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from authentication.mixins import ActionBasedPermMixin
 
-from core.mixins import QuerysetMapperMixin, SerializerMapperMixin
+from core.db.counting import EXACT_COUNT, CountStrategy
+from core.mixins import QuerysetMapperMixin, QueryStatsMixin, SerializerMapperMixin
 from core.renderer import FormattedJSONRenderrer
 from rest_framework.pagination import PageNumberPagination
 
 
+class EstimatedCountPage(Page):
+    """page of an estimated count paginator, knowing whether a next page exists from the fetched rows rather than the count"""
+
+    def __init__(self, object_list, number, paginator, has_next: bool):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+
+class CountStrategyPaginator(Paginator):
+    """
+    Django paginator counting its queryset through a CountStrategy. When the count is approximate,
+    the page numbers are not bounded by the estimated page count and the pages are never truncated by it
+    """
+
+    def __init__(self, object_list, per_page, count_strategy: CountStrategy = EXACT_COUNT, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.count_strategy = count_strategy
+        self.approximate = False
+
+    @cached_property
+    def count(self):
+        if not hasattr(self.object_list, 'query'):
+            return super().count
+
+        count, self.approximate = self.count_strategy.count(self.object_list)
+        return count
+
+    def validate_number(self, number):
+        # resolving the count tells whether it is an estimate
+        if self.count is not None and not self.approximate:
+            return super().validate_number(number)
+
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise InvalidPage(_("That page number is not an integer"))
+        if number < 1:
+            raise InvalidPage(_("That page number is less than 1"))
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.approximate:
+            return super().page(number)
+
+        # one extra row is fetched to know whether a next page exists
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        return EstimatedCountPage(rows[:self.per_page], number, self, has_next=len(rows) > self.per_page)
+
+
 class CustomPagination(PageNumberPagination):
-    """Custom DRF pagination class t oactivate page size query param"""
+    """
+    Custom DRF pagination class t oactivate page size query param
+
+    NOTE: the paginated querysets are counted through the count_strategy attribute of the viewset
+    (exact by default), and the response flags whether the count is approximate (a planner estimate or a cached count)
+    """
     page_size = 10
     page_size_query_param = 'page_size'
     page_query_param = 'page'
     max_page_size = 100
 
-class AugmentedViewSet(SerializerMapperMixin, ActionBasedPermMixin, QuerysetMapperMixin, viewsets.GenericViewSet):
-    """utility viewset tha combins serializer, queryset mapping. and action-based permission mixins"""
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_strategy = getattr(view, 'count_strategy', None) or EXACT_COUNT
+        return super().paginate_queryset(queryset, request, view)
+
+    def django_paginator_class(self, queryset, page_size):
+        return CountStrategyPaginator(queryset, page_size, count_strategy=self.count_strategy)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('approximate', self.page.paginator.approximate),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['approximate'] = {'type': 'boolean', 'example': False}
+        return response_schema
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination over the (created_at, id) columns of time-ordered querysets,
+    which avoids the OFFSET scans of deep pages and skips the COUNT query (the count is always null)
+
+    NOTE: the pages keep the requested direction of the created_at ordering (descending by default)
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    keyset_fields = ('created_at', 'id')
+    invalid_cursor_message = _('Invalid cursor')
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def encode_cursor(self, row, reverse: bool) -> str:
+        time_field, id_field = self.keyset_fields
+        position = {'t': getattr(row, time_field).isoformat(), 'i': getattr(row, id_field), 'r': reverse}
+
+        return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+    def decode_cursor(self, request):
+        """decode the cursor of the request into a (created_at, id, reverse) position, or None for the first page"""
+
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            return datetime.fromisoformat(position['t']), int(position['i']), bool(position['r'])
+        except (binascii.Error, TypeError, KeyError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def _is_ascending(self, queryset) -> bool:
+        ordering = queryset.query.order_by
+        return bool(ordering) and ordering[0] == self.keyset_fields[0]
+
+    def paginate_queryset(self, queryset, request, view=None):
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor[2]
+
+        # walking to a previous page scans in the opposite direction, and the rows are flipped back afterwards
+        scan_ascending = self._is_ascending(queryset) != reverse
+        time_field, id_field = self.keyset_fields
+        direction = '' if scan_ascending else '-'
+        queryset = queryset.order_by(f'{direction}{time_field}', f'{direction}{id_field}')
+
+        if cursor is not None:
+            lookup = 'gt' if scan_ascending else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'{time_field}__{lookup}': cursor[0]}) | Q(**{time_field: cursor[0], f'{id_field}__{lookup}': cursor[1]})
+            )
+
+        # fetching an extra row tells whether more rows follow without counting them
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+
+        if reverse:
+            rows.reverse()
+
+        self.next_cursor = self.previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                self.next_cursor = self.encode_cursor(rows[-1], reverse=False)
+            if (has_more and reverse) or (cursor is not None and not reverse):
+                self.previous_cursor = self.encode_cursor(rows[0], reverse=True)
+
+        return rows
+
+    def _get_link(self, cursor):
+        if cursor is None:
+            return None
+
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_next_link(self):
+        return self._get_link(self.next_cursor)
+
+    def get_previous_link(self):
+        return self._get_link(self.previous_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer', 'nullable': True, 'example': None},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_fields(self, view):
+        assert coreapi is not None, 'coreapi must be installed to use `get_schema_fields()`'
+        assert coreschema is not None, 'coreschema must be installed to use `get_schema_fields()`'
+
+        return [
+            coreapi.Field(name=self.cursor_query_param, required=False, location='query', schema=coreschema.String(title='Cursor', description='The pagination cursor value.')),
+            coreapi.Field(name=self.page_size_query_param, required=False, location='query', schema=coreschema.Integer(title='Page size', description='Number of results to return per page.')),
+        ]
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {'name': self.cursor_query_param, 'required': False, 'in': 'query', 'description': 'The pagination cursor value.', 'schema': {'type': 'string'}},
+            {'name': self.page_size_query_param, 'required': False, 'in': 'query', 'description': 'Number of results to return per page.', 'schema': {'type': 'integer'}},
+        ]
+
+
+class AugmentedViewSet(QueryStatsMixin, SerializerMapperMixin, ActionBasedPermMixin, QuerysetMapperMixin, viewsets.GenericViewSet):
+    """utility viewset tha combins serializer, queryset mapping. and action-based permission mixins (with per-endpoint query stats)"""
     renderer_classes = [FormattedJSONRenderrer]
     filterset_fields = None
     pagination_class = CustomPagination
\ No newline at end of file
@@ -18,9 +18,11 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jusoor_backend.settings')
 
 django_asgi_app = get_asgi_application()
 from authentication.middleware import JWTAuthMiddlewareStack
+from chat.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter({
     "http": django_asgi_app,
-    
-    # Just HTTP for now. (We can add other protocols later.)
+    "websocket": AllowedHostsOriginValidator(
+        JWTAuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+    ),
 })
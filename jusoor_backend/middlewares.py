@@ -1,16 +1,44 @@
-from django.utils import timezone
-from django.core.cache import cache
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from authentication.services.activity import ActivityService
+from core.utils.query_stats import QUERY_STATS_ENDPOINT_ATTR, QueryRecorder, QueryStatsRegistry
 
 
 def update_last_visited(get_response):
-
+    """
+        record the last activity of the authenticated users in the activity buffer,
+        which is written to the DB periodically by the flush_user_activity task
+    """
 
     def middleware(request):
         response = get_response(request)
-        if request.user.is_authenticated and cache.get(f'last_seen_{request.user.id}', default=None) == None:
-                request.user.last_activity = timezone.now()
-                request.user.save()
-                cache.set(f'last_seen_{request.user.id}', timezone.now())
+        if request.user.is_authenticated:
+            ActivityService.record(request.user.pk)
+        return response
+
+    return middleware
+
+
+def record_query_stats(get_response):
+    """
+        record the query count, SQL time and duplicated queries of every request served
+        by an AugmentedViewSet endpoint (labeled by the viewset itself)
+    """
+
+    if not settings.QUERY_STATS_ENABLED:
+        raise MiddlewareNotUsed()
+
+    def middleware(request):
+        recorder = QueryRecorder()
+
+        with connection.execute_wrapper(recorder):
+            response = get_response(request)
+
+        endpoint = getattr(request, QUERY_STATS_ENDPOINT_ATTR, None)
+        if endpoint is not None:
+            QueryStatsRegistry.record(endpoint, recorder)
+
         return response
 
-    return middleware
\ No newline at end of file
+    return middleware
@@ -14,6 +14,7 @@ import os
 from pathlib import Path
 from datetime import timedelta
 import environ
+from django.core.exceptions import ImproperlyConfigured
 
 
 env = environ.Env(DEBUG=(bool, False))
@@ -94,6 +95,11 @@ INSTALLED_APPS = [
 
 ASGI_APPLICATION = "jusoor_backend.asgi.application"
 
+# seconds during which the user of a WebSocket access token is reused by the handshakes of the same token
+WS_AUTH_USER_CACHE_TIMEOUT = env.int('WS_AUTH_USER_CACHE_TIMEOUT', default=60)
+# maximum number of users cached for the WebSocket handshakes of a process
+WS_AUTH_USER_CACHE_SIZE = env.int('WS_AUTH_USER_CACHE_SIZE', default=10000)
+
 # cross-consumer channel layer configuration (Redis is more recommended for production)
 # CHANNEL_LAYERS = {
 #     "default": {
@@ -106,7 +112,7 @@ ASGI_APPLICATION = "jusoor_backend.asgi.application"
 
 REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    "DEFAULT_AUTHENTICATION_CLASSES": ("rest_framework_simplejwt.authentication.JWTAuthentication",),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("authentication.backends.ClaimsJWTAuthentication",),
     "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.IsAuthenticated"],
     "DEFAULT_FILTER_BACKENDS": ["django_filters.rest_framework.DjangoFilterBackend", 'rest_framework.filters.OrderingFilter'],
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
@@ -114,6 +120,9 @@ REST_FRAMEWORK = {
     'EXCEPTION_HANDLER': 'core.http.formatted_error_handler'
 }
 
+# key of the AES256 encryption of the encrypted model fields
+ENCRYPTION_KEY = env('ENCRYPTION_KEY')
+
 SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
     "ACCESS_TOKEN_LIFETIME": timedelta(days=24),
@@ -125,6 +134,31 @@ SIMPLE_JWT = {
     "ALGORITHM": "HS256",
 }
 
+# number of last messages of every user kept in the cached chat history window, and the window expiry in seconds
+CHAT_HISTORY_WINDOW_SIZE = env.int('CHAT_HISTORY_WINDOW_SIZE', default=50)
+CHAT_HISTORY_CACHE_TIMEOUT = env.int('CHAT_HISTORY_CACHE_TIMEOUT', default=60 * 60)
+# seconds after which the chatbot answers without the history or the reference conversations still being loaded
+CHAT_HISTORY_STAGE_TIMEOUT = env.float('CHAT_HISTORY_STAGE_TIMEOUT', default=2.0)
+CHAT_RETRIEVAL_STAGE_TIMEOUT = env.float('CHAT_RETRIEVAL_STAGE_TIMEOUT', default=5.0)
+# number of cached reference searches per cache tier (per process), and their expiry in seconds
+REFERENCE_CACHE_SIZE = env.int('REFERENCE_CACHE_SIZE', default=2048)
+REFERENCE_CACHE_TIMEOUT = env.int('REFERENCE_CACHE_TIMEOUT', default=6 * 60 * 60)
+# minimum cosine similarity of the embeddings of two messages sharing their cached references
+REFERENCE_CACHE_SIMILARITY = 0.97
+# seconds after which every process checks whether the guardrail rules were updated in the DB
+GUARDRAIL_SYNC_INTERVAL = env.int('GUARDRAIL_SYNC_INTERVAL', default=5)
+
+# seconds after which every process loads the new blacklisted refresh tokens, even without a version change
+TOKEN_BLACKLIST_SYNC_INTERVAL = env.int('TOKEN_BLACKLIST_SYNC_INTERVAL', default=30)
+# number of the last blacklisted rows reloaded by every sync, covering the rows committed out of id order by concurrent logouts
+TOKEN_BLACKLIST_SYNC_OVERLAP = env.int('TOKEN_BLACKLIST_SYNC_OVERLAP', default=1000)
+# expected number of blacklisted refresh tokens (within the refresh token lifetime), and the target false positive rate of their filter
+TOKEN_BLACKLIST_FILTER_CAPACITY = env.int('TOKEN_BLACKLIST_FILTER_CAPACITY', default=100000)
+TOKEN_BLACKLIST_FILTER_ERROR_RATE = 0.001
+# number of expired outstanding tokens deleted by every pruning statement, and the pruning period in seconds
+TOKEN_BLACKLIST_PRUNE_BATCH_SIZE = 5000
+TOKEN_BLACKLIST_PRUNE_INTERVAL = env.int('TOKEN_BLACKLIST_PRUNE_INTERVAL', default=60 * 60)
+
 SWAGGER_SETTINGS = {
     "SECURITY_DEFINITIONS": {
         "Basic": {"type": "basic"},
@@ -150,14 +184,32 @@ AWS_S3_SIGNATURE_NAME = 's3v4'
 AWS_S3_SIGNATURE_VERSION = 's3v4'
 
 
+# the role claims and token blacklist versions are invalidated through the fast cache, which must then be shared by
+# all the processes: its process memory fallback is only allowed outside production (single process dev/test servers)
+if not env('REDIS_URL', default=None) and env('CONTEXT', default=None) == 'prod':
+    raise ImproperlyConfigured('REDIS_URL is required in production, the role claims and token blacklist invalidations would only apply to the process running them')
+
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.db.DatabaseCache",
         "LOCATION": "django-cache",
         "TIMEOUT": 450,
-    }
+    },
+    # low-latency cache used on hot request paths (shared Redis instance when available, process memory otherwise outside production)
+    "fast": {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache" if env('REDIS_URL', default=None) else "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": env('REDIS_URL', default=None) or "jusoor-fast-cache",
+        "TIMEOUT": 300,
+    },
 }
 
+FAST_CACHE_ALIAS = "fast"
+
+# estimated row count above which the large paginated lists report planner estimates instead of exact counts
+PAGINATION_EXACT_COUNT_THRESHOLD = env.int('PAGINATION_EXACT_COUNT_THRESHOLD', default=10000)
+# seconds during which the count of a paginated list is reused for the same filters
+PAGINATION_COUNT_CACHE_TIMEOUT = env.int('PAGINATION_COUNT_CACHE_TIMEOUT', default=30)
+
 
 
 MIDDLEWARE = [
@@ -170,8 +222,14 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     "jusoor_backend.middlewares.update_last_visited",
+    "jusoor_backend.middlewares.record_query_stats",
 ]
 
+# per-endpoint SQL query stats, exposed to admins through the query-stats endpoint
+QUERY_STATS_ENABLED = env.bool('QUERY_STATS_ENABLED', default=DEBUG)
+# checked-in maximum query count of each endpoint, enforced within the tests
+QUERY_BUDGET_FILE = BASE_DIR / 'query_budgets.json'
+
 ROOT_URLCONF = 'jusoor_backend.urls'
 
 TEMPLATES = [
@@ -214,6 +272,11 @@ DATABASES = {
     }
 }
 
+# maximum number of passwords hashed at once by a process (login and signup bursts queue beyond it)
+PASSWORD_HASH_WORKERS = env.int('PASSWORD_HASH_WORKERS', default=os.cpu_count() or 1)
+# number of threads hashing the passwords of a student import uploaded through the API (separate from the login pool)
+STUDENT_IMPORT_WORKERS = env.int('STUDENT_IMPORT_WORKERS', default=2)
+
 AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
     'authentication.backends.EmailAuthBackend',
@@ -268,6 +331,24 @@ CELERY_BROKER_URL = env('REDIS_URL', default=None)
 # celery setting.
 CELERY_CACHE_BACKEND = 'default'
 
+# seconds during which the repeated requests of a user are not recorded again in the activity buffer
+ACTIVITY_RESOLUTION = env.int('ACTIVITY_RESOLUTION', default=300)
+# seconds covered by every bucket of the activity buffer, which is also the flushing period
+ACTIVITY_FLUSH_INTERVAL = env.int('ACTIVITY_FLUSH_INTERVAL', default=60)
+# number of buckets kept in the cache, covering the missed flushes (e.g. while the beat scheduler is down)
+ACTIVITY_BUCKET_RETENTION = 60
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-user-activity': {
+        'task': 'authentication.tasks.flush_user_activity',
+        'schedule': ACTIVITY_FLUSH_INTERVAL,
+    },
+    'prune-token-blacklist': {
+        'task': 'authentication.tasks.prune_token_blacklist',
+        'schedule': TOKEN_BLACKLIST_PRUNE_INTERVAL,
+    },
+}
+
 
 # sendgrid configurations
 
@@ -0,0 +1,25 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # the partial indexes are built concurrently to avoid locking the live tables
+    atomic = False
+
+    dependencies = [
+        ('sentiment_ai', '0010_alter_reportsentimentmessage_message'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='sentimentreport',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['patient', 'created_at'], name='sent_report_patient_live_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='reportsentimentmessage',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['report'], name='report_msg_report_live_idx'),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:00
+
+import core.db.fields
+from django.db import migrations
+
+# number of rows read and rewritten at once
+BATCH_SIZE = 1000
+
+
+def _rewrite_highlights(schema_editor, transform):
+    """rewrite the raw conversation_highlights column of every report, bypassing the field conversions"""
+
+    connection = schema_editor.connection
+    qn = connection.ops.quote_name
+    table, column = qn('sentiment_ai_sentimentreport'), qn('conversation_highlights')
+
+    last_id = 0
+    with connection.cursor() as cursor:
+        # the rows are read in keyset batches, so that only one batch is held in memory at once
+        while True:
+            cursor.execute(
+                f'SELECT id, {column} FROM {table} WHERE {column} IS NOT NULL AND id > %s ORDER BY id LIMIT %s',
+                [last_id, BATCH_SIZE]
+            )
+            batch = cursor.fetchall()
+            if not batch:
+                break
+
+            values = transform([value for _, value in batch])
+            cursor.executemany(f'UPDATE {table} SET {column} = %s WHERE id = %s', [(value, pk) for (pk, _), value in zip(batch, values)])
+            last_id = batch[-1][0]
+
+
+def encrypt_highlights(apps, schema_editor):
+    from authentication.services.encryption import get_encryption_service
+    service = get_encryption_service()
+    _rewrite_highlights(schema_editor, lambda values: [service.encrypt(value) for value in values])
+
+
+def decrypt_highlights(apps, schema_editor):
+    from authentication.services.encryption import get_encryption_service
+    _rewrite_highlights(schema_editor, get_encryption_service().decrypt_many)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sentiment_ai', '0011_sentimentreport_live_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='sentimentreport',
+            name='conversation_highlights',
+            field=core.db.fields.EncryptedTextField(),
+        ),
+        migrations.RunPython(encrypt_highlights, decrypt_highlights),
+    ]
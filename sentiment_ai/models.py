@@ -5,8 +5,9 @@ from django.core.validators import MaxValueValidator, MinValueValidator
 from authentication.models import User
 from chat.enums import PENDING
 from chat.models import ChatMessage
-from core.db.fields import ZeroToOneDecimalField
+from core.db.fields import EncryptedTextField, ZeroToOneDecimalField
 from core.mock import UserMock
+from core.db.indexes import live_index
 from core.models import StudentPatient, TimeStampedModel
 from django.utils import timezone
 from django.db.models import Avg, Sum
@@ -23,7 +24,7 @@ class SentimentReport(TimeStampedModel):
     """
 
     patient = models.ForeignKey(StudentPatient, on_delete=models.CASCADE, related_name='sentiment_reports')
-    conversation_highlights = models.TextField()
+    conversation_highlights = EncryptedTextField()
     recommendations = models.TextField()
     sentiment_score = ZeroToOneDecimalField()
     status = models.CharField(max_length=20, default=PENDING, choices= REPORT_STATUSES)
@@ -36,6 +37,13 @@ class SentimentReport(TimeStampedModel):
     bipolar_score = ZeroToOneDecimalField()
     ocd_score = ZeroToOneDecimalField()
 
+    SOFT_DELETE_CASCADE = ('sentiment_messages',)
+
+    class Meta:
+        indexes = [
+            live_index(['patient', 'created_at'], name='sent_report_patient_live_idx'),
+        ]
+
     @staticmethod
     def calculate_batch_message_sentiment(latest_messages: List[ChatMessage]):
 
@@ -85,14 +93,14 @@ class SentimentReport(TimeStampedModel):
 
         last_report = SentimentReport.objects.filter(patient=user.patient_profile).order_by('created_at').last()
 
+        # take last 2 messages in chat history
+        chat_history = list(ChatMessage.get_chat_history(user, history_len=max_scope))
+
         if last_report:
             starting_message = ChatMessage.objects.filter(sender=user, created_at__gt=last_report.report_ending_message.created_at).order_by('created_at').last()
         else:
-            messages_count = ChatMessage.objects.filter(Q(sender=user) | Q(receiver=user)).count()
-            starting_message = ChatMessage.objects.filter(Q(sender=user) | Q(receiver=user)).order_by('created_at')[max(0, messages_count - max_scope):].first()
-
-        # take last 2 messages in chat history
-        chat_history = list(ChatMessage.get_chat_history(user, history_len=max_scope))
+            # the first message of the last max_scope messages
+            starting_message = chat_history[0] if chat_history else None
         # filter the messages that are after the last report from the last n messages
         
         if starting_message:
@@ -125,6 +133,13 @@ class MessageSentiment(TimeStampedModel):
     bipolar = ZeroToOneDecimalField()
     ocd = ZeroToOneDecimalField()
 
+    SOFT_DELETE_CASCADE = ('sentiment_report',)
+
+    class Meta:
+        indexes = [
+            # the (created_at, id) order of the keyset pagination, scanned in both directions
+            live_index(['created_at', 'id'], name='msg_sentiment_keyset_live_idx'),
+        ]
     
 
 
@@ -134,6 +149,11 @@ class ReportSentimentMessage(TimeStampedModel):
     report = models.ForeignKey(SentimentReport, on_delete=models.CASCADE, related_name='sentiment_messages')
     message = models.ForeignKey(MessageSentiment, on_delete=models.CASCADE, related_name='sentiment_report')
 
+    class Meta:
+        indexes = [
+            live_index(['report'], name='report_msg_report_live_idx'),
+        ]
+
 class StudentPatientSentimentPosture(models.Model):
     patient = models.ForeignKey(StudentPatient, on_delete=models.PROTECT, related_name='sentiment_postures')
     date = models.DateField(null=False, blank=False)
@@ -27,6 +27,9 @@ class SentimentReportMiniReadSerializer(serializers.ModelSerializer):
     patient = serializers.SerializerMethodField()
 
     def get_messages_covered(self, obj: SentimentReport):
+        # the list queryset annotates the count, sparing a count query per report
+        if hasattr(obj, 'messages_covered_count'):
+            return obj.messages_covered_count
         return int(ReportSentimentMessage.objects.filter(report=obj).count())
     
     @swagger_serializer_method(serializer_or_field=PatientMiniReadSerializer)
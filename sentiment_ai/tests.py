@@ -0,0 +1,65 @@
+from django.test import TestCase, tag
+from rest_framework.test import APIRequestFactory
+from core.db.fields import Ciphertext, bulk_decrypt
+from core.mock import TherapistMock
+from core.utils.query_stats import assert_query_budget
+from core.utils.testing import auth_request
+from sentiment_ai.mock import SentimentReportMocker
+from sentiment_ai.models import SentimentReport
+from sentiment_ai.views import SentimentReportViewset
+
+
+@tag('sentiment-query-budgets')
+class SentimentQueryBudgetTestCase(TestCase):
+
+    @tag('query-budget-sentiment-reports')
+    def test_sentiment_reports_list_budget(self):
+
+        therapist = TherapistMock.mock_instances(n=1)[0]
+        SentimentReportMocker.mock_instances(n=10, n_messages=4)
+        request = auth_request(APIRequestFactory().get, 'sentiment-reports/', user=therapist.user)
+
+        with assert_query_budget(self, 'SentimentReportViewset.list'):
+            response = SentimentReportViewset.as_view({'get': 'list'})(request)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertTrue(all(report['messages_covered'] == 2 for report in response.data['results']))
+
+
+@tag('encrypted-field')
+class EncryptedTextFieldTestCase(TestCase):
+
+    def setUp(self):
+        self.reports = SentimentReportMocker.mock_instances(n=3, n_messages=1)
+
+    def test_stored_encrypted(self):
+
+        report = self.reports[0]
+        stored = SentimentReport.objects.filter(pk=report.pk).values_list('conversation_highlights', flat=True).get()
+
+        self.assertIsInstance(stored, Ciphertext)
+        self.assertNotEqual(stored, report.conversation_highlights)
+
+    def test_lazy_decryption(self):
+
+        report = SentimentReport.objects.get(pk=self.reports[0].pk)
+        self.assertIsInstance(report.__dict__['conversation_highlights'], Ciphertext)
+
+        self.assertEqual(report.conversation_highlights, self.reports[0].conversation_highlights)
+        self.assertNotIsInstance(report.__dict__['conversation_highlights'], Ciphertext)
+
+        # saving a loaded report must not encrypt its ciphertext again
+        untouched = SentimentReport.objects.get(pk=self.reports[1].pk)
+        untouched.save()
+        self.assertEqual(SentimentReport.objects.get(pk=untouched.pk).conversation_highlights, self.reports[1].conversation_highlights)
+
+    def test_bulk_decrypt(self):
+
+        expected = {report.pk: report.conversation_highlights for report in self.reports}
+        reports = bulk_decrypt(SentimentReport.objects.filter(pk__in=expected))
+
+        self.assertEqual(len(reports), len(expected))
+        for report in reports:
+            self.assertNotIsInstance(report.__dict__['conversation_highlights'], Ciphertext)
+            self.assertEqual(report.conversation_highlights, expected[report.pk])
@@ -2,11 +2,13 @@ from rest_framework.decorators import action
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from authentication.permissions import IsPatient, IsTherapist
-from chat.agents import ChatGPTAgent
+from chat.agents import get_vector_store
 from core.enums import QuerysetBranching, UserRole
 from core.querysets import PatientOwnedQS, QSWrapper
 from core.serializers import HttpSuccessResponseSerializer
-from core.viewssets import AugmentedViewSet
+from core.renderer import FastJSONRenderer
+from core.viewssets import AugmentedViewSet, KeysetPagination
+from django.db.models import Count, Q
 from django.utils.translation import gettext_lazy as _
 from rest_framework.mixins import ListModelMixin, RetrieveModelMixin, CreateModelMixin
 from rest_framework.response import Response
@@ -19,7 +21,7 @@ from sentiment_ai.serializers import MessageSentimentListHttpSerializer, Message
 class SentimentReportViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin, CreateModelMixin):
     
 
-    
+    renderer_classes = [FastJSONRenderer]
     action_permissions = {
         'list': [IsTherapist()],
         'retrieve': [IsTherapist()],
@@ -43,7 +45,8 @@ class SentimentReportViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixi
     ordering_fields = ['created_at', 'sentiment_score']
 
     queryset_by_action = {
-        'list': QSWrapper(SentimentReport.objects.all().select_related('patient__user', 'patient__department')).branch(
+        'list': QSWrapper(SentimentReport.objects.all().select_related('patient__user', 'patient__department')
+                            .annotate(messages_covered_count=Count('sentiment_messages', filter=Q(sentiment_messages__deleted_at__isnull=True)))).branch(
             {
                 UserRole.PATIENT.value: PatientOwnedQS()
             }, by= QuerysetBranching.USER_GROUP,
@@ -79,6 +82,8 @@ class SentimentReportViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixi
 
 class MessageSentimentViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMixin):
     
+    renderer_classes = [FastJSONRenderer]
+    pagination_class = KeysetPagination
     action_permissions = {
         'list': [IsPatient() | IsTherapist()],
         'retrieve': [IsPatient() | IsTherapist()],
@@ -138,7 +143,7 @@ class MessageSentimentViewset(AugmentedViewSet, ListModelMixin, RetrieveModelMix
 
         mental_disorders = MentalDisorderDetector().predict(data)
 
-        relevant_message = ChatGPTAgent().get_relevant_docs(data)[0]
+        relevant_message = get_vector_store().similarity_search(data, k=1)[0]
 
         return Response({
             'emotion': emotion.model_dump(),
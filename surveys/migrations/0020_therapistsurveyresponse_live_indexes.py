@@ -0,0 +1,21 @@
+# Generated by Django 5.0.3 on 2026-10-18 10:00
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # the partial indexes are built concurrently to avoid locking the live tables
+    atomic = False
+
+    dependencies = [
+        ('surveys', '0019_alter_therapistsurveyresponse_status'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='therapistsurveyresponse',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['patient', 'survey'], name='survey_resp_patient_live_idx'),
+        ),
+    ]
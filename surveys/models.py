@@ -1,6 +1,7 @@
 
 from django.db import models
 
+from core.db.indexes import live_index
 from core.models import StudentPatient, Therapist, TimeStampedModel
 from surveys.enums import PENDING, SURVEY_QUESTION_TYPES, SURVEY_RESPONSE_STATUSES
 from rest_framework.exceptions import ValidationError
@@ -90,10 +91,17 @@ class TherapistSurveyResponse(TimeStampedModel):
     patient = models.ForeignKey(StudentPatient, null=False, on_delete=models.CASCADE, related_name='survey_response_patients')
     status = models.CharField(choices=SURVEY_RESPONSE_STATUSES.items(), max_length=255, default=PENDING)
 
+    SOFT_DELETE_CASCADE = ('response_answers',)
+
     
     
     def __str__(self):
         return f'Survey resposne group identiifer #{self.survey} for {self.patient}'
+
+    class Meta:
+        indexes = [
+            live_index(['patient', 'survey'], name='survey_resp_patient_live_idx'),
+        ]
     
 
 class TherapistSurveyQuestionResponse(TimeStampedModel):